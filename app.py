@@ -1,10 +1,13 @@
-from flask import Flask
+from flask import Flask, request, g
 from flask_cors import CORS
 from config.config import Config
+from services.metrics import begin_request, close_request, end_request
 from routes.image_routes import image_bp
 from routes.workflow_routes import workflow_bp
 from routes.health_routes import health_bp
+from routes.job_routes import job_bp
 import logging
+import time
 
 def create_app():
     app = Flask(__name__)
@@ -19,10 +22,42 @@ def create_app():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
+    # Per-request stage timings, reported in Server-Timing and /health/metrics
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_reset = begin_request()
+        g.metrics_in_flight = True
+    
+    @app.after_request
+    def finish_request_metrics(response):
+        reset = g.pop('metrics_reset', None)
+        if reset is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            response.headers['Server-Timing'] = end_request(
+                reset, request.method, endpoint, response.status_code,
+                time.perf_counter() - g.metrics_started
+            )
+        if response.is_streamed and g.pop('metrics_in_flight', False):
+            # Streamed bodies are generated after this hook and the teardown
+            response.call_on_close(close_request)
+        return response
+    
+    @app.teardown_request
+    def close_request_metrics(error):
+        # Also runs when an exception skipped finish_request_metrics
+        reset = g.pop('metrics_reset', None)
+        if reset is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            end_request(reset, request.method, endpoint, 500, time.perf_counter() - g.metrics_started)
+        if g.pop('metrics_in_flight', False):
+            close_request()
+    
     # Register blueprints
     app.register_blueprint(image_bp, url_prefix='/api/v1/images')
     app.register_blueprint(workflow_bp, url_prefix='/api/v1/workflows')
     app.register_blueprint(health_bp, url_prefix='/api/v1/health')
+    app.register_blueprint(job_bp, url_prefix='/api/v1/jobs')
     
     return app
 
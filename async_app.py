@@ -0,0 +1,62 @@
+"""Serve the API from one asyncio process.
+
+    python async_app.py --port 5000 --threads 32
+
+Synchronous image generation and workflow execution wait on ComfyUI as
+coroutines on the server's event loop, so long generations no longer pin a
+thread each. Every other route runs the Flask app on a thread pool; with
+COMFYUI_ASYNC_CLIENT (on by default here) those routes also hand their
+prompts to the same loop. Requires aiohttp.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+def create_async_app(threads: int = 32):
+    from aiohttp import web
+    from app import create_app
+    from config.config import Config
+    from routes.async_routes import AsyncRoutes
+    from services.async_comfyui import AsyncComfyUIClient
+    from services.event_loop import EventLoopThread
+    from utils.wsgi_bridge import WSGIBridge
+
+    flask_app = create_app()
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+    # Leave room for multipart framing; Flask enforces the exact limit
+    app = web.Application(client_max_size=Config.MAX_CONTENT_LENGTH + 1024 * 1024)
+    AsyncRoutes(WSGIBridge(flask_app.wsgi_app, executor)).register(app)
+
+    async def adopt_loop(app):
+        # Bridged calls from Flask threads run on the server's own loop
+        EventLoopThread.adopt(asyncio.get_running_loop())
+
+    async def close_clients(app):
+        await AsyncComfyUIClient.close_all()
+        executor.shutdown(wait=False)
+
+    app.on_startup.append(adopt_loop)
+    app.on_cleanup.append(close_clients)
+    return app
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32, help='threads serving the Flask routes')
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Config reads its settings at import time
+    os.environ.setdefault('COMFYUI_ASYNC_CLIENT', 'true')
+    from aiohttp import web
+
+    app = create_async_app(args.threads)
+    web.run_app(app, host=args.host, port=args.port)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""Stand-in ComfyUI server for load-testing this API without a GPU.
+
+Implements the parts of ComfyUI's HTTP and WebSocket API the service uses:
+/prompt, /ws (status, execution_start, executing, progress and executed
+messages plus binary preview/output frames), /history, /view, /queue
+(including deletes), /interrupt, /object_info and /upload/image.
+
+Prompts run on a fixed number of simulated GPU workers; every KSampler step
+sleeps --step-latency seconds and every other node --node-latency seconds.
+Outputs are small synthetic PNGs that differ per seed and batch index.
+
+    python benchmarks/fake_comfyui.py --port 8188 --step-latency 0.05 --workers 1
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import uuid
+import zlib
+from collections import OrderedDict
+from aiohttp import web
+
+# ComfyUI binary frame types: 1 = preview image, format 2 = PNG
+PREVIEW_IMAGE = 1
+PNG_FORMAT = 2
+
+OUTPUT_CLASSES = ('SaveImage', 'PreviewImage')
+WEBSOCKET_OUTPUT_CLASSES = ('SaveImageWebsocket',)
+
+def synthetic_png(width: int, height: int, seed: int) -> bytes:
+    """A valid RGB PNG filled with seeded noise"""
+    rng = random.Random(seed)
+    row_bytes = width * 3
+    raw = b''.join(b'\x00' + rng.randbytes(row_bytes) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+class FakeComfyUI:
+    """Prompt queue, simulated workers and the HTTP/WebSocket handlers"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.clients = {}
+        self.pending: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.running = {}
+        self.history: 'OrderedDict[str, dict]' = OrderedDict()
+        self.files: 'OrderedDict[str, bytes]' = OrderedDict()
+        self.uploads = {}
+        self.interrupted = set()
+        self.wakeup = asyncio.Event()
+        self.counter = 0
+        self.stats = {key: 0 for key in ('prompts', 'completed', 'failed', 'interrupted', 'rejected', 'views', 'uploads')}
+
+    # --- execution ---------------------------------------------------------
+
+    async def worker(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            prompt_id, (number, prompt, client_id) = self.pending.popitem(last=False)
+            self.running[prompt_id] = (number, prompt, client_id)
+            try:
+                await self.execute(prompt_id, number, prompt, client_id)
+            finally:
+                self.running.pop(prompt_id, None)
+                self.interrupted.discard(prompt_id)
+
+    async def execute(self, prompt_id: str, number: int, prompt: dict, client_id: str):
+        await self.send(client_id, {'type': 'execution_start', 'data': {'prompt_id': prompt_id}})
+        seed, steps, batch = 0, 20, 1
+        for node in prompt.values():
+            inputs = node.get('inputs', {})
+            if node.get('class_type') in ('KSampler', 'KSamplerAdvanced'):
+                seed = inputs.get('seed', inputs.get('noise_seed', 0))
+                steps = int(inputs.get('steps', 20)) if isinstance(inputs.get('steps'), int) else 20
+            elif node.get('class_type') == 'EmptyLatentImage' and isinstance(inputs.get('batch_size'), int):
+                batch = inputs['batch_size']
+        fail_at = (
+            self.rng.choice(list(prompt))
+            if self.rng.random() < self.args.failure_rate else None
+        )
+
+        outputs = {}
+        status = 'success'
+        for node_id, node in prompt.items():
+            class_type = node.get('class_type')
+            await self.send(client_id, {'type': 'executing', 'data': {'node': node_id, 'prompt_id': prompt_id}})
+            if node_id == fail_at:
+                status = 'error'
+                await self.send(client_id, {'type': 'execution_error', 'data': {
+                    'prompt_id': prompt_id, 'node_id': node_id, 'node_type': class_type,
+                    'exception_message': 'Injected failure'
+                }})
+                break
+
+            if class_type in ('KSampler', 'KSamplerAdvanced'):
+                for step in range(steps):
+                    if prompt_id in self.interrupted:
+                        break
+                    await asyncio.sleep(self.args.step_latency)
+                    await self.send(client_id, {'type': 'progress', 'data': {
+                        'value': step + 1, 'max': steps, 'prompt_id': prompt_id, 'node': node_id
+                    }})
+                    if self.args.previews:
+                        await self.send(client_id, struct.pack('>II', PREVIEW_IMAGE, PNG_FORMAT)
+                                        + synthetic_png(8, 8, step))
+            elif self.args.node_latency:
+                await asyncio.sleep(self.args.node_latency)
+
+            if prompt_id in self.interrupted:
+                status = 'interrupted'
+                await self.send(client_id, {'type': 'execution_interrupted', 'data': {'prompt_id': prompt_id, 'node_id': node_id}})
+                break
+
+            if class_type in OUTPUT_CLASSES:
+                images = []
+                for index in range(batch):
+                    filename = f"ComfyUI_{number:05}_{node_id}_{index}.png"
+                    self.store_file(filename, synthetic_png(self.args.image_size, self.args.image_size, hash((seed, index))))
+                    images.append({'filename': filename, 'subfolder': '', 'type': 'output'})
+                outputs[node_id] = {'images': images}
+                await self.send(client_id, {'type': 'executed', 'data': {'node': node_id, 'output': outputs[node_id], 'prompt_id': prompt_id}})
+            elif class_type in WEBSOCKET_OUTPUT_CLASSES:
+                for index in range(batch):
+                    await self.send(client_id, struct.pack('>II', PREVIEW_IMAGE, PNG_FORMAT)
+                                    + synthetic_png(self.args.image_size, self.args.image_size, hash((seed, index))))
+
+        self.stats['completed' if status == 'success' else 'failed' if status == 'error' else 'interrupted'] += 1
+        self.history[prompt_id] = {
+            'prompt': [number, prompt_id, prompt, {'client_id': client_id}, list(outputs)],
+            'outputs': outputs,
+            'status': {'status_str': status, 'completed': status == 'success', 'messages': []}
+        }
+        while len(self.history) > self.args.history_size:
+            self.history.popitem(last=False)
+        await self.send(client_id, {'type': 'executing', 'data': {'node': None, 'prompt_id': prompt_id}})
+        await self.broadcast_status()
+
+    def store_file(self, filename: str, data: bytes):
+        self.files[filename] = data
+        while len(self.files) > self.args.history_size * 4:
+            self.files.popitem(last=False)
+
+    async def send(self, client_id: str, message):
+        ws = self.clients.get(client_id)
+        if ws is None or ws.closed:
+            return
+        try:
+            if isinstance(message, bytes):
+                await ws.send_bytes(message)
+            else:
+                await ws.send_str(json.dumps(message))
+        except ConnectionError:
+            pass
+
+    async def broadcast_status(self):
+        remaining = len(self.pending) + len(self.running)
+        message = {'type': 'status', 'data': {'status': {'exec_info': {'queue_remaining': remaining}}}}
+        for client_id in list(self.clients):
+            await self.send(client_id, message)
+
+    # --- handlers ----------------------------------------------------------
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or uuid.uuid4().hex
+        self.clients[client_id] = ws
+        await ws.send_str(json.dumps({'type': 'status', 'data': {
+            'status': {'exec_info': {'queue_remaining': len(self.pending) + len(self.running)}},
+            'sid': client_id
+        }}))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            if self.clients.get(client_id) is ws:
+                del self.clients[client_id]
+        return ws
+
+    async def handle_prompt(self, request: web.Request) -> web.Response:
+        if self.rng.random() < self.args.http_failure_rate:
+            self.stats['rejected'] += 1
+            return web.json_response({'error': 'Injected failure'}, status=503)
+        if len(self.pending) >= self.args.max_queue:
+            self.stats['rejected'] += 1
+            return web.json_response({'error': 'Queue full'}, status=503)
+
+        body = await request.json()
+        prompt = body.get('prompt')
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({'error': {'type': 'invalid_prompt', 'message': 'No prompt'}}, status=400)
+        prompt_id = body.get('prompt_id') or str(uuid.uuid4())
+        self.counter += 1
+        self.stats['prompts'] += 1
+        self.pending[prompt_id] = (self.counter, prompt, body.get('client_id'))
+        self.wakeup.set()
+        return web.json_response({'prompt_id': prompt_id, 'number': self.counter, 'node_errors': {}})
+
+    async def handle_history(self, request: web.Request) -> web.Response:
+        prompt_id = request.match_info.get('prompt_id')
+        if prompt_id is None:
+            return web.json_response(dict(self.history))
+        entry = self.history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry else {})
+
+    async def handle_view(self, request: web.Request) -> web.Response:
+        self.stats['views'] += 1
+        filename = request.query.get('filename', '')
+        source = self.uploads if request.query.get('type') == 'input' else self.files
+        data = source.get(filename)
+        if data is None:
+            return web.Response(status=404)
+        return web.Response(body=data, content_type='image/png')
+
+    async def handle_queue(self, request: web.Request) -> web.Response:
+        if request.method == 'POST':
+            body = await request.json()
+            if body.get('clear'):
+                self.pending.clear()
+            for prompt_id in body.get('delete', []):
+                self.pending.pop(prompt_id, None)
+            return web.json_response({})
+        return web.json_response({
+            'queue_running': [[number, prompt_id, prompt, {}, []] for prompt_id, (number, prompt, _) in self.running.items()],
+            'queue_pending': [[number, prompt_id, prompt, {}, []] for prompt_id, (number, prompt, _) in self.pending.items()]
+        })
+
+    async def handle_interrupt(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = {}
+        prompt_id = body.get('prompt_id')
+        for running_id in self.running:
+            if prompt_id is None or prompt_id == running_id:
+                self.interrupted.add(running_id)
+        return web.json_response({})
+
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        image = form.get('image')
+        if image is None:
+            return web.Response(status=400)
+        self.uploads[image.filename] = image.file.read()
+        self.stats['uploads'] += 1
+        return web.json_response({'name': image.filename, 'subfolder': '', 'type': 'input'})
+
+    async def handle_object_info(self, request: web.Request) -> web.Response:
+        return web.json_response(object_info(sorted(self.uploads)))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            **self.stats,
+            'pending': len(self.pending),
+            'running': len(self.running),
+            'clients': len(self.clients)
+        })
+
+def object_info(uploads) -> dict:
+    """Schemas of the core nodes the bundled workflows use"""
+    image = ['IMAGE']
+    return {
+        'CheckpointLoaderSimple': {'input': {'required': {'ckpt_name': [['svd_xt.safetensors', 'v1-5-pruned-emaonly.safetensors']]}},
+                                   'output': ['MODEL', 'CLIP', 'VAE'], 'output_node': False},
+        'CLIPTextEncode': {'input': {'required': {'text': ['STRING', {'multiline': True}], 'clip': ['CLIP']}},
+                           'output': ['CONDITIONING'], 'output_node': False},
+        'KSampler': {'input': {'required': {
+            'model': ['MODEL'],
+            'seed': ['INT', {'default': 0, 'min': 0, 'max': 0xffffffffffffffff}],
+            'steps': ['INT', {'default': 20, 'min': 1, 'max': 10000}],
+            'cfg': ['FLOAT', {'default': 8.0, 'min': 0.0, 'max': 100.0}],
+            'sampler_name': [['euler', 'euler_ancestral', 'dpmpp_2m']],
+            'scheduler': [['normal', 'karras']],
+            'positive': ['CONDITIONING'],
+            'negative': ['CONDITIONING'],
+            'latent_image': ['LATENT'],
+            'denoise': ['FLOAT', {'default': 1.0, 'min': 0.0, 'max': 1.0}]
+        }}, 'output': ['LATENT'], 'output_node': False},
+        'EmptyLatentImage': {'input': {'required': {
+            'width': ['INT', {'default': 512, 'min': 16, 'max': 16384}],
+            'height': ['INT', {'default': 512, 'min': 16, 'max': 16384}],
+            'batch_size': ['INT', {'default': 1, 'min': 1, 'max': 4096}]
+        }}, 'output': ['LATENT'], 'output_node': False},
+        'VAELoader': {'input': {'required': {'vae_name': [['vae-ft-mse-840000-ema-pruned.ckpt']]}},
+                      'output': ['VAE'], 'output_node': False},
+        'VAEDecode': {'input': {'required': {'samples': ['LATENT'], 'vae': ['VAE']}}, 'output': image, 'output_node': False},
+        'VAEEncode': {'input': {'required': {'pixels': image, 'vae': ['VAE']}}, 'output': ['LATENT'], 'output_node': False},
+        'LoadImage': {'input': {'required': {'image': [list(uploads), {'image_upload': True}]}},
+                      'output': ['IMAGE', 'MASK'], 'output_node': False},
+        'SaveImage': {'input': {'required': {'images': image, 'filename_prefix': ['STRING', {'default': 'ComfyUI'}]}},
+                      'output': [], 'output_node': True},
+        'PreviewImage': {'input': {'required': {'images': image}}, 'output': [], 'output_node': True},
+        'SaveImageWebsocket': {'input': {'required': {'images': image}}, 'output': [], 'output_node': True},
+    }
+
+def build_app(args: argparse.Namespace) -> web.Application:
+    fake = FakeComfyUI(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+
+    async def start_workers(app):
+        app['workers'] = [asyncio.create_task(fake.worker()) for _ in range(args.workers)]
+
+    async def stop_workers(app):
+        for task in app['workers']:
+            task.cancel()
+
+    app.on_startup.append(start_workers)
+    app.on_cleanup.append(stop_workers)
+    app.router.add_get('/ws', fake.handle_ws)
+    app.router.add_post('/prompt', fake.handle_prompt)
+    app.router.add_get('/history', fake.handle_history)
+    app.router.add_get('/history/{prompt_id}', fake.handle_history)
+    app.router.add_get('/view', fake.handle_view)
+    app.router.add_route('GET', '/queue', fake.handle_queue)
+    app.router.add_route('POST', '/queue', fake.handle_queue)
+    app.router.add_post('/interrupt', fake.handle_interrupt)
+    app.router.add_post('/upload/image', fake.handle_upload)
+    app.router.add_get('/object_info', fake.handle_object_info)
+    app.router.add_get('/fake/stats', fake.handle_stats)
+    return app
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='prompts executed concurrently (ComfyUI runs one)')
+    parser.add_argument('--step-latency', type=float, default=0.05, help='seconds per sampler step')
+    parser.add_argument('--node-latency', type=float, default=0.0, help='seconds per non-sampler node')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='fraction of prompts that end in execution_error')
+    parser.add_argument('--http-failure-rate', type=float, default=0.0,
+                        help='fraction of /prompt calls answered with 503')
+    parser.add_argument('--max-queue', type=int, default=10000, help='pending prompts before /prompt returns 503')
+    parser.add_argument('--image-size', type=int, default=64, help='edge length of output PNGs')
+    parser.add_argument('--previews', action='store_true', help='send a preview frame per sampler step')
+    parser.add_argument('--history-size', type=int, default=10000, help='finished prompts kept in /history')
+    parser.add_argument('--seed', type=int, default=None, help='seed for failure injection')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(f"Fake ComfyUI on http://{args.host}:{args.port} "
+          f"({args.workers} worker(s), {args.step_latency}s/step)", flush=True)
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None)
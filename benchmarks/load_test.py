@@ -0,0 +1,238 @@
+"""Load generator for the Flask API.
+
+Drives one endpoint at a fixed concurrency and reports latency percentiles,
+throughput, errors by status, the per-stage breakdown scraped from
+/api/v1/health/metrics and, with --api-pid, the API process's memory.
+
+    python benchmarks/fake_comfyui.py --step-latency 0.01 &
+    COMFYUI_SERVER=127.0.0.1:8188 python benchmarks/serve.py &
+    python benchmarks/load_test.py --concurrency 16 --requests 500 --api-pid $!
+
+Request bodies are generated per scenario; {i} in --prompt is replaced by
+the request number so generations are not served from the result cache.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+import aiohttp
+
+STAGE_SAMPLE = re.compile(r'^comfy_api_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def read_rss(pid: int) -> Optional[int]:
+    """Resident set size of a process in bytes (Linux)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def build_request(args: argparse.Namespace, i: int) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+    """(method, path, json body) for the i-th request of the scenario"""
+    prompt = args.prompt.replace('{i}', str(i))
+    common = {"positive_prompt": prompt, "steps": args.steps, "use_cache": not args.no_cache}
+    if args.seed is not None:
+        common["seed"] = args.seed
+    if args.scenario == 'generate':
+        return 'POST', '/api/v1/images/generate', common
+    if args.scenario == 'async':
+        return 'POST', '/api/v1/images/generate', {**common, "async": True}
+    if args.scenario == 'batch':
+        return 'POST', '/api/v1/images/generate/batch', {**common, "count": args.batch_size}
+    if args.scenario == 'workflow':
+        with open(args.workflow) as f:
+            return 'POST', '/api/v1/workflows/execute', {"workflow": json.load(f)}
+    if args.scenario == 'download':
+        return 'GET', f'/api/v1/images/download/{args.filename}', None
+    if args.scenario == 'list':
+        return 'GET', '/api/v1/images/list?limit=50', None
+    return 'GET', '/api/v1/health/ping', None
+
+async def wait_for_job(session: aiohttp.ClientSession, base_url: str, body: Dict[str, Any],
+                       timeout: float) -> str:
+    """Poll an async job until it finishes; returns the request's outcome"""
+    status_url = base_url + body['status_url']
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        async with session.get(status_url) as response:
+            if response.status != 200:
+                # Evicted, or the API is failing; polling again will not help
+                return f'job-{response.status}'
+            job = (await response.json()).get('job', {})
+        if job.get('state') in ('succeeded', 'failed', 'cancelled'):
+            return '200' if job['state'] == 'succeeded' else 'job-failed'
+        await asyncio.sleep(0.05)
+    return 'job-timeout'
+
+async def run_one(session: aiohttp.ClientSession, args: argparse.Namespace, i: int) -> Tuple[float, str]:
+    method, path, body = build_request(args, i)
+    started = time.perf_counter()
+    try:
+        async with session.request(method, args.url + path, json=body) as response:
+            # Read the whole body; batch responses stream one line per image
+            data = await response.read()
+            outcome = str(response.status)
+            if args.scenario == 'async' and response.status == 202:
+                outcome = await wait_for_job(session, args.url, json.loads(data), args.timeout)
+            elif args.scenario == 'batch' and response.status == 200:
+                done = json.loads(data.splitlines()[-1])
+                if done.get('failed'):
+                    outcome = 'batch-partial'
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        outcome = type(e).__name__
+    return time.perf_counter() - started, outcome
+
+async def scrape_stages(session: aiohttp.ClientSession, base_url: str) -> Dict[str, List[float]]:
+    """{stage: [sum, count]} from the API's Prometheus endpoint"""
+    stages: Dict[str, List[float]] = {}
+    try:
+        async with session.get(base_url + '/api/v1/health/metrics') as response:
+            text = await response.text()
+    except aiohttp.ClientError:
+        return stages
+    for line in text.splitlines():
+        match = STAGE_SAMPLE.match(line)
+        if match:
+            field, name, value = match.groups()
+            stages.setdefault(name, [0.0, 0.0])[0 if field == 'sum' else 1] = float(value)
+    return stages
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for i in range(args.warmup):
+            await run_one(session, args, -1 - i)
+        before = await scrape_stages(session, args.url)
+
+        latencies: List[float] = []
+        outcomes: Counter = Counter()
+        rss_samples: List[int] = []
+        next_index = 0
+        deadline = time.perf_counter() + args.duration if args.duration else None
+
+        def claim() -> Optional[int]:
+            nonlocal next_index
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return None
+            elif next_index >= args.requests:
+                return None
+            next_index += 1
+            return next_index - 1
+
+        async def client():
+            while True:
+                i = claim()
+                if i is None:
+                    return
+                latency, outcome = await run_one(session, args, i)
+                latencies.append(latency)
+                outcomes[outcome] += 1
+
+        async def sample_memory():
+            while True:
+                rss = read_rss(args.api_pid)
+                if rss is not None:
+                    rss_samples.append(rss)
+                await asyncio.sleep(0.5)
+
+        sampler = asyncio.create_task(sample_memory()) if args.api_pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        if sampler:
+            sampler.cancel()
+            rss = read_rss(args.api_pid)
+            if rss is not None:
+                rss_samples.append(rss)
+
+        after = await scrape_stages(session, args.url)
+
+    ordered = sorted(latencies)
+    stages = {}
+    for name, (total, count) in after.items():
+        old_total, old_count = before.get(name, (0.0, 0.0))
+        if count > old_count:
+            stages[name] = {
+                "count": int(count - old_count),
+                "mean_ms": round((total - old_total) / (count - old_count) * 1000, 2)
+            }
+    return {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0
+        },
+        "outcomes": dict(outcomes),
+        "stages": stages,
+        "api_rss_mb": {
+            "start": round(rss_samples[0] / 2 ** 20, 1),
+            "peak": round(max(rss_samples) / 2 ** 20, 1),
+            "end": round(rss_samples[-1] / 2 ** 20, 1)
+        } if rss_samples else None
+    }
+
+def print_report(report: Dict[str, Any]):
+    latency = report['latency_ms']
+    print(f"{report['scenario']}: {report['requests']} requests at concurrency {report['concurrency']} "
+          f"in {report['elapsed_s']}s ({report['requests_per_s']} req/s)")
+    print(f"  latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  "
+          f"max {latency['max']}  mean {latency['mean']}")
+    print(f"  outcomes    {', '.join(f'{key}: {value}' for key, value in sorted(report['outcomes'].items()))}")
+    for name, stage in sorted(report['stages'].items(), key=lambda item: -item[1]['mean_ms']):
+        print(f"  stage       {name:<14} {stage['mean_ms']:>10} ms mean over {stage['count']}")
+    if report['api_rss_mb']:
+        rss = report['api_rss_mb']
+        print(f"  api rss MB  start {rss['start']}  peak {rss['peak']}  end {rss['end']}")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the API')
+    parser.add_argument('--scenario', default='generate',
+                        choices=('generate', 'async', 'batch', 'workflow', 'download', 'list', 'ping'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='total requests (ignored with --duration)')
+    parser.add_argument('--duration', type=float, default=None, help='run for this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=2, help='requests sent before measuring')
+    parser.add_argument('--timeout', type=float, default=600, help='per-request timeout in seconds')
+    parser.add_argument('--prompt', default='benchmark image {i}')
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=None, help='pin the seed (enables result caching)')
+    parser.add_argument('--no-cache', action='store_true', help='send use_cache=false')
+    parser.add_argument('--batch-size', type=int, default=4, help='images per request for --scenario batch')
+    parser.add_argument('--workflow', default='workflows/default.json', help='workflow for --scenario workflow')
+    parser.add_argument('--filename', help='stored image for --scenario download')
+    parser.add_argument('--api-pid', type=int, default=None, help='sample this process\'s memory')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.scenario == 'download' and not args.filename:
+        sys.exit("--scenario download needs --filename")
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,24 @@
+"""Run the API for benchmarking: threaded, without the debugger or reloader.
+
+    COMFYUI_SERVERS=127.0.0.1:8188,127.0.0.1:8189 python benchmarks/serve.py --port 5000
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--log-level', default='WARNING', help='per-request INFO logging skews results')
+    args = parser.parse_args()
+
+    app = create_app()
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger('werkzeug').setLevel(args.log_level)
+    app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
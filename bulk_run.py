@@ -0,0 +1,65 @@
+"""Run a JSONL file of generation requests straight against ComfyUI.
+
+    python bulk_run.py requests.jsonl --output runs/sweep --concurrency 8 \
+        --servers 127.0.0.1:8188,127.0.0.1:8189
+
+Images land in <output>/images and one result line per input line is
+appended to <output>/manifest.jsonl. Rerunning the same command after a
+crash or Ctrl-C continues where the previous run stopped.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help='JSONL file: parameter sets, {"workflow": ...} or API workflows')
+    parser.add_argument('--output', '-o', required=True, help='folder for images and manifest.jsonl')
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='prompts kept in flight')
+    parser.add_argument('--servers', help='comma-separated ComfyUI addresses (default: COMFYUI_SERVERS)')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per item')
+    parser.add_argument('--retries', type=int, default=1, help='extra attempts for an item failing with a transient backend error')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the result cache for pinned seeds')
+    parser.add_argument('--keep-failed', action='store_true',
+                        help='on resume, do not retry lines recorded as failed')
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.servers:
+        # Config reads the backend list at import time
+        os.environ['COMFYUI_SERVERS'] = args.servers
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    for noisy in ('services.comfyui_service', 'utils.file_utils', 'utils.workflow_templates'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    from services.bulk_runner import BulkRunner
+
+    runner = BulkRunner(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        retries=args.retries,
+        use_cache=not args.no_cache,
+        retry_failed=not args.keep_failed
+    )
+
+    def interrupt(signum, frame):
+        if runner.stopping:
+            raise KeyboardInterrupt
+        logging.warning("Stopping after in-flight items finish; press Ctrl-C again to abort")
+        runner.stop()
+
+    signal.signal(signal.SIGINT, interrupt)
+    signal.signal(signal.SIGTERM, interrupt)
+    counts = runner.run()
+    return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,8 @@ from dataclasses import dataclass
 class Config:
     """Application configuration"""
     COMFYUI_SERVER = os.getenv('COMFYUI_SERVER', '127.0.0.1:8188')
+    # Comma-separated backend list; defaults to the single COMFYUI_SERVER
+    COMFYUI_SERVERS = [s.strip() for s in os.getenv('COMFYUI_SERVERS', COMFYUI_SERVER).split(',') if s.strip()]
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
     OUTPUT_FOLDER = os.getenv('OUTPUT_FOLDER', 'outputs')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -12,4 +14,97 @@ class Config:
     
     # ComfyUI specific settings
     DEFAULT_WORKFLOW_PATH = os.getenv('DEFAULT_WORKFLOW_PATH', 'workflows/default.json')
-    WEBSOCKET_TIMEOUT = int(os.getenv('WEBSOCKET_TIMEOUT', '300'))  # 5 minutes
\ No newline at end of file
+    WEBSOCKET_TIMEOUT = int(os.getenv('WEBSOCKET_TIMEOUT', '300'))  # 5 minutes
+    
+    # Shared ComfyUI WebSocket settings
+    COMFYUI_WS_CONNECT_TIMEOUT = float(os.getenv('COMFYUI_WS_CONNECT_TIMEOUT', '10'))
+    COMFYUI_WS_IDLE_TIMEOUT = float(os.getenv('COMFYUI_WS_IDLE_TIMEOUT', '30'))
+    COMFYUI_WS_RECONNECT_INITIAL_DELAY = float(os.getenv('COMFYUI_WS_RECONNECT_INITIAL_DELAY', '0.5'))
+    COMFYUI_WS_RECONNECT_MAX_DELAY = float(os.getenv('COMFYUI_WS_RECONNECT_MAX_DELAY', '30'))
+    
+    # Background job settings
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '128'))
+    JOB_TTL = int(os.getenv('JOB_TTL', '3600'))  # seconds finished jobs are kept
+    
+    # ComfyUI HTTP client settings
+    COMFYUI_HTTP_POOL_SIZE = int(os.getenv('COMFYUI_HTTP_POOL_SIZE', '16'))
+    COMFYUI_HTTP_TIMEOUT = float(os.getenv('COMFYUI_HTTP_TIMEOUT', '30'))
+    COMFYUI_FETCH_WORKERS = int(os.getenv('COMFYUI_FETCH_WORKERS', '8'))
+    
+    # Result cache for seed-pinned workflows
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_FOLDER = os.getenv('RESULT_CACHE_FOLDER', 'cache/results')
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))  # 1GB
+    
+    # Folder scanned for named workflow templates
+    WORKFLOW_TEMPLATES_FOLDER = os.getenv('WORKFLOW_TEMPLATES_FOLDER', 'workflows')
+    
+    # Batch / parameter-sweep generation
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '256'))
+    
+    # Latent-batch packing of compatible requests (off by default)
+    MICRO_BATCH_ENABLED = os.getenv('MICRO_BATCH_ENABLED', 'false').lower() == 'true'
+    MICRO_BATCH_WINDOW = float(os.getenv('MICRO_BATCH_WINDOW', '0.05'))  # seconds
+    MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '8'))
+    MICRO_BATCH_PINNED_SEEDS = os.getenv('MICRO_BATCH_PINNED_SEEDS', 'false').lower() == 'true'
+    
+    # Multi-backend routing
+    BACKEND_POLL_INTERVAL = float(os.getenv('BACKEND_POLL_INTERVAL', '2'))  # seconds between /queue polls
+    
+    # Model-affinity scheduling (off by default)
+    MODEL_SCHEDULER_ENABLED = os.getenv('MODEL_SCHEDULER_ENABLED', 'false').lower() == 'true'
+    SCHEDULER_MAX_INFLIGHT_PER_BACKEND = int(os.getenv('SCHEDULER_MAX_INFLIGHT_PER_BACKEND', '2'))
+    SCHEDULER_FAIRNESS_WINDOW = float(os.getenv('SCHEDULER_FAIRNESS_WINDOW', '30'))  # seconds
+    SCHEDULER_REORDER_DEPTH = int(os.getenv('SCHEDULER_REORDER_DEPTH', '8'))  # prompts per backend admitted to wait in the scheduler
+    
+    # Job progress streaming
+    PROGRESS_BUFFER_SIZE = int(os.getenv('PROGRESS_BUFFER_SIZE', '256'))  # events kept per slow subscriber
+    PROGRESS_KEEPALIVE_INTERVAL = float(os.getenv('PROGRESS_KEEPALIVE_INTERVAL', '15'))  # seconds
+    PROGRESS_PREVIEW_MAX_SIZE = int(os.getenv('PROGRESS_PREVIEW_MAX_SIZE', '256'))  # longest preview edge in px
+    
+    # Output listing
+    IMAGE_LIST_PAGE_SIZE = int(os.getenv('IMAGE_LIST_PAGE_SIZE', '100'))
+    IMAGE_LIST_MAX_PAGE_SIZE = int(os.getenv('IMAGE_LIST_MAX_PAGE_SIZE', '1000'))
+    
+    # Output storage
+    OUTPUT_WRITE_WORKERS = int(os.getenv('OUTPUT_WRITE_WORKERS', '4'))
+    OUTPUT_FSYNC = os.getenv('OUTPUT_FSYNC', 'true').lower() == 'true'
+    
+    # Image variants (resized/re-encoded downloads)
+    VARIANT_CACHE_FOLDER = os.getenv('VARIANT_CACHE_FOLDER', 'cache/variants')
+    VARIANT_CACHE_MAX_BYTES = int(os.getenv('VARIANT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+    VARIANT_MAX_WIDTH = int(os.getenv('VARIANT_MAX_WIDTH', '4096'))
+    VARIANT_DEFAULT_QUALITY = int(os.getenv('VARIANT_DEFAULT_QUALITY', '80'))
+    IMAGE_MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', '3600'))  # Cache-Control max-age for downloads
+    
+    # Output retention (0 disables a limit; all disabled by default)
+    RETENTION_MAX_BYTES = int(os.getenv('RETENTION_MAX_BYTES', '0'))
+    RETENTION_MAX_AGE = float(os.getenv('RETENTION_MAX_AGE', '0'))  # seconds since last download or creation
+    RETENTION_MAX_COUNT = int(os.getenv('RETENTION_MAX_COUNT', '0'))
+    RETENTION_SWEEP_INTERVAL = float(os.getenv('RETENTION_SWEEP_INTERVAL', '60'))  # seconds
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))  # deletions per sweep pass
+    
+    # Admission control in front of ComfyUI
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_SLOTS_PER_BACKEND = int(os.getenv('ADMISSION_SLOTS_PER_BACKEND', '2'))  # prompts running per healthy backend
+    ADMISSION_MAX_PENDING = int(os.getenv('ADMISSION_MAX_PENDING', '256'))
+    ADMISSION_MAX_PENDING_PER_CLIENT = int(os.getenv('ADMISSION_MAX_PENDING_PER_CLIENT', '32'))
+    ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '240'))  # seconds; longer estimated waits get 429
+    ADMISSION_INITIAL_PROMPT_SECONDS = float(os.getenv('ADMISSION_INITIAL_PROMPT_SECONDS', '10'))
+    ADMISSION_EWMA_ALPHA = float(os.getenv('ADMISSION_EWMA_ALPHA', '0.2'))
+    
+    # Workflow validation against ComfyUI's /object_info
+    WORKFLOW_SCHEMA_VALIDATION = os.getenv('WORKFLOW_SCHEMA_VALIDATION', 'true').lower() == 'true'
+    OBJECT_INFO_TTL = float(os.getenv('OBJECT_INFO_TTL', '300'))  # seconds before a background refresh
+    OBJECT_INFO_MIN_REFRESH = float(os.getenv('OBJECT_INFO_MIN_REFRESH', '60'))  # min seconds between refreshes forced by failures
+    VALIDATION_CACHE_SIZE = int(os.getenv('VALIDATION_CACHE_SIZE', '4096'))
+    
+    # ComfyUI call resilience
+    COMFYUI_RETRY_ATTEMPTS = int(os.getenv('COMFYUI_RETRY_ATTEMPTS', '3'))  # tries for idempotent GETs
+    COMFYUI_RETRY_BASE_DELAY = float(os.getenv('COMFYUI_RETRY_BASE_DELAY', '0.2'))  # seconds, doubled per retry
+    COMFYUI_RETRY_MAX_DELAY = float(os.getenv('COMFYUI_RETRY_MAX_DELAY', '2'))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))  # consecutive failures that open it
+    CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '10'))  # seconds before a trial call is let through
+    
+    # asyncio ComfyUI client (requires aiohttp)
+    COMFYUI_ASYNC_CLIENT = os.getenv('COMFYUI_ASYNC_CLIENT', 'false').lower() == 'true'  # run prompts on the shared event loop
\ No newline at end of file
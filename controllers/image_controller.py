@@ -1,19 +1,47 @@
-from flask import request, jsonify, send_file
-from services.comfyui_service import ComfyUIService
+from flask import request, jsonify, send_file, Response
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from config.config import Config
+from services.comfyui_service import ComfyUIService, GenerationResult
+from services.errors import ComfyUIError, GenerationTimeout
+from services.admission import AdmissionController, AdmissionRejected, Ticket
+from services.job_service import JobService
+from services.metrics import stage
+from services.retention import RetentionSweeper
+from services.variant_cache import VariantCache, VARIANT_FORMATS, supported_formats
 from utils.workflow_utils import WorkflowUtils
 from utils.file_utils import FileUtils
+from utils.request_utils import backend_error_response, client_identity, positive_number
+from utils.upload_store import UploadStore, UploadTooLarge
 import json
 import logging
 import io
-from typing import Dict, Any
+import random
+import time
+import uuid
+from concurrent.futures import as_completed, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Parameters a batch request may sweep over with "grid"
+SWEEPABLE_PARAMS = ('cfg_scale', 'steps', 'width', 'height', 'sampler_name', 'scheduler', 'denoise')
+MAX_SEED = 2 ** 32 - 1
+
+# Request parameters naming a previously uploaded input image
+IMAGE_INPUT_PARAMS = ('input_image', 'mask_image')
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 class ImageController:
     def __init__(self):
         self.comfyui_service = ComfyUIService()
         self.workflow_utils = WorkflowUtils()
         self.file_utils = FileUtils()
+        self.job_service = JobService.shared()
+        self.admission = AdmissionController.shared()
+        self.variant_cache = VariantCache.shared()
+        self.retention = RetentionSweeper.shared()
+        self.upload_store = UploadStore.for_folder(Config.UPLOAD_FOLDER)
     
     def generate_image(self) -> Dict[str, Any]:
         """Generate image with custom prompt"""
@@ -23,89 +51,477 @@ class ImageController:
             if not data:
                 return {"error": "No JSON data provided"}, 400
             
-            # Extract parameters
-            positive_prompt = data.get('positive_prompt', '')
-            negative_prompt = data.get('negative_prompt', '')
-            seed = data.get('seed', -1)
-            steps = data.get('steps', 20)
-            cfg_scale = data.get('cfg_scale', 7.0)
-            width = data.get('width', 512)
-            height = data.get('height', 512)
-            model_name = data.get('model_name', 'default')
-            
-            if not positive_prompt:
-                return {"error": "positive_prompt is required"}, 400
-            
-            # Load and modify workflow
-            workflow = self.workflow_utils.load_default_workflow()
-            workflow = self.workflow_utils.update_workflow_params(
-                workflow,
+            use_cache = data.get('use_cache', True)
+            try:
+                timeout = positive_number(data, 'timeout', Config.WEBSOCKET_TIMEOUT)
+                workflow, parameters = self.build_generation(data)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            
+            # Turn the request away now rather than after a long queue wait
+            client, priority = client_identity(), data.get('priority')
+            try:
+                self.admission.check(client, priority)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            # One deadline covers the admission wait, the job queue and the run itself;
+            # jobs queue for a slot only once they start, so a job that is still
+            # waiting for a worker or is cancelled before starting holds none
+            deadline = time.time() + timeout
+            run = lambda: self.admission.run(
+                self.admission.admit(client, priority),
+                lambda: self._run_generation(workflow, parameters, use_cache, deadline), timeout
+            )
+            
+            if data.get('async'):
+                job = self.job_service.submit('image', run)
+                return {
+                    "success": True,
+                    "message": "Image generation queued",
+                    "job_id": job.id,
+                    "status_url": f"/api/v1/jobs/{job.id}"
+                }, 202
+            
+            return run(), 200
+            
+        except AdmissionRejected as e:
+            return {"error": str(e), "retry_after": e.retry_after}, 429, {"Retry-After": str(e.retry_after)}
+        except ComfyUIError as e:
+            logger.error(f"Error generating image: {e}")
+            return backend_error_response(e)
+        except Exception as e:
+            logger.error(f"Error generating image: {e}")
+            return {"error": str(e)}, 500
+    
+    def build_generation(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(workflow, parameters) for a generate request; ValueError if the request is invalid"""
+        # Extract parameters
+        positive_prompt = data.get('positive_prompt', '')
+        negative_prompt = data.get('negative_prompt', '')
+        seed = data.get('seed', -1)
+        steps = data.get('steps', 20)
+        cfg_scale = data.get('cfg_scale', 7.0)
+        width = data.get('width', 512)
+        height = data.get('height', 512)
+        model_name = data.get('model_name', 'default')
+        template_name = data.get('template')
+        image_inputs = {name: data[name] for name in IMAGE_INPUT_PARAMS + ('denoise',) if name in data}
+        
+        if not positive_prompt:
+            raise ValueError("positive_prompt is required")
+        
+        error = self._check_image_inputs(image_inputs)
+        if error:
+            raise ValueError(error)
+        
+        # Instantiate the requested template with parameters bound
+        try:
+            workflow = self.workflow_utils.build_workflow(
+                template_name,
                 positive_prompt=positive_prompt,
                 negative_prompt=negative_prompt,
                 seed=seed,
                 steps=steps,
                 cfg_scale=cfg_scale,
                 width=width,
-                height=height
+                height=height,
+                model_name=model_name,
+                **image_inputs
             )
+        except FileNotFoundError as e:
+            raise ValueError(str(e)) from e
+        
+        parameters = {
+            "positive_prompt": positive_prompt,
+            "negative_prompt": negative_prompt,
+            "seed": seed,
+            "steps": steps,
+            "cfg_scale": cfg_scale,
+            "width": width,
+            "height": height,
+            "model_name": model_name,
+            **image_inputs,
+            "template": template_name or self.workflow_utils.default_template_name
+        }
+        return workflow, parameters
+    
+    def _check_image_inputs(self, params: Dict[str, Any]) -> Optional[str]:
+        """Error message if a parameter names an input image that was never uploaded"""
+        for name in IMAGE_INPUT_PARAMS:
+            if name in params and self.upload_store.resolve(params[name]) is None:
+                return f"{name} must be an image_id returned by /api/v1/images/upload"
+        return None
+    
+    def _run_generation(self, workflow: Dict[str, Any], parameters: Dict[str, Any],
+                        use_cache: bool = True, deadline: float = None) -> Dict[str, Any]:
+        """Run a generation to completion and save its outputs"""
+        started = time.time()
+        timeout = deadline - started if deadline else Config.WEBSOCKET_TIMEOUT
+        if timeout <= 0:
+            raise GenerationTimeout("Deadline passed before generation could start")
+        result = self.comfyui_service.generate(workflow, timeout, use_cache)
+        return self.finish_generation(result, parameters, started)
+    
+    def finish_generation(self, result: GenerationResult, parameters: Dict[str, Any],
+                          started: float) -> Dict[str, Any]:
+        """Save a finished generation's images and build the response body"""
+        saved_images = self._save_images(
+            result.images, {**parameters, "duration": round(time.time() - started, 3)}
+        )
+        
+        return {
+            "success": True,
+            "message": "Images generated successfully",
+            "images": saved_images,
+            "cache_hit": result.cache_hit,
+            "coalesced": result.coalesced,
+            "packing": result.packing,
+            "parameters": parameters
+        }
+    
+    def _save_images(self, images: Dict[str, List[bytes]], metadata: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Save generated images and describe them for the response"""
+        saved_images = []
+        for node_id, image_list in images.items():
+            for image_data in image_list:
+                filepath = self.file_utils.save_image(image_data, metadata)
+                filename = filepath.name
+                saved_images.append({
+                    "node_id": node_id,
+                    "filename": filename,
+                    "filepath": str(filepath),
+                    "url": f"/api/v1/images/download/{filename}"
+                })
+        return saved_images
+    
+    def generate_batch(self):
+        """Generate a seed/prompt/parameter sweep, streaming results as NDJSON"""
+        try:
+            data = request.get_json()
+            
+            if not data:
+                return {"error": "No JSON data provided"}, 400
+            
+            base_params = {
+                "positive_prompt": data.get('positive_prompt', ''),
+                "negative_prompt": data.get('negative_prompt', ''),
+                "seed": data.get('seed', -1),
+                "steps": data.get('steps', 20),
+                "cfg_scale": data.get('cfg_scale', 7.0),
+                "width": data.get('width', 512),
+                "height": data.get('height', 512),
+                "model_name": data.get('model_name', 'default'),
+                **{name: data[name] for name in IMAGE_INPUT_PARAMS + ('denoise',) if name in data}
+            }
+            prompts = data.get('prompts')
+            seeds = data.get('seeds')
+            grid = data.get('grid') or {}
+            template_name = data.get('template')
+            try:
+                count = positive_number(data, 'count', integer=True)
+                timeout = positive_number(data, 'timeout', Config.WEBSOCKET_TIMEOUT)
+                self._check_sweep_axes(prompts, seeds, grid)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            
+            if not base_params['positive_prompt'] and not prompts:
+                return {"error": "positive_prompt or prompts is required"}, 400
+            
+            error = self._check_image_inputs(base_params)
+            if error:
+                return {"error": error}, 400
+            
+            # Size the sweep before building it so huge requests cost nothing
+            size = self.workflow_utils.sweep_size(prompts, len(seeds) if seeds else count or 1, grid)
+            if size > Config.BATCH_MAX_ITEMS:
+                return {"error": f"Batch expands to {size} items; the limit is {Config.BATCH_MAX_ITEMS}"}, 400
+            
+            if not seeds and count:
+                start = base_params['seed']
+                if isinstance(start, bool) or not isinstance(start, int):
+                    return {"error": "seed must be an integer"}, 400
+                seeds = [
+                    start + i if start >= 0 else random.randint(0, MAX_SEED)
+                    for i in range(count)
+                ]
+            
+            variants = self.workflow_utils.expand_parameter_sweep(base_params, prompts, seeds, grid)
+            
+            try:
+                workflows = [
+                    self.workflow_utils.build_workflow(template_name, **params)
+                    for params in variants
+                ]
+            except FileNotFoundError as e:
+                return {"error": str(e)}, 400
+            
+            for params in variants:
+                params['template'] = template_name or self.workflow_utils.default_template_name
+            
+            try:
+                ticket = self.admission.admit(client_identity(), data.get('priority'), cost=len(workflows))
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            
+            response = Response(
+                self._stream_batch(variants, workflows, timeout, ticket),
+                mimetype='application/x-ndjson'
+            )
+            # The stream may be dropped before it starts
+            response.call_on_close(lambda: self.admission.release(ticket))
+            return response
+            
+        except AdmissionRejected as e:
+            return {"error": str(e), "retry_after": e.retry_after}, 429, {"Retry-After": str(e.retry_after)}
+        except Exception as e:
+            logger.error(f"Error generating batch: {e}")
+            return {"error": str(e)}, 500
+    
+    @staticmethod
+    def _check_sweep_axes(prompts: Any, seeds: Any, grid: Any):
+        """Raise ValueError unless the sweep axes have the types expand_parameter_sweep takes"""
+        if prompts is not None and not (
+            isinstance(prompts, list) and all(isinstance(prompt, str) and prompt for prompt in prompts)
+        ):
+            raise ValueError("prompts must be a list of non-empty strings")
+        if seeds is not None and not (
+            isinstance(seeds, list)
+            and all(isinstance(seed, int) and not isinstance(seed, bool) for seed in seeds)
+        ):
+            raise ValueError("seeds must be a list of integers")
+        if not isinstance(grid, dict) or not all(isinstance(values, list) for values in grid.values()):
+            raise ValueError("grid must map parameter names to lists of values")
+        unknown = set(grid) - set(SWEEPABLE_PARAMS)
+        if unknown:
+            raise ValueError(f"Unsupported grid parameters: {sorted(unknown)}")
+    
+    def _stream_batch(self, variants: List[Dict[str, Any]], workflows: List[Dict[str, Any]],
+                      timeout: int, ticket: Ticket):
+        """Queue every variant up front, then yield one JSON line per completion"""
+        batch_id = uuid.uuid4().hex[:8]
+        pending = {}
+        succeeded = failed = 0
+        
+        try:
+            try:
+                self.admission.wait_turn(ticket, timeout)
+            except AdmissionRejected as e:
+                yield json.dumps({"done": True, "batch_id": batch_id, "error": str(e), "retry_after": e.retry_after}) + "\n"
+                return
+            
+            # Submit everything first so ComfyUI's queue never runs dry
+            for index, (params, workflow) in enumerate(zip(variants, workflows)):
+                try:
+                    waiter = self.comfyui_service.submit_prompt(workflow)
+                    pending[waiter.future] = (index, params, workflow, waiter)
+                except Exception as e:
+                    failed += 1
+                    yield json.dumps({"index": index, "parameters": params, "error": str(e)}) + "\n"
+            
+            try:
+                for future in as_completed(list(pending), timeout=timeout):
+                    index, params, workflow, waiter = pending.pop(future)
+                    try:
+                        images = self.comfyui_service.collect_outputs(waiter, workflow, timeout)
+                        saved = self._save_images(
+                            images, {**params, "duration": round(time.time() - waiter.submitted_at, 3)}
+                        )
+                        succeeded += 1
+                        yield json.dumps({
+                            "index": index,
+                            "prompt_id": waiter.prompt_id,
+                            "parameters": params,
+                            "images": saved
+                        }) + "\n"
+                    except Exception as e:
+                        failed += 1
+                        yield json.dumps({"index": index, "parameters": params, "error": str(e)}) + "\n"
+            except FutureTimeoutError:
+                for index, params, workflow, waiter in pending.values():
+                    failed += 1
+                    yield json.dumps({
+                        "index": index,
+                        "parameters": params,
+                        "error": f"Generation timeout after {timeout} seconds"
+                    }) + "\n"
+            
+            yield json.dumps({
+                "done": True,
+                "batch_id": batch_id,
+                "succeeded": succeeded,
+                "failed": failed
+            }) + "\n"
+            
+        finally:
+            # Also runs when the client disconnects mid-stream: pull everything
+            # still queued out of ComfyUI in one request per backend
+            unfinished = [waiter for index, params, workflow, waiter in pending.values()]
+            self.comfyui_service.cancel(*[waiter for waiter in unfinished if not waiter.future.done()])
+            for waiter in unfinished:
+                self.comfyui_service.abandon(waiter)
+            self.admission.release(ticket)
+    
+    def upload_image(self) -> Dict[str, Any]:
+        """Store an input image for img2img or inpainting under its content hash.
+        
+        Accepts a multipart "image" field or a raw image body. The bytes are
+        hashed while they stream to disk, so re-sending an image only costs
+        the transfer; the returned image_id is what input_image/mask_image
+        and LoadImage nodes take.
+        """
+        writers = []
+        
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            writer = self.upload_store.open_writer()
+            writers.append(writer)
+            return writer
+        
+        try:
+            if request.mimetype == 'multipart/form-data':
+                _, form, files = parse_form_data(
+                    request.environ,
+                    stream_factory=stream_factory,
+                    max_content_length=Config.MAX_CONTENT_LENGTH,
+                    silent=False
+                )
+                upload = files.get('image')
+                if upload is None:
+                    return {"error": "No image file provided"}, 400
+                writer = upload.stream
+            else:
+                writer = stream_factory(request.content_length, request.mimetype, None)
+                while True:
+                    chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
             
-            # Generate images
-            images = self.comfyui_service.generate_images(workflow)
-            
-            # Save images and prepare response
-            saved_images = []
-            for node_id, image_list in images.items():
-                for i, image_data in enumerate(image_list):
-                    filename = f"generated_{node_id}_{i}.png"
-                    filepath = self.file_utils.save_image(image_data, filename)
-                    saved_images.append({
-                        "node_id": node_id,
-                        "filename": filename,
-                        "filepath": str(filepath),
-                        "url": f"/api/v1/images/download/{filename}"
-                    })
+            if writer.size == 0:
+                return {"error": "Empty upload"}, 400
+            image_id, size, existed = self.upload_store.commit(writer)
             
             return {
                 "success": True,
-                "message": "Images generated successfully",
-                "images": saved_images,
-                "parameters": {
-                    "positive_prompt": positive_prompt,
-                    "negative_prompt": negative_prompt,
-                    "seed": seed,
-                    "steps": steps,
-                    "cfg_scale": cfg_scale,
-                    "width": width,
-                    "height": height
-                }
-            }, 200
+                "image_id": image_id,
+                "size": size,
+                "deduplicated": existed
+            }, 200 if existed else 201
             
+        except (UploadTooLarge, RequestEntityTooLarge):
+            return {"error": f"Upload exceeds {Config.MAX_CONTENT_LENGTH} bytes"}, 413
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
-            logger.error(f"Error generating image: {e}")
+            logger.error(f"Error uploading image: {e}")
             return {"error": str(e)}, 500
+        finally:
+            # Temporary files of rejected uploads and of extra file fields
+            for writer in writers:
+                writer.discard()
     
     def download_image(self, filename: str):
-        """Download generated image"""
+        """Download a generated image, optionally resized or re-encoded"""
         try:
+            image_format = request.args.get('format')
+            width = request.args.get('width', type=int)
+            quality = request.args.get('quality', Config.VARIANT_DEFAULT_QUALITY, type=int)
+            
+            if image_format is not None:
+                image_format = image_format.lower()
+                if image_format not in supported_formats():
+                    return {"error": f"Unsupported format; use one of {supported_formats()}"}, 400
+            if width is not None and not 0 < width <= Config.VARIANT_MAX_WIDTH:
+                return {"error": f"width must be between 1 and {Config.VARIANT_MAX_WIDTH}"}, 400
+            if not 1 <= quality <= 100:
+                return {"error": "quality must be between 1 and 100"}, 400
+            
             filepath = self.file_utils.get_image_path(filename)
-            if not filepath.exists():
-                return {"error": "Image not found"}, 404
+            source = filepath
+            if filepath is None:
+                # Still queued for writing: serve the bytes from memory
+                source = self.file_utils.get_pending_image(filename)
+                if source is None:
+                    # The write may have finished between the two lookups
+                    filepath = source = self.file_utils.get_image_path(filename)
+                if source is None:
+                    return {"error": "Image not found"}, 404
+            version = self.file_utils.get_image_version(filename, filepath)
+            self.file_utils.touch(filename)
+            
+            if image_format is None and width is None:
+                if filepath is None:
+                    return send_file(io.BytesIO(source), mimetype='image/png', as_attachment=True,
+                                     download_name=filename, etag=version, conditional=True,
+                                     max_age=Config.IMAGE_MAX_AGE)
+                return send_file(filepath, as_attachment=True, etag=version, conditional=True,
+                                 max_age=Config.IMAGE_MAX_AGE)
             
-            return send_file(filepath, as_attachment=True)
+            image_format = image_format or 'png'
+            with stage('variant'):
+                variant = self.variant_cache.get(source, version, image_format, width, quality)
+            return send_file(
+                variant,
+                mimetype=VARIANT_FORMATS[image_format][2],
+                etag=variant.stem,
+                conditional=True,
+                max_age=Config.IMAGE_MAX_AGE
+            )
             
         except Exception as e:
             logger.error(f"Error downloading image {filename}: {e}")
             return {"error": str(e)}, 500
     
     def list_images(self) -> Dict[str, Any]:
-        """List all generated images"""
+        """List generated images newest first with cursor pagination and filters"""
         try:
-            images = self.file_utils.list_images()
+            args = request.args
+            limit = min(args.get('limit', Config.IMAGE_LIST_PAGE_SIZE, type=int), Config.IMAGE_LIST_MAX_PAGE_SIZE)
+            if limit < 1:
+                return {"error": "limit must be positive"}, 400
+            
+            try:
+                images, next_cursor = self.file_utils.list_images(
+                    limit,
+                    cursor=args.get('cursor'),
+                    since=args.get('since', type=float),
+                    until=args.get('until', type=float),
+                    seed=args.get('seed', type=int),
+                    prompt=args.get('prompt')
+                )
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            
             return {
                 "success": True,
-                "images": images
+                "images": images,
+                "next_cursor": next_cursor
             }, 200
             
         except Exception as e:
             logger.error(f"Error listing images: {e}")
+            return {"error": str(e)}, 500
+    
+    def retention_report(self) -> Dict[str, Any]:
+        """Dry run of the retention policy against the current outputs"""
+        try:
+            sample = min(request.args.get('sample', 20, type=int), Config.IMAGE_LIST_MAX_PAGE_SIZE)
+            return {
+                "success": True,
+                "retention": self.retention.report(sample)
+            }, 200
+            
+        except Exception as e:
+            logger.error(f"Error building retention report: {e}")
+            return {"error": str(e)}, 500
+    
+    def reindex_images(self) -> Dict[str, Any]:
+        """Rebuild the image index from the output folder"""
+        try:
+            return {
+                "success": True,
+                "index": self.file_utils.reindex()
+            }, 200
+            
+        except Exception as e:
+            logger.error(f"Error rebuilding image index: {e}")
             return {"error": str(e)}, 500
\ No newline at end of file
@@ -0,0 +1,128 @@
+from flask import request, Response
+from config.config import Config
+from services.job_service import JobService, Job
+from services.progress import ProgressSubscription
+from PIL import Image
+import base64
+import io
+import json
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Image format codes in ComfyUI preview frames
+PREVIEW_FORMATS = {1: 'jpeg', 2: 'png'}
+
+class JobController:
+    def __init__(self):
+        self.job_service = JobService.shared()
+    
+    def get_job(self, job_id: str):
+        """Get state, timings and results of a background job"""
+        try:
+            job = self.job_service.get(job_id)
+            if job is None:
+                return {"error": "Job not found"}, 404
+            
+            return {
+                "success": True,
+                "job": job.to_dict()
+            }, 200
+            
+        except Exception as e:
+            logger.error(f"Error getting job {job_id}: {e}")
+            return {"error": str(e)}, 500
+    
+    def cancel_job(self, job_id: str):
+        """Cancel a background job and free the ComfyUI time it holds"""
+        try:
+            job = self.job_service.get(job_id)
+            if job is None:
+                return {"error": "Job not found"}, 404
+            
+            if not self.job_service.cancel(job):
+                return {"error": f"Job already {job.state}", "job": job.to_dict()}, 409
+            
+            return {
+                "success": True,
+                "message": "Job cancellation requested",
+                "job": job.to_dict()
+            }, 202
+            
+        except Exception as e:
+            logger.error(f"Error cancelling job {job_id}: {e}")
+            return {"error": str(e)}, 500
+    
+    def stream_events(self, job_id: str):
+        """Stream a job's execution progress as Server-Sent Events"""
+        try:
+            job = self.job_service.get(job_id)
+            if job is None:
+                return {"error": "Job not found"}, 404
+            
+            previews = request.args.get('previews', 'false').lower() in ('1', 'true')
+            preview_size = min(
+                request.args.get('preview_size', Config.PROGRESS_PREVIEW_MAX_SIZE, type=int),
+                Config.PROGRESS_PREVIEW_MAX_SIZE
+            )
+            
+            # Subscribe before the generator starts so no event is missed
+            subscription = job.progress.subscribe()
+            return Response(
+                self._event_stream(job, subscription, preview_size if previews else None),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+            
+        except Exception as e:
+            logger.error(f"Error streaming events for job {job_id}: {e}")
+            return {"error": str(e)}, 500
+    
+    def _event_stream(self, job: Job, subscription: ProgressSubscription, preview_size: Optional[int]):
+        try:
+            yield self._sse('state', {"type": "state", "state": job.state})
+            
+            while True:
+                events, preview = subscription.next(Config.PROGRESS_KEEPALIVE_INTERVAL)
+                for event in events:
+                    yield self._sse(event['type'], event)
+                if preview is not None and preview_size:
+                    encoded = self._encode_preview(*preview, preview_size)
+                    if encoded:
+                        yield self._sse('preview', encoded)
+                if subscription.closed and not events and preview is None:
+                    break
+                if not events and preview is None:
+                    # Keep proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+            
+            done = job.to_dict()
+            done["dropped_events"] = subscription.dropped
+            yield self._sse('done', done)
+            
+        finally:
+            # Also runs when the client disconnects mid-stream
+            job.progress.unsubscribe(subscription)
+    
+    @staticmethod
+    def _sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    @staticmethod
+    def _encode_preview(image_format: int, image_data: bytes, max_size: int) -> Optional[Dict[str, Any]]:
+        """Downscale a preview frame and encode it as a JPEG data payload"""
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            image.thumbnail((max_size, max_size))
+            buffer = io.BytesIO()
+            image.convert('RGB').save(buffer, format='JPEG', quality=75)
+        except Exception as e:
+            logger.debug(f"Skipping undecodable {PREVIEW_FORMATS.get(image_format, image_format)} preview: {e}")
+            return None
+        return {
+            "type": "preview",
+            "width": image.width,
+            "height": image.height,
+            "image": "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+        }
@@ -1,7 +1,16 @@
 from flask import request, jsonify
-from services.comfyui_service import ComfyUIService
+from config.config import Config
+from services.comfyui_service import ComfyUIService, GenerationResult
+from services.admission import AdmissionController, AdmissionRejected
+from services.errors import ComfyUIError, GenerationTimeout
+from services.job_service import JobService
+from services.workflow_validator import WorkflowValidator
 from utils.workflow_utils import WorkflowUtils
+from utils.file_utils import FileUtils
+from utils.request_utils import backend_error_response, client_identity, positive_number
+from typing import Dict, Any, Optional, Tuple
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +18,10 @@ class WorkflowController:
     def __init__(self):
         self.comfyui_service = ComfyUIService()
         self.workflow_utils = WorkflowUtils()
+        self.file_utils = FileUtils()
+        self.job_service = JobService.shared()
+        self.admission = AdmissionController.shared()
+        self.validator = WorkflowValidator.shared()
     
     def execute_workflow(self):
         """Execute custom workflow"""
@@ -19,35 +32,122 @@ class WorkflowController:
                 return {"error": "Workflow data is required"}, 400
             
             workflow = data['workflow']
-            timeout = data.get('timeout', 300)
+            use_cache = data.get('use_cache', True)
+            try:
+                timeout = positive_number(data, 'timeout', 300)
+            except ValueError as e:
+                return {"error": str(e)}, 400
             
-            # Validate workflow
-            if not self.workflow_utils.validate_workflow(workflow):
-                return {"error": "Invalid workflow format"}, 400
+            error = self.check_workflow(workflow)
+            if error:
+                return error
+            
+            # Turn the request away now rather than after a long queue wait
+            client, priority = client_identity(), data.get('priority')
+            try:
+                self.admission.check(client, priority)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            # One deadline covers the admission wait, the job queue and the run itself;
+            # jobs queue for a slot only once they start, so a job that is still
+            # waiting for a worker or is cancelled before starting holds none
+            deadline = time.time() + timeout
+            run = lambda: self.admission.run(
+                self.admission.admit(client, priority),
+                lambda: self._run_workflow(workflow, deadline, use_cache), timeout
+            )
+            
+            if data.get('async'):
+                job = self.job_service.submit('workflow', run)
+                return {
+                    "success": True,
+                    "message": "Workflow execution queued",
+                    "job_id": job.id,
+                    "status_url": f"/api/v1/jobs/{job.id}"
+                }, 202
             
-            # Execute workflow
-            images = self.comfyui_service.generate_images(workflow, timeout)
+            return run(), 200
             
-            # Process results
-            results = []
-            for node_id, image_list in images.items():
-                for i, image_data in enumerate(image_list):
-                    filename = f"workflow_{node_id}_{i}.png"
-                    filepath = self.file_utils.save_image(image_data, filename)
-                    results.append({
-                        "node_id": node_id,
-                        "filename": filename,
-                        "url": f"/api/v1/images/download/{filename}"
-                    })
+        except AdmissionRejected as e:
+            return {"error": str(e), "retry_after": e.retry_after}, 429, {"Retry-After": str(e.retry_after)}
+        except ComfyUIError as e:
+            logger.error(f"Error executing workflow: {e}")
+            return backend_error_response(e)
+        except Exception as e:
+            logger.error(f"Error executing workflow: {e}")
+            return {"error": str(e)}, 500
+    
+    def check_workflow(self, workflow: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Error response for a workflow that must not be queued, or None"""
+        # Validate workflow
+        if not self.workflow_utils.validate_workflow(workflow):
+            return {"error": "Invalid workflow format"}, 400
+        
+        # Reject broken graphs before they take a ComfyUI queue slot
+        if Config.WORKFLOW_SCHEMA_VALIDATION:
+            errors = self.validator.validate(workflow)
+            if errors:
+                return {"error": "Workflow failed validation", "details": errors}, 400
+        return None
+    
+    def _run_workflow(self, workflow: Dict[str, Any], deadline: float, use_cache: bool = True) -> Dict[str, Any]:
+        """Execute a workflow to completion and save its outputs"""
+        started = time.time()
+        timeout = deadline - started
+        if timeout <= 0:
+            raise GenerationTimeout("Deadline passed before workflow execution could start")
+        result = self.comfyui_service.generate(workflow, timeout, use_cache)
+        return self.finish_workflow(workflow, result, started)
+    
+    def finish_workflow(self, workflow: Dict[str, Any], result: GenerationResult, started: float) -> Dict[str, Any]:
+        """Save a finished workflow's images and build the response body"""
+        metadata = {
+            "workflow_hash": self.workflow_utils.workflow_hash(workflow),
+            "duration": round(time.time() - started, 3)
+        }
+        
+        # Process results
+        results = []
+        for node_id, image_list in result.images.items():
+            for image_data in image_list:
+                filename = self.file_utils.save_image(image_data, metadata).name
+                results.append({
+                    "node_id": node_id,
+                    "filename": filename,
+                    "url": f"/api/v1/images/download/{filename}"
+                })
+        
+        return {
+            "success": True,
+            "message": "Workflow executed successfully",
+            "results": results,
+            "cache_hit": result.cache_hit,
+            "coalesced": result.coalesced,
+            "packing": result.packing
+        }
+    
+    def validate_workflow(self):
+        """Check a workflow against ComfyUI's node schemas without running it"""
+        try:
+            data = request.get_json()
             
+            if not data or 'workflow' not in data:
+                return {"error": "Workflow data is required"}, 400
+            
+            workflow = data['workflow']
+            if not self.workflow_utils.validate_workflow(workflow):
+                return {"error": "Invalid workflow format"}, 400
+            
+            errors = self.validator.validate(workflow)
             return {
                 "success": True,
-                "message": "Workflow executed successfully",
-                "results": results
+                "valid": not errors,
+                "errors": errors,
+                "schema_version": self.validator.catalog.version
             }, 200
             
         except Exception as e:
-            logger.error(f"Error executing workflow: {e}")
+            logger.error(f"Error validating workflow: {e}")
             return {"error": str(e)}, 500
     
     def get_queue_status(self):
@@ -59,6 +159,23 @@ class WorkflowController:
                 "queue_status": status
             }, 200
             
+        except ComfyUIError as e:
+            logger.error(f"Error getting queue status: {e}")
+            return backend_error_response(e)
         except Exception as e:
             logger.error(f"Error getting queue status: {e}")
+            return {"error": str(e)}, 500
+    
+    def list_templates(self):
+        """List registered workflow templates and their bindable parameters"""
+        try:
+            templates = self.workflow_utils.templates.list()
+            return {
+                "success": True,
+                "default": self.workflow_utils.default_template_name,
+                "templates": [template.to_dict() for template in templates]
+            }, 200
+            
+        except Exception as e:
+            logger.error(f"Error listing workflow templates: {e}")
             return {"error": str(e)}, 500
\ No newline at end of file
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import time
+import logging
+from functools import partial
+from typing import Dict, Any, Awaitable, Callable
+from aiohttp import web
+from config.config import Config
+from routes.image_routes import image_controller
+from routes.workflow_routes import workflow_controller
+from services.admission import AdmissionController, AdmissionRejected
+from services.async_comfyui import AsyncComfyUIService
+from services.errors import ComfyUIError, GenerationTimeout
+from services.metrics import begin_request, close_request, end_request, stage
+from utils.request_utils import backend_error_response, positive_number
+from utils.wsgi_bridge import WSGIBridge
+
+logger = logging.getLogger(__name__)
+
+# Same encoding as Flask's JSON responses
+dumps = partial(json.dumps, sort_keys=True, separators=(',', ':'))
+
+class AsyncRoutes:
+    """asyncio handlers for the endpoints that wait on ComfyUI.
+
+    Synchronous generate and workflow execute requests are served as
+    coroutines on the event loop, so a long generation holds no thread.
+    Everything else, including async jobs and batches, is passed to the
+    Flask app through the WSGI bridge. Responses match the Flask routes.
+    """
+
+    def __init__(self, wsgi: WSGIBridge):
+        self.wsgi = wsgi
+        self.service = AsyncComfyUIService()
+        self.admission = AdmissionController.shared()
+
+    def register(self, app: web.Application):
+        app.router.add_post('/api/v1/images/generate', self.generate_image)
+        app.router.add_post('/api/v1/workflows/execute', self.execute_workflow)
+        app.router.add_route('*', '/{tail:.*}', self.wsgi)
+
+    async def generate_image(self, request: web.Request) -> web.StreamResponse:
+        body = await request.read()
+        data = self._json_body(body)
+        if not data or data.get('async'):
+            # Flask answers bad bodies and queues async jobs itself
+            return await self.wsgi(request, body)
+        return await self._timed(request, self._generate_image(request, data))
+
+    async def _generate_image(self, request: web.Request, data: Dict[str, Any]) -> web.Response:
+        try:
+            timeout = positive_number(data, 'timeout', Config.WEBSOCKET_TIMEOUT)
+            workflow, parameters = await asyncio.to_thread(image_controller.build_generation, data)
+        except ValueError as e:
+            return self._response(request, {"error": str(e)}, 400)
+        use_cache = data.get('use_cache', True)
+
+        async def run(deadline: float) -> Dict[str, Any]:
+            started = time.time()
+            timeout = deadline - started
+            if timeout <= 0:
+                raise GenerationTimeout("Deadline passed before generation could start")
+            result = await self.service.generate(workflow, timeout, use_cache)
+            return await asyncio.to_thread(image_controller.finish_generation, result, parameters, started)
+
+        return await self._run_admitted(request, data, timeout, run, "Error generating image")
+
+    async def execute_workflow(self, request: web.Request) -> web.StreamResponse:
+        body = await request.read()
+        data = self._json_body(body)
+        if not data or 'workflow' not in data or data.get('async'):
+            return await self.wsgi(request, body)
+        return await self._timed(request, self._execute_workflow(request, data))
+
+    async def _execute_workflow(self, request: web.Request, data: Dict[str, Any]) -> web.Response:
+        workflow = data['workflow']
+        try:
+            timeout = positive_number(data, 'timeout', 300)
+        except ValueError as e:
+            return self._response(request, {"error": str(e)}, 400)
+        error = await asyncio.to_thread(workflow_controller.check_workflow, workflow)
+        if error:
+            return self._response(request, *error)
+        use_cache = data.get('use_cache', True)
+
+        async def run(deadline: float) -> Dict[str, Any]:
+            started = time.time()
+            timeout = deadline - started
+            if timeout <= 0:
+                raise GenerationTimeout("Deadline passed before workflow execution could start")
+            result = await self.service.generate(workflow, timeout, use_cache)
+            return await asyncio.to_thread(workflow_controller.finish_workflow, workflow, result, started)
+
+        return await self._run_admitted(request, data, timeout, run, "Error executing workflow")
+
+    async def _run_admitted(self, request: web.Request, data: Dict[str, Any], timeout: float,
+                            work: Callable[[float], Awaitable[Dict[str, Any]]],
+                            description: str) -> web.StreamResponse:
+        """Admit the request, run the work within one deadline and map failures to responses"""
+        try:
+            ticket = self.admission.admit(self._client_identity(request), data.get('priority'))
+        except ValueError as e:
+            return self._response(request, {"error": str(e)}, 400)
+        except AdmissionRejected as e:
+            return self._rejected(request, e)
+
+        # One deadline covers the admission wait and the run itself
+        deadline = time.time() + timeout
+        try:
+            with stage('admission'):
+                await self.admission.wait_turn_async(ticket, timeout)
+            return self._response(request, await work(deadline), 200)
+        except AdmissionRejected as e:
+            return self._rejected(request, e)
+        except ComfyUIError as e:
+            logger.error(f"{description}: {e}")
+            return self._response(request, *backend_error_response(e))
+        except Exception as e:
+            logger.error(f"{description}: {e}")
+            return self._response(request, {"error": str(e)}, 500)
+        finally:
+            self.admission.release(ticket)
+
+    def _rejected(self, request: web.Request, error: AdmissionRejected) -> web.Response:
+        return self._response(
+            request, {"error": str(error), "retry_after": error.retry_after}, 429,
+            {"Retry-After": str(error.retry_after)}
+        )
+
+    @staticmethod
+    async def _timed(request: web.Request, handling: Awaitable[web.Response]) -> web.Response:
+        """Record request metrics and Server-Timing the way the Flask app does"""
+        started = time.perf_counter()
+        reset = begin_request()
+        response = None
+        try:
+            response = await handling
+            return response
+        finally:
+            server_timing = end_request(
+                reset, request.method, request.match_info.route.resource.canonical,
+                response.status if response is not None else 500, time.perf_counter() - started
+            )
+            close_request()
+            if response is not None:
+                response.headers['Server-Timing'] = server_timing
+
+    @staticmethod
+    def _json_body(body: bytes) -> Dict[str, Any]:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _client_identity(request: web.Request) -> str:
+        """client_identity() for aiohttp requests"""
+        api_key = request.headers.get('X-API-Key')
+        if api_key:
+            return f"key:{api_key}"
+        return f"ip:{request.remote}"
+
+    @staticmethod
+    def _response(request: web.Request, body: Dict[str, Any], status: int,
+                  headers: Dict[str, str] = None) -> web.Response:
+        headers = dict(headers or {})
+        if 'Origin' in request.headers:
+            # Flask-CORS allows every origin
+            headers['Access-Control-Allow-Origin'] = '*'
+        return web.json_response(body, status=status, headers=headers, dumps=dumps)
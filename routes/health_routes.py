@@ -1,28 +1,99 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
+from config.config import Config
+from services.admission import AdmissionController
+from services.backend_pool import BackendPool
+from services.circuit_breaker import CircuitBreaker
 from services.comfyui_service import ComfyUIService
+from services.input_uploader import InputImageUploader
+from services.metrics import MetricsRegistry
+from services.result_cache import ResultCache
+from services.variant_cache import VariantCache
 import logging
 
 health_bp = Blueprint('health', __name__)
 logger = logging.getLogger(__name__)
 
+def collect_service_metrics():
+    """Counters the services already keep, read at scrape time"""
+    result_cache = ResultCache.shared().stats()
+    variant_cache = VariantCache.shared().stats()
+    single_flight = ComfyUIService.in_flight.stats()
+    admission = AdmissionController.shared().stats()
+    uploads = InputImageUploader.shared().stats()
+    backends = BackendPool.shared().snapshot()
+    
+    yield ('comfy_api_cache_lookups_total', 'counter', 'Cache lookups by cache and outcome', [
+        ({"cache": "result", "outcome": "hit"}, result_cache['hits']),
+        ({"cache": "result", "outcome": "miss"}, result_cache['misses']),
+        ({"cache": "variant", "outcome": "hit"}, variant_cache['hits']),
+        ({"cache": "variant", "outcome": "miss"}, variant_cache['renders']),
+        ({"cache": "input_upload", "outcome": "hit"}, uploads['skipped']),
+        ({"cache": "input_upload", "outcome": "miss"}, uploads['uploads'])
+    ])
+    yield ('comfy_api_cache_bytes', 'gauge', 'Bytes held by each disk cache', [
+        ({"cache": "result"}, result_cache['bytes']),
+        ({"cache": "variant"}, variant_cache['bytes'])
+    ])
+    yield ('comfy_api_coalesced_requests_total', 'counter', 'Requests that joined an identical in-flight generation', [
+        ({}, single_flight['coalesced'])
+    ])
+    yield ('comfy_api_generations_in_flight', 'gauge', 'Distinct seed-pinned generations running', [
+        ({}, single_flight['in_flight'])
+    ])
+    yield ('comfy_api_admission_active', 'gauge', 'Requests holding an admission slot', [
+        ({}, admission['active'])
+    ])
+    yield ('comfy_api_admission_pending', 'gauge', 'Requests waiting for an admission slot', [
+        ({"priority": priority}, count) for priority, count in admission['pending'].items()
+    ])
+    yield ('comfy_api_admission_rejected_total', 'counter', 'Requests turned away by admission control', [
+        ({}, admission['rejected'])
+    ])
+    yield ('comfy_api_backend_up', 'gauge', 'Whether a ComfyUI backend is in rotation', [
+        ({"backend": backend['address']}, 1 if backend['state'] == 'up' else 0) for backend in backends
+    ])
+    yield ('comfy_api_backend_queue_depth', 'gauge', 'Running plus pending prompts at the last poll', [
+        ({"backend": backend['address']}, backend['queue_depth']) for backend in backends
+    ])
+    yield ('comfy_api_backend_in_flight', 'gauge', 'Prompts placed on a backend and not yet collected', [
+        ({"backend": backend['address']}, backend['in_flight']) for backend in backends
+    ])
+    yield ('comfy_api_backend_circuit_open', 'gauge', 'Whether calls to a backend are being failed fast', [
+        ({"backend": backend['address']}, 0 if backend['circuit'] == CircuitBreaker.CLOSED else 1) for backend in backends
+    ])
+    yield ('comfy_api_backend_rejected_total', 'counter', 'Calls refused by an open circuit', [
+        ({"backend": backend['address']}, CircuitBreaker.for_host(backend['address']).rejected) for backend in backends
+    ])
+
+MetricsRegistry.shared().register_collector(collect_service_metrics)
+
 @health_bp.route('/ping', methods=['GET'])
 def ping():
     return {"status": "healthy", "message": "Server is running"}, 200
 
 @health_bp.route('/comfyui', methods=['GET'])
 def check_comfyui():
-    try:
-        service = ComfyUIService()
-        status = service.get_queue_status()
-        return {
-            "status": "healthy",
-            "comfyui_connected": True,
-            "queue_info": status
-        }, 200
-    except Exception as e:
-        logger.error(f"ComfyUI health check failed: {e}")
-        return {
-            "status": "unhealthy",
-            "comfyui_connected": False,
-            "error": str(e)
-        }, 503
+    backends = BackendPool.shared().snapshot()
+    healthy = [backend for backend in backends if backend['state'] == 'up']
+    return {
+        "status": "healthy" if healthy else "unhealthy",
+        "comfyui_connected": bool(healthy),
+        "healthy_backends": len(healthy),
+        "backends": backends
+    }, 200 if healthy else 503
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(MetricsRegistry.shared().render(), mimetype='text/plain; version=0.0.4')
+
+@health_bp.route('/stats', methods=['GET'])
+def stats():
+    return {
+        "admission": AdmissionController.shared().stats(),
+        "result_cache": ResultCache.shared().stats(),
+        "variant_cache": VariantCache.shared().stats(),
+        "input_uploads": InputImageUploader.shared().stats(),
+        "single_flight": ComfyUIService.in_flight.stats(),
+        "micro_batch": ComfyUIService().micro_batcher.stats() if Config.MICRO_BATCH_ENABLED else None,
+        "model_scheduler": ComfyUIService._scheduler.stats() if ComfyUIService._scheduler else None
+    }, 200
@@ -8,10 +8,26 @@ image_controller = ImageController()
 def generate_image():
     return image_controller.generate_image()
 
+@image_bp.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    return image_controller.generate_batch()
+
+@image_bp.route('/upload', methods=['POST'])
+def upload_image():
+    return image_controller.upload_image()
+
 @image_bp.route('/download/<filename>', methods=['GET'])
 def download_image(filename):
     return image_controller.download_image(filename)
 
 @image_bp.route('/list', methods=['GET'])
 def list_images():
-    return image_controller.list_images()
\ No newline at end of file
+    return image_controller.list_images()
+
+@image_bp.route('/reindex', methods=['POST'])
+def reindex_images():
+    return image_controller.reindex_images()
+
+@image_bp.route('/retention', methods=['GET'])
+def retention_report():
+    return image_controller.retention_report()
@@ -0,0 +1,17 @@
+from flask import Blueprint
+from controllers.job_controller import JobController
+
+job_bp = Blueprint('jobs', __name__)
+job_controller = JobController()
+
+@job_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    return job_controller.get_job(job_id)
+
+@job_bp.route('/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    return job_controller.cancel_job(job_id)
+
+@job_bp.route('/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    return job_controller.stream_events(job_id)
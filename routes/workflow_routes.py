@@ -8,6 +8,14 @@ workflow_controller = WorkflowController()
 def execute_workflow():
     return workflow_controller.execute_workflow()
 
+@workflow_bp.route('/validate', methods=['POST'])
+def validate_workflow():
+    return workflow_controller.validate_workflow()
+
 @workflow_bp.route('/queue/status', methods=['GET'])
 def get_queue_status():
-    return workflow_controller.get_queue_status()
\ No newline at end of file
+    return workflow_controller.get_queue_status()
+
+@workflow_bp.route('/templates', methods=['GET'])
+def list_templates():
+    return workflow_controller.list_templates()
\ No newline at end of file
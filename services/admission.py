@@ -0,0 +1,302 @@
+import asyncio
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Optional
+from config.config import Config
+from services.backend_pool import BackendPool
+from services.cancellation import GenerationCancelled, current_token
+from services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Highest first; each class is drained before the next one is served
+PRIORITIES = ('high', 'normal', 'low')
+
+# How often a coroutine waiting for its turn checks the ticket
+ASYNC_POLL_INTERVAL = 0.05
+
+class AdmissionRejected(Exception):
+    """Request turned away before reaching ComfyUI; retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Ticket:
+    """A request's place in the admission queue"""
+
+    def __init__(self, client: str, priority: str, cost: int):
+        self.client = client
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = time.time()
+        self.granted_at = None
+        self.estimated_wait = None
+        # Set when admission control is disabled: runs immediately, untracked
+        self.bypass = False
+        self.released = False
+        self.aborted = False
+        self._granted = threading.Event()
+
+class AdmissionController:
+    """Bounded local queue in front of ComfyUI with early rejection.
+
+    At most a few prompts per healthy backend run at once; the rest wait
+    here, served by priority class and round-robin across clients within a
+    class. A request is charged one slot per prompt it submits. A request is
+    rejected with a Retry-After hint when the local queue or the client's
+    share of it is full, or when its estimated wait (from the backends' queue
+    depth and recently observed run times) exceeds ADMISSION_MAX_WAIT.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, pool: BackendPool = None):
+        self.pool = pool or BackendPool.shared()
+        self.slots_per_backend = self.default_slots_per_backend()
+        self.max_pending = Config.ADMISSION_MAX_PENDING
+        self.max_pending_per_client = Config.ADMISSION_MAX_PENDING_PER_CLIENT
+        self.max_wait = Config.ADMISSION_MAX_WAIT
+        self._pending: Dict[str, 'OrderedDict[str, deque]'] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._pending_count = 0
+        self._pending_by_client: Dict[str, int] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        # Seconds per unit of cost, smoothed over recent completions
+        self._unit_seconds: Optional[float] = None
+        self.admitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def shared(cls) -> 'AdmissionController':
+        """Return the process-wide admission controller"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def default_slots_per_backend() -> int:
+        """Slots per healthy backend, leaving room for packing and scheduling.
+
+        The model scheduler needs prompts waiting beyond those in ComfyUI to
+        reorder, and the micro-batcher can only fill a latent batch from
+        requests that are running at the same time.
+        """
+        slots = Config.ADMISSION_SLOTS_PER_BACKEND
+        if Config.MODEL_SCHEDULER_ENABLED:
+            slots = max(slots, Config.SCHEDULER_MAX_INFLIGHT_PER_BACKEND) + Config.SCHEDULER_REORDER_DEPTH
+        if Config.MICRO_BATCH_ENABLED:
+            slots *= Config.MICRO_BATCH_MAX_SIZE
+        return slots
+
+    @property
+    def capacity(self) -> int:
+        healthy = sum(1 for backend in self.pool.backends if backend.healthy)
+        return max(1, healthy) * self.slots_per_backend
+
+    def admit(self, client: str, priority: str = None, cost: int = 1) -> Ticket:
+        """Queue a request or raise AdmissionRejected"""
+        priority = priority or 'normal'
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {list(PRIORITIES)}")
+
+        ticket = Ticket(client, priority, cost)
+        if not Config.ADMISSION_ENABLED:
+            ticket.bypass = True
+            ticket._granted.set()
+            return ticket
+
+        with self._lock:
+            ticket.estimated_wait = self._check(ticket)
+            self._pending[priority].setdefault(client, deque()).append(ticket)
+            self._pending_count += 1
+            self._pending_by_client[client] = self._pending_by_client.get(client, 0) + 1
+            self.admitted += 1
+            self._grant()
+        return ticket
+
+    def check(self, client: str, priority: str = None, cost: int = 1):
+        """Raise AdmissionRejected if admit() would turn the request away, without queueing it"""
+        priority = priority or 'normal'
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {list(PRIORITIES)}")
+        if not Config.ADMISSION_ENABLED:
+            return
+        with self._lock:
+            self._check(Ticket(client, priority, cost))
+
+    def _check(self, ticket: Ticket) -> Optional[float]:
+        """Reject the ticket or return its estimated wait"""
+        if self._pending_count >= self.max_pending:
+            self._reject(f"Server busy: {self._pending_count} requests already waiting",
+                         self._seconds_for(self._pending_count - self.max_pending + 1))
+        if self._pending_by_client.get(ticket.client, 0) >= self.max_pending_per_client:
+            self._reject("Too many requests waiting for this client",
+                         self._seconds_for(1))
+
+        wait = self._estimate_wait(ticket)
+        if wait is not None and wait > self.max_wait:
+            self._reject(f"Estimated wait of {wait:.0f}s exceeds {self.max_wait:.0f}s",
+                         math.ceil(wait - self.max_wait))
+        return wait
+
+    def wait_turn(self, ticket: Ticket, timeout: float):
+        """Block until the ticket may run"""
+        self._end_wait(ticket, ticket._granted.wait(timeout), timeout)
+
+    async def wait_turn_async(self, ticket: Ticket, timeout: float):
+        """wait_turn for coroutines; waits without holding a thread"""
+        deadline = time.monotonic() + timeout
+        while not ticket._granted.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        self._end_wait(ticket, ticket._granted.is_set(), timeout)
+
+    def _end_wait(self, ticket: Ticket, granted: bool, timeout: float):
+        if granted:
+            if ticket.aborted:
+                raise GenerationCancelled("Generation cancelled while waiting for a slot")
+            return
+        with self._lock:
+            if self._remove(ticket):
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"Timed out after {timeout} seconds waiting for a free slot",
+                    self._seconds_for(self._pending_count + 1)
+                )
+        # Granted between the timeout and taking the lock
+
+    def release(self, ticket: Ticket):
+        """Free the ticket's slot and learn from how long it ran"""
+        if ticket.bypass:
+            return
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted_at is None:
+                self._remove(ticket)
+                return
+            elapsed = (time.time() - ticket.granted_at) / max(1, ticket.cost)
+            if self._unit_seconds is None:
+                self._unit_seconds = elapsed
+            else:
+                self._unit_seconds += Config.ADMISSION_EWMA_ALPHA * (elapsed - self._unit_seconds)
+            self._active -= ticket.cost
+            self._grant()
+
+    def run(self, ticket: Ticket, work: Callable[[], Any], timeout: float) -> Any:
+        """Wait for the ticket's turn, run the work and release the slot"""
+        token = current_token()
+        if token is not None:
+            token.register(ticket, lambda: self._abort(ticket))
+        try:
+            with stage('admission'):
+                self.wait_turn(ticket, timeout)
+            return work()
+        finally:
+            if token is not None:
+                token.unregister(ticket)
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self._active,
+                "capacity": self.capacity,
+                "pending": {
+                    priority: sum(len(tickets) for tickets in clients.values())
+                    for priority, clients in self._pending.items()
+                },
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "seconds_per_prompt": round(self._unit_seconds, 3) if self._unit_seconds is not None else None
+            }
+
+    def _abort(self, ticket: Ticket):
+        """Withdraw a cancelled ticket that is still waiting, or free its slot"""
+        with self._lock:
+            if self._remove(ticket):
+                ticket.aborted = True
+                ticket._granted.set()
+                return
+        # Already running: the slot is free while the work winds down
+        self.release(ticket)
+
+    def _reject(self, message: str, retry_after: int):
+        self.rejected += 1
+        raise AdmissionRejected(message, max(1, retry_after))
+
+    def _seconds_for(self, units: int) -> int:
+        """Time for the backends to work through this many queued prompts"""
+        unit = self._unit_seconds or Config.ADMISSION_INITIAL_PROMPT_SECONDS
+        healthy = max(1, sum(1 for backend in self.pool.backends if backend.healthy))
+        return max(1, math.ceil(units * unit / healthy))
+
+    def _estimate_wait(self, ticket: Ticket) -> Optional[float]:
+        if self._unit_seconds is None:
+            # No completions observed yet; only the queue bounds apply
+            return None
+        healthy = [backend for backend in self.pool.backends if backend.healthy]
+        backend_load = sum(backend.load for backend in healthy)
+        ahead = sum(
+            queued.cost
+            for priority in PRIORITIES[:PRIORITIES.index(ticket.priority) + 1]
+            for tickets in self._pending[priority].values()
+            for queued in tickets
+        )
+        return (backend_load + ahead + ticket.cost) * self._unit_seconds / max(1, len(healthy))
+
+    def _grant(self):
+        capacity = self.capacity
+        while self._pending_count:
+            ticket = self._next_ticket()
+            # Wait for room rather than letting smaller requests overtake;
+            # a request bigger than the capacity runs once everything else is done
+            if self._active and self._active + ticket.cost > capacity:
+                return
+            self._take(ticket)
+            self._active += ticket.cost
+            ticket.granted_at = time.time()
+            ticket._granted.set()
+
+    def _next_ticket(self) -> Ticket:
+        """The ticket to serve next: round-robin across clients within a priority class"""
+        for priority in PRIORITIES:
+            clients = self._pending[priority]
+            if clients:
+                return next(iter(clients.values()))[0]
+        raise RuntimeError("No pending tickets")
+
+    def _take(self, ticket: Ticket):
+        clients = self._pending[ticket.priority]
+        tickets = clients[ticket.client]
+        tickets.popleft()
+        # Move the client to the back of its class
+        if tickets:
+            clients.move_to_end(ticket.client)
+        else:
+            del clients[ticket.client]
+        self._forget(ticket)
+
+    def _remove(self, ticket: Ticket) -> bool:
+        tickets = self._pending[ticket.priority].get(ticket.client)
+        if not tickets or ticket not in tickets:
+            return False
+        tickets.remove(ticket)
+        if not tickets:
+            del self._pending[ticket.priority][ticket.client]
+        self._forget(ticket)
+        return True
+
+    def _forget(self, ticket: Ticket):
+        self._pending_count -= 1
+        remaining = self._pending_by_client.get(ticket.client, 1) - 1
+        if remaining:
+            self._pending_by_client[ticket.client] = remaining
+        else:
+            self._pending_by_client.pop(ticket.client, None)
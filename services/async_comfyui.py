@@ -0,0 +1,486 @@
+import asyncio
+import contextvars
+import json
+import uuid
+import urllib.parse
+import logging
+from typing import Dict, Any, Optional, List, Iterable
+import aiohttp
+from config.config import Config
+from services.backend_pool import BackendPool
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+from services.circuit_breaker import CircuitBreaker
+from services.comfyui_service import ComfyUIService, GenerationResult
+from services.errors import (
+    BackendHTTPError, BackendTimeout, BackendUnavailable, GenerationTimeout, PromptRejected,
+    call_with_retries_async
+)
+from services.input_uploader import InputImageUploader
+from services.metrics import BYTES_TRANSFERRED, stage
+from services.result_cache import ResultCache
+from services.websocket_manager import PromptRouter, PromptWaiter
+from utils.workflow_utils import WorkflowUtils
+
+logger = logging.getLogger(__name__)
+
+class AsyncComfyUIClient(PromptRouter):
+    """asyncio connection to one ComfyUI server.
+
+    HTTP calls share one pooled aiohttp session and a single reader task
+    owns the WebSocket, so any number of prompts can be waited on without a
+    thread each. Instances belong to the event loop they were created on.
+    """
+
+    _instances: Dict[str, 'AsyncComfyUIClient'] = {}
+
+    def __init__(self, server_address: str):
+        super().__init__(server_address)
+        self.base_url = f"http://{server_address}"
+        self.breaker = CircuitBreaker.for_host(server_address)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connected = asyncio.Event()
+        self._reader: Optional[asyncio.Task] = None
+
+    @classmethod
+    def for_server(cls, server_address: str) -> 'AsyncComfyUIClient':
+        """Return the client for a server, starting its WebSocket reader on first use"""
+        client = cls._instances.get(server_address)
+        if client is None:
+            client = cls(server_address)
+            cls._instances[server_address] = client
+        client.start()
+        return client
+
+    @classmethod
+    async def close_all(cls):
+        for client in list(cls._instances.values()):
+            await client.close()
+        cls._instances.clear()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=Config.COMFYUI_HTTP_POOL_SIZE)
+            )
+        return self._session
+
+    def start(self):
+        """Start the WebSocket reader task if it is not running"""
+        if self._reader is None or self._reader.done():
+            # Run the reader outside the context of whichever request started it
+            self._reader = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def wait_until_connected(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.error(f"Failed to connect to ComfyUI WebSocket at {self.server_address}")
+            return False
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None,
+                      headers: Optional[Dict[str, str]] = None) -> bytes:
+        """Send a request over the pooled session and return the response body"""
+        self.breaker.before_call()
+        try:
+            async with self.session.request(
+                method, self.base_url + path, data=body, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=Config.COMFYUI_HTTP_TIMEOUT)
+            ) as response:
+                status = response.status
+                data = await response.read()
+        except asyncio.TimeoutError as e:
+            self.breaker.record_failure()
+            raise BackendTimeout(
+                f"{method} {self.server_address}{path} timed out after {Config.COMFYUI_HTTP_TIMEOUT}s"
+            ) from e
+        except (aiohttp.ClientError, OSError) as e:
+            self.breaker.record_failure()
+            raise BackendUnavailable(f"{method} {self.server_address}{path} failed: {e}") from e
+
+        self.breaker.record_success()
+        if status >= 400:
+            raise BackendHTTPError(f"HTTP {status} from {self.server_address}{path}: {data[:200]!r}", status, data)
+        return data
+
+    async def get(self, path: str) -> bytes:
+        """GET with retries; only for idempotent calls"""
+        return await call_with_retries_async(lambda: self.request('GET', path), description=f"GET {path}")
+
+    async def post_json(self, path: str, body: bytes) -> bytes:
+        return await self.request('POST', path, body, {'Content-Type': 'application/json'})
+
+    async def queue_prompt(self, prompt: Dict[str, Any], prompt_id: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a prompt for processing"""
+        payload = {"prompt": prompt, "client_id": self.client_id}
+        if prompt_id:
+            payload["prompt_id"] = prompt_id
+        try:
+            with stage('submit'):
+                result = json.loads(await self.post_json('/prompt', json.dumps(payload).encode('utf-8')))
+        except BackendHTTPError as e:
+            logger.error(f"Failed to queue prompt: {e}")
+            if e.http_status == 400:
+                raise PromptRejected(f"ComfyUI rejected the prompt: {e.body[:500].decode('utf-8', 'replace')}") from e
+            raise
+        logger.info(f"Prompt queued successfully on {self.server_address}: {result.get('prompt_id')}")
+        return result
+
+    async def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
+        """Retrieve generated image"""
+        url_values = urllib.parse.urlencode({"filename": filename, "subfolder": subfolder, "type": folder_type})
+        image_data = await self.get(f"/view?{url_values}")
+        BYTES_TRANSFERRED.inc(len(image_data), 'comfyui_download')
+        return image_data
+
+    async def get_history(self, prompt_id: str) -> Dict[str, Any]:
+        """Get generation history for a prompt ID"""
+        with stage('history'):
+            return json.loads(await self.get(f"/history/{prompt_id}"))
+
+    async def get_queue_status(self) -> Dict[str, Any]:
+        """Get current queue status"""
+        return json.loads(await self.get('/queue'))
+
+    async def interrupt(self, prompt_ids: List[str]):
+        """Delete queued prompts and interrupt the running one if it is among them"""
+        await self.post_json('/queue', json.dumps({"delete": prompt_ids}).encode('utf-8'))
+        status = await self.get_queue_status()
+        running = {item[1] for item in status.get('queue_running', [])}
+        for prompt_id in running.intersection(prompt_ids):
+            await self.post_json('/interrupt', json.dumps({"prompt_id": prompt_id}).encode('utf-8'))
+            logger.info(f"Interrupted running prompt {prompt_id} on {self.server_address}")
+
+    async def wait(self, waiter: PromptWaiter, timeout: float) -> str:
+        """Wait until the prompt finishes, fails or the timeout expires"""
+        try:
+            # Shielded so a timeout leaves the waiter to be cancelled properly
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter.future)), timeout)
+        except asyncio.TimeoutError:
+            raise GenerationTimeout(f"Generation timeout after {timeout:.1f} seconds")
+
+    async def fetch_outputs(self, prompt_id: str, exclude: Iterable[str] = ()) -> Dict[str, List[bytes]]:
+        """Download all output images of a finished prompt concurrently"""
+        history = (await self.get_history(prompt_id))[prompt_id]
+        wanted = [
+            (node_id, image)
+            for node_id, node_output in history['outputs'].items() if node_id not in exclude
+            for image in node_output.get('images', [])
+        ]
+        with stage('view'):
+            downloads = await asyncio.gather(*(
+                self.get_image(image['filename'], image['subfolder'], image['type'])
+                for node_id, image in wanted
+            ))
+
+        outputs: Dict[str, List[bytes]] = {
+            node_id: [] for node_id in history['outputs'] if node_id not in exclude
+        }
+        for (node_id, _), image_data in zip(wanted, downloads):
+            outputs[node_id].append(image_data)
+        return outputs
+
+    async def _run(self):
+        delay = Config.COMFYUI_WS_RECONNECT_INITIAL_DELAY
+        ws_url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+        while True:
+            try:
+                ws = await asyncio.wait_for(
+                    self.session.ws_connect(ws_url, heartbeat=Config.COMFYUI_WS_IDLE_TIMEOUT, max_msg_size=0),
+                    Config.COMFYUI_WS_CONNECT_TIMEOUT
+                )
+                async with ws:
+                    self._connected.set()
+                    logger.info(f"Connected to ComfyUI WebSocket: {ws_url}")
+                    delay = Config.COMFYUI_WS_RECONNECT_INITIAL_DELAY
+                    await self._resync_pending()
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self._dispatch(json.loads(message.data))
+                        elif message.type == aiohttp.WSMsgType.BINARY:
+                            self._dispatch_binary(message.data)
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            raise ws.exception() or ConnectionError("WebSocket error")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI WebSocket {self.server_address} error: {e}")
+            finally:
+                self._connected.clear()
+
+            logger.info(f"Reconnecting to ComfyUI WebSocket {self.server_address} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, Config.COMFYUI_WS_RECONNECT_MAX_DELAY)
+
+    async def _resync_pending(self):
+        """Complete waiters whose prompts finished while we were disconnected"""
+        with self._lock:
+            pending = list(self._waiters)
+
+        for prompt_id in pending:
+            try:
+                history = json.loads(await self.request('GET', f"/history/{prompt_id}"))
+                if prompt_id in history:
+                    self._resync(prompt_id, history[prompt_id])
+            except Exception as e:
+                logger.warning(f"Failed to resync prompt {prompt_id}: {e}")
+
+class _Flight:
+    """One seed-pinned generation shared by every caller waiting for it"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.callers = 0
+        # Cancelled once every caller has given up
+        self.token = CancellationToken()
+
+class AsyncComfyUIService:
+    """asyncio counterpart of ComfyUIService.
+
+    Offers the same operations as coroutines with the same results and
+    errors: backend routing and ejection, circuit breaking, the result
+    cache and coalescing of identical seed-pinned generations. Micro-batch
+    packing and model-affinity scheduling stay with ComfyUIService.
+    """
+
+    # Identical seed-pinned workflows running concurrently share one prompt
+    _in_flight: Dict[str, '_Flight'] = {}
+
+    def __init__(self, server_address: str = None):
+        # An explicit address pins the service to one server; otherwise
+        # prompts are routed across the configured backend pool
+        self.backend_pool = None if server_address else BackendPool.shared()
+        self.server_address = server_address or self.backend_pool.backends[0].address
+        self.result_cache = ResultCache.shared() if Config.RESULT_CACHE_ENABLED else None
+        self.input_uploader = InputImageUploader.shared()
+
+    def client(self, server_address: str = None) -> AsyncComfyUIClient:
+        return AsyncComfyUIClient.for_server(server_address or self.server_address)
+
+    async def queue_prompt(self, prompt: Dict[str, Any], prompt_id: Optional[str] = None,
+                           server_address: str = None) -> Dict[str, Any]:
+        return await self.client(server_address).queue_prompt(prompt, prompt_id)
+
+    async def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output",
+                        server_address: str = None) -> bytes:
+        return await self.client(server_address).get_image(filename, subfolder, folder_type)
+
+    async def get_history(self, prompt_id: str, server_address: str = None) -> Dict[str, Any]:
+        return await self.client(server_address).get_history(prompt_id)
+
+    async def get_queue_status(self, server_address: str = None) -> Dict[str, Any]:
+        if server_address or not self.backend_pool or len(self.backend_pool.backends) == 1:
+            return await self.client(server_address).get_queue_status()
+
+        addresses = [backend.address for backend in self.backend_pool.backends]
+        statuses = await asyncio.gather(
+            *(self.client(address).get_queue_status() for address in addresses),
+            return_exceptions=True
+        )
+        return {"backends": {
+            address: {"error": str(status)} if isinstance(status, Exception) else status
+            for address, status in zip(addresses, statuses)
+        }}
+
+    async def generate(self, workflow: Dict[str, Any], timeout: int = 300, use_cache: bool = True) -> GenerationResult:
+        """Generate images, deduplicating seed-pinned workflows"""
+        if not (use_cache and WorkflowUtils.has_fixed_seed(workflow)):
+            return GenerationResult(await self.generate_images(workflow, timeout))
+
+        cache_key = WorkflowUtils.workflow_hash(workflow)
+        if self.result_cache:
+            with stage('result_cache'):
+                cached = await asyncio.to_thread(self.result_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Result cache hit: {cache_key}")
+                return GenerationResult(cached, cache_hit=True)
+
+        flight = self._in_flight.get(cache_key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            self._in_flight[cache_key] = flight
+            # A task of its own, so the caller that started it can go away
+            # without failing the others
+            flight.task = asyncio.get_running_loop().create_task(
+                self._run_flight(cache_key, flight, workflow, timeout)
+            )
+            # Every caller may have given up; don't warn about an unread error
+            flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        else:
+            logger.info(f"workflow: joining in-flight call {cache_key}")
+        flight.callers += 1
+
+        # Resolved if this caller's job is cancelled, from any thread
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+        token = current_token()
+        if token is not None:
+            token.register(cancelled, lambda: loop.call_soon_threadsafe(
+                lambda: cancelled.done() or cancelled.set_result(None)
+            ))
+        try:
+            # The leader's run enforces its own deadline
+            done, _ = await asyncio.wait(
+                (flight.task, cancelled), timeout=None if leader else timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if flight.task in done:
+                return GenerationResult(flight.task.result(), coalesced=not leader)
+            if cancelled in done:
+                raise GenerationCancelled("Generation cancelled")
+            raise GenerationTimeout(f"Timed out after {timeout} seconds waiting for in-flight call")
+        finally:
+            if token is not None:
+                token.unregister(cancelled)
+            self._leave(cache_key, flight)
+
+    async def _run_flight(self, cache_key: str, flight: '_Flight', workflow: Dict[str, Any],
+                          timeout: int) -> Dict[str, List[bytes]]:
+        try:
+            # The prompt is cancelled with the flight, not with whoever started it
+            with cancellable(flight.token):
+                images = await self.generate_images(workflow, timeout)
+            if self.result_cache:
+                await asyncio.to_thread(self.result_cache.put, cache_key, images)
+            return images
+        finally:
+            if self._in_flight.get(cache_key) is flight:
+                del self._in_flight[cache_key]
+
+    def _leave(self, cache_key: str, flight: '_Flight'):
+        """Drop a caller; cancel the run once none are left"""
+        flight.callers -= 1
+        if flight.callers or flight.task.done():
+            return
+        # Later callers start a fresh run instead of joining a cancelled one
+        if self._in_flight.get(cache_key) is flight:
+            del self._in_flight[cache_key]
+        logger.info(f"workflow: every caller of {cache_key} gave up; cancelling it")
+        flight.token.cancel()
+
+    async def generate_images(self, workflow: Dict[str, Any], timeout: int = 300) -> Dict[str, List[bytes]]:
+        """Generate images using workflow"""
+        waiter = await self.submit_prompt(workflow)
+        return await self.collect_outputs(waiter, workflow, timeout)
+
+    async def submit_prompt(self, workflow: Dict[str, Any]) -> PromptWaiter:
+        """Queue a workflow on a backend and return a waiter for its completion"""
+        token = current_token()
+        if token is not None:
+            token.check()
+
+        waiter = await self._submit(workflow)
+        if waiter.cancel_token is not None:
+            # Cancellation may be requested from any thread
+            loop = asyncio.get_running_loop()
+            waiter.cancel_token.register(
+                waiter, lambda: asyncio.run_coroutine_threadsafe(self.cancel(waiter), loop)
+            )
+        return waiter
+
+    async def _submit(self, workflow: Dict[str, Any]) -> PromptWaiter:
+        if self.backend_pool is None:
+            return await self._submit_to(self.server_address, workflow)
+
+        tried = []
+        while True:
+            backend = self.backend_pool.acquire(exclude=tried)
+            try:
+                waiter = await self._submit_to(backend.address, workflow)
+            except Exception as e:
+                self.backend_pool.release(backend)
+                if not ComfyUIService._is_connection_error(e):
+                    raise
+                self.backend_pool.mark_failed(backend, e)
+                # It may come back as a fresh install without our input images
+                self.input_uploader.forget(backend.address)
+                # Try the next least-loaded backend
+                tried.append(backend.address)
+                continue
+            waiter.backend = backend
+            return waiter
+
+    async def _submit_to(self, server_address: str, workflow: Dict[str, Any]) -> PromptWaiter:
+        # Fail fast rather than waiting out the WebSocket connect timeout
+        CircuitBreaker.for_host(server_address).check()
+        client = self.client(server_address)
+        if not await client.wait_until_connected(Config.COMFYUI_WS_CONNECT_TIMEOUT):
+            raise BackendUnavailable(f"Failed to connect to ComfyUI WebSocket at {server_address}")
+
+        if self.input_uploader.referenced_images(workflow):
+            await asyncio.to_thread(self.input_uploader.ensure, server_address, workflow)
+
+        # Register before queueing so no execution message or binary output
+        # frame can arrive ahead of the waiter
+        waiter = PromptWaiter(str(uuid.uuid4()), ComfyUIService.websocket_output_nodes(workflow))
+        prompt_id = waiter.prompt_id
+        waiter.server_address = server_address
+        client.attach(waiter)
+        try:
+            result = await client.queue_prompt(workflow, prompt_id)
+        except BaseException:
+            client.unregister(prompt_id)
+            waiter.server_address = None
+            raise
+
+        if result['prompt_id'] != prompt_id:
+            # Older ComfyUI versions ignore client supplied prompt ids
+            client.rename(prompt_id, result['prompt_id'])
+        return waiter
+
+    async def collect_outputs(self, waiter: PromptWaiter, workflow: Dict[str, Any],
+                              timeout: int = 300) -> Dict[str, List[bytes]]:
+        """Wait for a submitted prompt and gather its output images"""
+        client = self.client(waiter.server_address)
+        try:
+            try:
+                await client.wait(waiter, timeout)
+            except BaseException:
+                if not waiter.future.done():
+                    # Deadline passed or the caller went away: don't leave
+                    # ComfyUI working for nobody
+                    asyncio.get_running_loop().create_task(self.cancel(waiter))
+                raise
+            finally:
+                client.unregister(waiter.prompt_id)
+                ComfyUIService._record_wait(waiter)
+
+            output_images = dict(waiter.ws_outputs)
+            if ComfyUIService.needs_history(workflow, waiter.ws_output_nodes):
+                output_images.update(await client.fetch_outputs(waiter.prompt_id, exclude=waiter.ws_output_nodes))
+            return output_images
+        finally:
+            self._release(waiter)
+
+    async def cancel(self, *waiters: PromptWaiter):
+        """Fail the waiters and remove their prompts from ComfyUI"""
+        by_server: Dict[str, List[str]] = {}
+        for waiter in waiters:
+            waiter.set_error(GenerationCancelled(f"Prompt {waiter.prompt_id} cancelled"))
+            if waiter.server_address is not None:
+                by_server.setdefault(waiter.server_address, []).append(waiter.prompt_id)
+
+        for server_address, prompt_ids in by_server.items():
+            try:
+                await self.client(server_address).interrupt(prompt_ids)
+            except Exception as e:
+                logger.warning(f"Failed to cancel prompts {prompt_ids} on {server_address}: {e}")
+
+    def _release(self, waiter: PromptWaiter):
+        if waiter.cancel_token is not None:
+            waiter.cancel_token.unregister(waiter)
+        if waiter.backend is not None and self.backend_pool is not None:
+            self.backend_pool.release(waiter.backend)
+            waiter.backend = None
@@ -0,0 +1,166 @@
+import json
+import math
+import time
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+from config.config import Config
+from services.circuit_breaker import CircuitBreaker
+from services.errors import BackendUnavailable
+from services.http_client import HTTPConnectionPool
+from services.websocket_manager import ComfyUIWebSocketManager
+
+logger = logging.getLogger(__name__)
+
+class Backend:
+    """Scheduling state of one ComfyUI server"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.healthy = True
+        self.queue_depth = 0        # running + pending, from the last /queue poll
+        self.placed_since_poll = 0  # prompts we queued that the last poll cannot know about
+        self.in_flight = 0          # prompts we placed that have not been collected yet
+        self.last_error = None
+        self.last_checked = None
+
+    @property
+    def load(self) -> int:
+        return self.queue_depth + self.placed_since_poll
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "address": self.address,
+            "state": "up" if self.healthy else "down",
+            "queue_depth": self.queue_depth,
+            "estimated_load": self.load,
+            "in_flight": self.in_flight,
+            "circuit": CircuitBreaker.for_host(self.address).state,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error
+        }
+
+class BackendPool:
+    """Least-loaded routing across ComfyUI backends with health ejection.
+
+    Background pollers refresh each backend's queue depth from /queue and
+    probe backends that were marked down until they answer again. The poll
+    bypasses the backend's circuit breaker, so it is also what closes the
+    circuit once the backend recovers.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, addresses: List[str] = None, poll_interval: float = None):
+        addresses = addresses or Config.COMFYUI_SERVERS
+        self.backends = [Backend(address) for address in addresses]
+        self.poll_interval = poll_interval or Config.BACKEND_POLL_INTERVAL
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        for backend in self.backends:
+            ComfyUIWebSocketManager.for_server(backend.address)
+        # One poller per backend, so a backend that hangs delays only its own poll
+        self._threads = [
+            threading.Thread(
+                target=self._poll_loop, args=(backend,),
+                name=f'comfyui-backend-poller-{backend.address}', daemon=True
+            )
+            for backend in self.backends
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def shared(cls) -> 'BackendPool':
+        """Return the process-wide backend pool"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self, address: str) -> Optional[Backend]:
+        for backend in self.backends:
+            if backend.address == address:
+                return backend
+        return None
+
+    def acquire(self, exclude: List[str] = ()) -> Backend:
+        """Pick the healthy backend with the shortest estimated queue"""
+        with self._lock:
+            candidates = [
+                backend for backend in self.backends
+                if backend.healthy and backend.address not in exclude
+            ]
+            if not candidates:
+                raise BackendUnavailable(
+                    "No healthy ComfyUI backend available",
+                    retry_after=max(1, math.ceil(self.poll_interval))
+                )
+            backend = min(candidates, key=lambda b: (b.load, b.in_flight))
+            self._place(backend)
+            return backend
+
+    def place(self, backend: Backend):
+        """Record a prompt placed on a backend chosen by the caller"""
+        with self._lock:
+            self._place(backend)
+
+    def _place(self, backend: Backend):
+        backend.placed_since_poll += 1
+        backend.in_flight += 1
+
+    def release(self, backend: Backend):
+        """Record that a prompt placed on a backend has been collected"""
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+
+    def mark_failed(self, backend: Backend, error: Exception):
+        """Eject a backend until the poller sees it answer again"""
+        with self._lock:
+            if backend.healthy:
+                logger.warning(f"Marking ComfyUI backend {backend.address} down: {error}")
+            backend.healthy = False
+            backend.last_error = str(error)
+        CircuitBreaker.for_host(backend.address).trip()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Per-backend state for health reporting"""
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+    def stop(self):
+        self._stopping.set()
+
+    def _poll_loop(self, backend: Backend):
+        while not self._stopping.is_set():
+            self._poll(backend)
+            self._stopping.wait(self.poll_interval)
+
+    def _poll(self, backend: Backend):
+        try:
+            _, body = HTTPConnectionPool.for_host(backend.address).request('GET', '/queue', probe=True)
+            status = json.loads(body)
+            depth = len(status.get('queue_running', [])) + len(status.get('queue_pending', []))
+        except Exception as e:
+            with self._lock:
+                if backend.healthy:
+                    logger.warning(f"ComfyUI backend {backend.address} failed health poll: {e}")
+                backend.healthy = False
+                backend.last_error = str(e)
+                backend.last_checked = time.time()
+            if CircuitBreaker.for_host(backend.address).is_open:
+                # Prompts queued there are lost if it restarts; stop waiting on them
+                ComfyUIWebSocketManager.for_server(backend.address).fail_pending(
+                    BackendUnavailable(f"ComfyUI backend {backend.address} went down: {e}")
+                )
+            return
+
+        with self._lock:
+            if not backend.healthy:
+                logger.info(f"ComfyUI backend {backend.address} is back up")
+            backend.healthy = True
+            backend.queue_depth = depth
+            backend.placed_since_poll = 0
+            backend.last_error = None
+            backend.last_checked = time.time()
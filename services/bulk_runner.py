@@ -0,0 +1,209 @@
+import json
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, Set, Tuple
+from config.config import Config
+from services.comfyui_service import ComfyUIService
+from services.errors import call_with_retries
+from utils.image_store import ImageStore
+from utils.workflow_utils import WorkflowUtils
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+class BulkRunner:
+    """Runs a JSONL file of generation requests with bounded concurrency.
+
+    Each input line is either a parameter set for a workflow template
+    ({"positive_prompt": ..., "template": ..., ...}), {"workflow": {...}} or
+    a bare API-format workflow; an optional "id" is copied to the manifest.
+    The file is read lazily and at most `concurrency` items are in flight,
+    so memory stays flat however long the file is.
+
+    Every finished item is appended to manifest.jsonl in the output folder
+    once its images are durably written. The manifest is the checkpoint:
+    a rerun over the same folder skips every line already recorded as
+    succeeded and retries the rest.
+    """
+
+    def __init__(self, input_path: str, output_dir: str, concurrency: int = 4,
+                 timeout: float = None, retries: int = 0, use_cache: bool = True,
+                 retry_failed: bool = True, fsync_interval: float = 1.0):
+        self.input_path = Path(input_path)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.concurrency = concurrency
+        self.timeout = timeout or Config.WEBSOCKET_TIMEOUT
+        self.retries = retries
+        self.use_cache = use_cache
+        self.retry_failed = retry_failed
+        self.fsync_interval = fsync_interval
+        self.service = ComfyUIService()
+        self.workflow_utils = WorkflowUtils()
+        self.store = ImageStore.for_folder(self.output_dir / 'images')
+        self.manifest_path = self.output_dir / MANIFEST_NAME
+        self._manifest = None
+        self._manifest_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._stopping = threading.Event()
+        self.counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self):
+        """Stop reading new lines; items in flight still finish and are recorded"""
+        self._stopping.set()
+
+    def run(self, progress_interval: float = 5.0) -> Dict[str, int]:
+        done = self._load_checkpoint()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        started = time.time()
+        last_report = started
+
+        self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bulk-runner') as executor:
+                for line_number, item in self._read_items():
+                    if self._stopping.is_set():
+                        break
+                    if line_number in done:
+                        self.counts["skipped"] += 1
+                        continue
+                    # Block the reader until a slot frees up
+                    while not slots.acquire(timeout=0.5):
+                        if self._stopping.is_set():
+                            break
+                    else:
+                        future = executor.submit(self._run_item, line_number, item)
+                        future.add_done_callback(lambda _: slots.release())
+
+                    if time.time() - last_report >= progress_interval:
+                        last_report = time.time()
+                        self._report(started)
+        finally:
+            with self._manifest_lock:
+                self._sync(force=True)
+                self._manifest.close()
+                self._manifest = None
+        self._report(started)
+        return dict(self.counts)
+
+    def _load_checkpoint(self) -> Set[int]:
+        """Lines already finished according to the manifest of an earlier run"""
+        done: Set[int] = set()
+        if not self.manifest_path.exists():
+            return done
+
+        valid_bytes = 0
+        with open(self.manifest_path, 'rb') as f:
+            for raw in f:
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    # Torn write from a crash; everything after it is dropped
+                    break
+                valid_bytes += len(raw)
+                if entry.get('status') == 'succeeded' or not self.retry_failed:
+                    done.add(entry['line'])
+                else:
+                    done.discard(entry['line'])
+        if valid_bytes < self.manifest_path.stat().st_size:
+            logger.warning(f"Truncating partial record at the end of {self.manifest_path}")
+            with open(self.manifest_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        if done:
+            logger.info(f"Resuming: {len(done)} items already done")
+        return done
+
+    def _read_items(self) -> Iterator[Tuple[int, Any]]:
+        with open(self.input_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, e
+
+    def _build_workflow(self, item: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(workflow, parameters to record) for one input line"""
+        if 'workflow' in item:
+            return item['workflow'], {}
+        if item and all(isinstance(node, dict) and 'class_type' in node for node in item.values()):
+            return item, {}
+        params = {key: value for key, value in item.items() if key not in ('id', 'template')}
+        return self.workflow_utils.build_workflow(item.get('template'), **params), params
+
+    def _run_item(self, line_number: int, item: Any):
+        started = time.time()
+        entry: Dict[str, Any] = {"line": line_number}
+        try:
+            if isinstance(item, Exception):
+                raise ValueError(f"Invalid JSON: {item}")
+            if not isinstance(item, dict):
+                raise ValueError("Each line must be a JSON object")
+            if 'id' in item:
+                entry["id"] = item['id']
+            workflow, params = self._build_workflow(item)
+            if not self.workflow_utils.validate_workflow(workflow):
+                raise ValueError("Invalid workflow structure")
+
+            # Only transient backend failures are retried, with jittered backoff
+            result = call_with_retries(
+                lambda: self.service.generate(workflow, self.timeout, self.use_cache),
+                attempts=self.retries + 1,
+                description=f"Line {line_number}"
+            )
+
+            images = []
+            for node_id, image_list in result.images.items():
+                for image_data in image_list:
+                    filename, path, write = self.store.put(image_data)
+                    images.append((node_id, filename, path, write))
+            for _, _, _, write in images:
+                write.result()
+
+            entry.update({
+                "status": "succeeded",
+                "parameters": params or None,
+                "cache_hit": result.cache_hit,
+                "images": [
+                    {"node_id": node_id, "filename": filename, "path": str(path.relative_to(self.output_dir))}
+                    for node_id, filename, path, _ in images
+                ]
+            })
+        except Exception as e:
+            entry.update({"status": "failed", "error": str(e)})
+        entry["duration"] = round(time.time() - started, 3)
+        self._record(entry)
+
+    def _record(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._manifest_lock:
+            self.counts[entry['status']] += 1
+            self._manifest.write(line)
+            self._sync()
+
+    def _sync(self, force: bool = False):
+        """Flush the manifest, fsyncing at most once per interval"""
+        self._manifest.flush()
+        now = time.time()
+        if force or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._manifest.fileno())
+            self._last_sync = now
+
+    def _report(self, started: float):
+        elapsed = max(time.time() - started, 1e-6)
+        finished = self.counts["succeeded"] + self.counts["failed"]
+        logger.info(
+            f"{self.counts['succeeded']} succeeded, {self.counts['failed']} failed, "
+            f"{self.counts['skipped']} skipped ({finished / elapsed:.1f} items/s)"
+        )
@@ -0,0 +1,66 @@
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar('cancellation_token', default=None)
+
+class GenerationCancelled(Exception):
+    """The request was cancelled before it finished"""
+
+class CancellationToken:
+    """Cancellation signal for one job.
+
+    Work started on the job's behalf (queued prompts, admission tickets)
+    registers a callback that undoes it; cancel() runs them all once.
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[Any, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def register(self, owner: Any, callback: Callable[[], None]):
+        """Run callback on cancellation, immediately if already cancelled"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks[owner] = callback
+                return
+        callback()
+
+    def unregister(self, owner: Any):
+        with self._lock:
+            self._callbacks.pop(owner, None)
+
+    def check(self):
+        """Raise GenerationCancelled if the token has been cancelled"""
+        if self.cancelled:
+            raise GenerationCancelled("Generation cancelled")
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+def current_token() -> Optional[CancellationToken]:
+    """Cancellation token of the job running in the calling context"""
+    return _current_token.get()
+
+@contextmanager
+def cancellable(token: CancellationToken):
+    """Make work started inside the block cancellable through the token"""
+    reset = _current_token.set(token)
+    try:
+        yield
+    finally:
+        _current_token.reset(reset)
@@ -0,0 +1,117 @@
+import math
+import time
+import threading
+import logging
+from typing import Dict, Any
+from config.config import Config
+from services.errors import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Fails calls to a backend fast while it is known to be down.
+
+    Closed: calls go through; CIRCUIT_FAILURE_THRESHOLD consecutive
+    connection failures open the circuit. Open: calls raise CircuitOpen
+    without touching the network. After CIRCUIT_RESET_TIMEOUT one trial call
+    is let through (half-open) and its outcome closes or re-opens the
+    circuit. A successful background health probe closes it at any time.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _breakers: Dict[str, 'CircuitBreaker'] = {}
+    _breakers_lock = threading.Lock()
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else Config.CIRCUIT_RESET_TIMEOUT
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host: str) -> 'CircuitBreaker':
+        """Return the shared breaker for a backend, creating it on first use"""
+        with cls._breakers_lock:
+            breaker = cls._breakers.get(host)
+            if breaker is None:
+                breaker = cls(host)
+                cls._breakers[host] = breaker
+            return breaker
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may be made now"""
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.time()
+            if self.state == CircuitBreaker.OPEN and remaining <= 0:
+                # Let exactly one trial through
+                self.state = CircuitBreaker.HALF_OPEN
+                return
+            self.rejected += 1
+        raise CircuitOpen(
+            f"ComfyUI backend {self.name} is unavailable",
+            retry_after=max(1, math.ceil(remaining))
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == CircuitBreaker.OPEN
+
+    def check(self):
+        """Raise CircuitOpen while the circuit is open, without claiming the trial call"""
+        with self._lock:
+            if self.state != CircuitBreaker.OPEN:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.time()
+            if remaining <= 0:
+                return
+            self.rejected += 1
+        raise CircuitOpen(
+            f"ComfyUI backend {self.name} is unavailable",
+            retry_after=max(1, math.ceil(remaining))
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or (
+                self.state == CircuitBreaker.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self._open()
+
+    def trip(self):
+        """Open the circuit now, e.g. when the backend was ejected from the pool"""
+        with self._lock:
+            if self.state != CircuitBreaker.OPEN:
+                self._open()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at,
+                "rejected": self.rejected
+            }
+
+    def _open(self):
+        if self.state == CircuitBreaker.CLOSED:
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+        self.state = CircuitBreaker.OPEN
+        self.opened_at = time.time()
@@ -1,62 +1,125 @@
-import websocket
-import uuid
 import json
-import urllib.request
+import time
+import uuid
 import urllib.parse
 import logging
-import time
-from typing import Dict, Any, Optional, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Iterable
 from config.config import Config
+from services.backend_pool import BackendPool, Backend
+from services.cancellation import GenerationCancelled, current_token
+from services.circuit_breaker import CircuitBreaker
+from services.event_loop import EventLoopThread
+from services.errors import (
+    BackendHTTPError, BackendUnavailable, ComfyUIError, PromptRejected, call_with_retries
+)
+from services.http_client import HTTPConnectionPool
+from services.input_uploader import InputImageUploader
+from services.metrics import BYTES_TRANSFERRED, record_stage, stage
+from services.micro_batcher import MicroBatcher
+from services.model_scheduler import ModelAffinityScheduler
+from services.result_cache import ResultCache
+from services.single_flight import SingleFlight
+from services.websocket_manager import ComfyUIWebSocketManager, PromptWaiter
+from utils.workflow_utils import WorkflowUtils
 
 logger = logging.getLogger(__name__)
 
+# Output nodes that stream images as binary WebSocket frames
+WEBSOCKET_OUTPUT_CLASSES = ('SaveImageWebsocket',)
+
+# Output nodes whose images are stored server-side and listed in /history
+HISTORY_OUTPUT_CLASSES = ('SaveImage', 'PreviewImage')
+
+@dataclass
+class GenerationResult:
+    """Outputs of a generation plus how they were obtained"""
+    images: Dict[str, List[bytes]]
+    cache_hit: bool = False
+    coalesced: bool = False
+    # Set when the request ran as part of a packed latent batch
+    packing: Optional[Dict[str, Any]] = None
+
 class ComfyUIService:
+    # Bounded pool shared by all instances for parallel /view downloads
+    _fetch_pool = None
+    _fetch_executor_lock = threading.Lock()
+    
+    # Identical seed-pinned workflows running concurrently share one prompt
+    in_flight = SingleFlight('workflow')
+    
+    # Model-affinity dispatch queue shared by all pool-backed instances
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+    
     def __init__(self, server_address: str = None):
-        self.server_address = server_address or Config.COMFYUI_SERVER
-        self.client_id = str(uuid.uuid4())
-        self.ws = None
+        # An explicit address pins the service to one server; otherwise
+        # prompts are routed across the configured backend pool
+        self.backend_pool = None if server_address else BackendPool.shared()
+        self.server_address = server_address or self.backend_pool.backends[0].address
+        self.ws_manager = ComfyUIWebSocketManager.for_server(self.server_address)
+        self.client_id = self.ws_manager.client_id
+        self.http = HTTPConnectionPool.for_host(self.server_address)
+        self.result_cache = ResultCache.shared() if Config.RESULT_CACHE_ENABLED else None
+        self.input_uploader = InputImageUploader.shared()
+        self.micro_batcher = (
+            MicroBatcher.for_server(server_address or 'pool', self.generate_images)
+            if Config.MICRO_BATCH_ENABLED else None
+        )
+        self.scheduler = (
+            self._shared_scheduler()
+            if Config.MODEL_SCHEDULER_ENABLED and self.backend_pool else None
+        )
+        self._async_service = None
         
-    def connect_websocket(self):
-        """Establish WebSocket connection to ComfyUI"""
-        try:
-            self.ws = websocket.WebSocket()
-            ws_url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
-            self.ws.connect(ws_url)
-            logger.info(f"Connected to ComfyUI WebSocket: {ws_url}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to connect to ComfyUI WebSocket: {e}")
-            return False
+    def _shared_scheduler(self) -> ModelAffinityScheduler:
+        with ComfyUIService._scheduler_lock:
+            if ComfyUIService._scheduler is None:
+                ComfyUIService._scheduler = ModelAffinityScheduler(self.backend_pool, self._dispatch_scheduled)
+            return ComfyUIService._scheduler
     
-    def disconnect_websocket(self):
-        """Close WebSocket connection"""
-        if self.ws:
-            try:
-                self.ws.close()
-                logger.info("WebSocket connection closed")
-            except Exception as e:
-                logger.error(f"Error closing WebSocket: {e}")
+    def connect_websocket(self, timeout: float = None, server_address: str = None) -> bool:
+        """Ensure the shared WebSocket connection to ComfyUI is up"""
+        server_address = server_address or self.server_address
+        timeout = timeout if timeout is not None else Config.COMFYUI_WS_CONNECT_TIMEOUT
+        if ComfyUIWebSocketManager.for_server(server_address).wait_until_connected(timeout):
+            return True
+        logger.error(f"Failed to connect to ComfyUI WebSocket at {server_address}")
+        return False
     
-    def queue_prompt(self, prompt: Dict[str, Any]) -> Dict[str, Any]:
+    def queue_prompt(self, prompt: Dict[str, Any], prompt_id: Optional[str] = None,
+                     server_address: str = None) -> Dict[str, Any]:
         """Queue a prompt for processing"""
+        server_address = server_address or self.server_address
         try:
-            payload = {"prompt": prompt, "client_id": self.client_id}
+            client_id = ComfyUIWebSocketManager.for_server(server_address).client_id
+            payload = {"prompt": prompt, "client_id": client_id}
+            if prompt_id:
+                payload["prompt_id"] = prompt_id
             data = json.dumps(payload).encode('utf-8')
             
-            url = f"http://{self.server_address}/prompt"
-            req = urllib.request.Request(url, data=data)
-            req.add_header('Content-Type', 'application/json')
-            
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read())
-                logger.info(f"Prompt queued successfully: {result.get('prompt_id')}")
-                return result
+            with stage('submit'):
+                result = json.loads(HTTPConnectionPool.for_host(server_address).post_json('/prompt', data))
+            logger.info(f"Prompt queued successfully on {server_address}: {result.get('prompt_id')}")
+            return result
                 
+        except BackendHTTPError as e:
+            logger.error(f"Failed to queue prompt: {e}")
+            if e.http_status == 400:
+                # Not retried: the workflow itself failed ComfyUI's validation
+                raise PromptRejected(f"ComfyUI rejected the prompt: {e.body[:500].decode('utf-8', 'replace')}") from e
+            raise
+        except ComfyUIError as e:
+            logger.error(f"Failed to queue prompt: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to queue prompt: {e}")
-            raise Exception(f"Failed to queue prompt: {e}")
+            raise ComfyUIError(f"Failed to queue prompt: {e}") from e
     
-    def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
+    def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output",
+                  server_address: str = None) -> bytes:
         """Retrieve generated image"""
         try:
             data = {
@@ -65,83 +128,347 @@ class ComfyUIService:
                 "type": folder_type
             }
             url_values = urllib.parse.urlencode(data)
-            url = f"http://{self.server_address}/view?{url_values}"
-            
-            with urllib.request.urlopen(url) as response:
-                return response.read()
+            http = HTTPConnectionPool.for_host(server_address or self.server_address)
+            image_data = call_with_retries(lambda: http.get(f"/view?{url_values}"), description=f"GET /view {filename}")
+            BYTES_TRANSFERRED.inc(len(image_data), 'comfyui_download')
+            return image_data
                 
+        except ComfyUIError as e:
+            logger.error(f"Failed to get image {filename}: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to get image {filename}: {e}")
-            raise Exception(f"Failed to get image: {e}")
+            raise ComfyUIError(f"Failed to get image: {e}") from e
     
-    def get_history(self, prompt_id: str) -> Dict[str, Any]:
+    def get_history(self, prompt_id: str, server_address: str = None) -> Dict[str, Any]:
         """Get generation history for a prompt ID"""
         try:
-            url = f"http://{self.server_address}/history/{prompt_id}"
-            with urllib.request.urlopen(url) as response:
-                return json.loads(response.read())
+            http = HTTPConnectionPool.for_host(server_address or self.server_address)
+            with stage('history'):
+                body = call_with_retries(lambda: http.get(f"/history/{prompt_id}"), description=f"GET /history/{prompt_id}")
+            return json.loads(body)
+        except ComfyUIError as e:
+            logger.error(f"Failed to get history for {prompt_id}: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to get history for {prompt_id}: {e}")
-            raise Exception(f"Failed to get history: {e}")
+            raise ComfyUIError(f"Failed to get history: {e}") from e
     
-    def get_queue_status(self) -> Dict[str, Any]:
+    def get_queue_status(self, server_address: str = None) -> Dict[str, Any]:
         """Get current queue status"""
+        if not server_address and self.backend_pool and len(self.backend_pool.backends) > 1:
+            return {"backends": self._queue_status_per_backend()}
+        
         try:
-            url = f"http://{self.server_address}/queue"
-            with urllib.request.urlopen(url) as response:
-                return json.loads(response.read())
+            http = HTTPConnectionPool.for_host(server_address or self.server_address)
+            return json.loads(call_with_retries(lambda: http.get("/queue"), description="GET /queue"))
+        except ComfyUIError as e:
+            logger.error(f"Failed to get queue status: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to get queue status: {e}")
-            raise Exception(f"Failed to get queue status: {e}")
+            raise ComfyUIError(f"Failed to get queue status: {e}") from e
+    
+    def _queue_status_per_backend(self) -> Dict[str, Any]:
+        statuses = {}
+        for backend in self.backend_pool.backends:
+            try:
+                statuses[backend.address] = self.get_queue_status(backend.address)
+            except Exception as e:
+                statuses[backend.address] = {"error": str(e)}
+        return statuses
+    
+    def generate(self, workflow: Dict[str, Any], timeout: int = 300, use_cache: bool = True) -> GenerationResult:
+        """Generate images, deduplicating seed-pinned workflows.
+        
+        Repeats are served from the result cache, and identical requests
+        arriving while one is running attach to that run instead of queueing
+        another prompt.
+        """
+        if not (use_cache and WorkflowUtils.has_fixed_seed(workflow)):
+            return self._execute(workflow, timeout)
+        
+        cache_key = WorkflowUtils.workflow_hash(workflow)
+        if self.result_cache:
+            with stage('result_cache'):
+                cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Result cache hit: {cache_key}")
+                return GenerationResult(cached, cache_hit=True)
+        
+        if self.micro_batcher and self.micro_batcher.accepts(workflow):
+            # A packed run renders every request with the first requester's
+            # seed, so its shares must neither be shared nor cached as the
+            # result of this exact workflow
+            return self._execute_and_store(cache_key, workflow, timeout)
+        
+        result, shared = self.in_flight.do(
+            cache_key,
+            lambda: self._execute_and_store(cache_key, workflow, timeout),
+            timeout
+        )
+        return GenerationResult(result.images, coalesced=shared, packing=result.packing)
+    
+    def _execute_and_store(self, cache_key: str, workflow: Dict[str, Any], timeout: int) -> GenerationResult:
+        result = self._execute(workflow, timeout)
+        if self.result_cache and (result.packing is None or result.packing['requests'] == 1):
+            # A request packed alone ran with its own seed
+            self.result_cache.put(cache_key, result.images)
+        return result
+    
+    def _execute(self, workflow: Dict[str, Any], timeout: int) -> GenerationResult:
+        """Run a workflow, packing it with compatible requests when enabled"""
+        if not (self.micro_batcher and self.micro_batcher.accepts(workflow)):
+            return GenerationResult(self.generate_images(workflow, timeout))
+        
+        packed = self.micro_batcher.submit(workflow, timeout)
+        return GenerationResult(packed.images, packing={
+            "requests": packed.packed,
+            "batch_index": packed.batch_index,
+            "seed": packed.seed
+        })
+    
+    @property
+    def async_service(self):
+        """The asyncio service this one hands prompts to when COMFYUI_ASYNC_CLIENT is on"""
+        if self._async_service is None:
+            # Imported lazily: aiohttp is only needed with the async client
+            from services.async_comfyui import AsyncComfyUIService
+            self._async_service = AsyncComfyUIService(None if self.backend_pool else self.server_address)
+        return self._async_service
     
     def generate_images(self, workflow: Dict[str, Any], timeout: int = 300) -> Dict[str, List[bytes]]:
         """Generate images using workflow"""
-        if not self.connect_websocket():
-            raise Exception("Failed to connect to ComfyUI WebSocket")
+        if Config.COMFYUI_ASYNC_CLIENT and self.scheduler is None:
+            # Wait on the shared event loop instead of a WebSocket reader thread per backend
+            return EventLoopThread.shared().run(self.async_service.generate_images(workflow, timeout))
+        waiter = self.submit_prompt(workflow)
+        return self.collect_outputs(waiter, workflow, timeout)
+    
+    def submit_prompt(self, workflow: Dict[str, Any]) -> PromptWaiter:
+        """Queue a workflow on a backend and return a waiter for its completion.
+        
+        Inside a cancellable job the prompt is removed from ComfyUI again
+        when the job is cancelled.
+        """
+        token = current_token()
+        if token is not None:
+            token.check()
         
+        waiter = self._submit(workflow)
+        if waiter.cancel_token is not None:
+            waiter.cancel_token.register(waiter, lambda: self.cancel(waiter))
+        return waiter
+    
+    def _submit(self, workflow: Dict[str, Any]) -> PromptWaiter:
+        if self.scheduler is not None:
+            # Dispatched later by the scheduler; the waiter resolves either way
+            waiter = PromptWaiter(str(uuid.uuid4()), self.websocket_output_nodes(workflow))
+            self.scheduler.enqueue(waiter, workflow)
+            return waiter
+        
+        if self.backend_pool is None:
+            return self._submit_to(self.server_address, workflow)
+        
+        tried = []
+        while True:
+            backend = self.backend_pool.acquire(exclude=tried)
+            try:
+                return self._submit_to_backend(backend, workflow)
+            except BackendUnavailable:
+                # Try the next least-loaded backend
+                tried.append(backend.address)
+    
+    def _submit_to_backend(self, backend: Backend, workflow: Dict[str, Any],
+                           waiter: Optional[PromptWaiter] = None) -> PromptWaiter:
+        """Submit to a backend already placed in the pool, ejecting it if unreachable"""
         try:
-            # Queue the prompt
-            result = self.queue_prompt(workflow)
-            prompt_id = result['prompt_id']
-            
-            # Wait for completion
-            output_images = {}
-            start_time = time.time()
-            
-            while True:
-                if time.time() - start_time > timeout:
-                    raise Exception(f"Generation timeout after {timeout} seconds")
-                
-                try:
-                    out = self.ws.recv()
-                    if isinstance(out, str):
-                        message = json.loads(out)
-                        if message['type'] == 'executing':
-                            data = message['data']
-                            if data['node'] is None and data['prompt_id'] == prompt_id:
-                                break
-                except websocket.WebSocketTimeoutError:
-                    continue
-                except Exception as e:
-                    logger.warning(f"WebSocket receive error: {e}")
-                    continue
-            
-            # Get the generated images
-            history = self.get_history(prompt_id)[prompt_id]
-            for node_id in history['outputs']:
-                node_output = history['outputs'][node_id]
-                images_output = []
-                if 'images' in node_output:
-                    for image in node_output['images']:
-                        image_data = self.get_image(
-                            image['filename'],
-                            image['subfolder'],
-                            image['type']
-                        )
-                        images_output.append(image_data)
-                output_images[node_id] = images_output
+            waiter = self._submit_to(backend.address, workflow, waiter)
+        except Exception as e:
+            self.backend_pool.release(backend)
+            if not self._is_connection_error(e):
+                raise
+            self.backend_pool.mark_failed(backend, e)
+            # It may come back as a fresh install without our input images
+            self.input_uploader.forget(backend.address)
+            if isinstance(e, BackendUnavailable):
+                raise
+            raise BackendUnavailable(str(e)) from e
+        waiter.backend = backend
+        return waiter
+    
+    def _dispatch_scheduled(self, backend: Backend, waiter: PromptWaiter, workflow: Dict[str, Any]):
+        self.backend_pool.place(backend)
+        self._submit_to_backend(backend, workflow, waiter)
+        if waiter.future.done():
+            # Cancelled while being dispatched; take it back out of ComfyUI
+            self.cancel(waiter)
+    
+    def _submit_to(self, server_address: str, workflow: Dict[str, Any],
+                   waiter: Optional[PromptWaiter] = None) -> PromptWaiter:
+        # Fail fast rather than waiting out the WebSocket connect timeout
+        CircuitBreaker.for_host(server_address).check()
+        if not self.connect_websocket(server_address=server_address):
+            raise BackendUnavailable(f"Failed to connect to ComfyUI WebSocket at {server_address}")
+        
+        # Input images go only to the backend that runs the prompt, once
+        self.input_uploader.ensure(server_address, workflow)
+        
+        # Register before queueing so no execution message or binary output
+        # frame can arrive ahead of the waiter
+        ws_manager = ComfyUIWebSocketManager.for_server(server_address)
+        if waiter is None:
+            waiter = PromptWaiter(str(uuid.uuid4()), self.websocket_output_nodes(workflow))
+        prompt_id = waiter.prompt_id
+        waiter.server_address = server_address
+        ws_manager.attach(waiter)
+        try:
+            result = self.queue_prompt(workflow, prompt_id, server_address)
+        except Exception:
+            ws_manager.unregister(prompt_id)
+            waiter.server_address = None
+            raise
+        
+        if result['prompt_id'] != prompt_id:
+            # Older ComfyUI versions ignore client supplied prompt ids
+            ws_manager.rename(prompt_id, result['prompt_id'])
+        return waiter
+    
+    @staticmethod
+    def _is_connection_error(error: Exception) -> bool:
+        return isinstance(error, (BackendUnavailable, OSError)) or isinstance(error.__cause__, OSError)
+    
+    def collect_outputs(self, waiter: PromptWaiter, workflow: Dict[str, Any], timeout: int = 300) -> Dict[str, List[bytes]]:
+        """Wait for a submitted prompt and gather its output images"""
+        try:
+            try:
+                waiter.wait(timeout)
+            except Exception:
+                if not waiter.future.done():
+                    # Deadline passed: don't leave ComfyUI working for nobody
+                    self.cancel(waiter)
+                raise
+            finally:
+                self._untrack(waiter)
+                self._record_wait(waiter)
             
+            output_images = dict(waiter.ws_outputs)
+            if self.needs_history(workflow, waiter.ws_output_nodes):
+                output_images.update(self.fetch_outputs(
+                    waiter.prompt_id,
+                    exclude=waiter.ws_output_nodes,
+                    server_address=waiter.server_address
+                ))
             return output_images
-            
         finally:
-            self.disconnect_websocket()
+            self._release(waiter)
+    
+    @staticmethod
+    def _record_wait(waiter: PromptWaiter):
+        """Split the time spent waiting on ComfyUI into queueing and execution"""
+        finished = waiter.finished_at or time.time()
+        started = waiter.started_at or waiter.submitted_at
+        if waiter.started_at is not None:
+            record_stage('queue_wait', max(0.0, started - waiter.submitted_at))
+        record_stage('execution', max(0.0, finished - started))
+    
+    def abandon(self, waiter: PromptWaiter):
+        """Stop tracking a submitted prompt without collecting its outputs"""
+        if not waiter.future.done():
+            self.cancel(waiter)
+        self._untrack(waiter)
+        self._release(waiter)
+    
+    def cancel(self, *waiters: PromptWaiter):
+        """Fail the waiters and remove their prompts from ComfyUI.
+        
+        Prompts still queued are deleted from the queue; one already running
+        on its backend is interrupted.
+        """
+        by_server: Dict[str, List[str]] = {}
+        for waiter in waiters:
+            waiter.set_error(GenerationCancelled(f"Prompt {waiter.prompt_id} cancelled"))
+            if waiter.server_address is not None:
+                by_server.setdefault(waiter.server_address, []).append(waiter.prompt_id)
+        
+        for server_address, prompt_ids in by_server.items():
+            try:
+                http = HTTPConnectionPool.for_host(server_address)
+                http.post_json('/queue', json.dumps({"delete": prompt_ids}).encode('utf-8'))
+                status = json.loads(http.get('/queue'))
+                running = {item[1] for item in status.get('queue_running', [])}
+                for prompt_id in running.intersection(prompt_ids):
+                    http.post_json('/interrupt', json.dumps({"prompt_id": prompt_id}).encode('utf-8'))
+                    logger.info(f"Interrupted running prompt {prompt_id} on {server_address}")
+            except Exception as e:
+                logger.warning(f"Failed to cancel prompts {prompt_ids} on {server_address}: {e}")
+    
+    def _untrack(self, waiter: PromptWaiter):
+        if waiter.server_address is None:
+            # Still waiting in the local scheduling queue
+            if self.scheduler is not None:
+                self.scheduler.discard(waiter)
+            return
+        ComfyUIWebSocketManager.for_server(waiter.server_address).unregister(waiter.prompt_id)
+    
+    def _release(self, waiter: PromptWaiter):
+        if waiter.cancel_token is not None:
+            waiter.cancel_token.unregister(waiter)
+        if waiter.backend is not None and self.backend_pool is not None:
+            self.backend_pool.release(waiter.backend)
+            waiter.backend = None
+    
+    @staticmethod
+    def websocket_output_nodes(workflow: Dict[str, Any]) -> List[str]:
+        """Ids of nodes that push their images over the WebSocket"""
+        return [
+            node_id for node_id, node in workflow.items()
+            if node.get('class_type') in WEBSOCKET_OUTPUT_CLASSES
+        ]
+    
+    @staticmethod
+    def needs_history(workflow: Dict[str, Any], ws_nodes: Iterable[str]) -> bool:
+        """Whether outputs must be fetched through /history and /view"""
+        if not ws_nodes:
+            return True
+        return any(
+            node.get('class_type') in HISTORY_OUTPUT_CLASSES
+            for node_id, node in workflow.items()
+            if node_id not in ws_nodes
+        )
+    
+    def fetch_outputs(self, prompt_id: str, exclude: Iterable[str] = (),
+                      server_address: str = None) -> Dict[str, List[bytes]]:
+        """Download all output images of a finished prompt in parallel"""
+        history = self.get_history(prompt_id, server_address)[prompt_id]
+        
+        pending = {}
+        for node_id, node_output in history['outputs'].items():
+            if node_id in exclude:
+                continue
+            pending[node_id] = [
+                self._fetch_executor().submit(
+                    self.get_image,
+                    image['filename'],
+                    image['subfolder'],
+                    image['type'],
+                    server_address
+                )
+                for image in node_output.get('images', [])
+            ]
+        
+        with stage('view'):
+            return {
+                node_id: [future.result() for future in futures]
+                for node_id, futures in pending.items()
+            }
+    
+    @classmethod
+    def _fetch_executor(cls) -> ThreadPoolExecutor:
+        with cls._fetch_executor_lock:
+            if cls._fetch_pool is None:
+                cls._fetch_pool = ThreadPoolExecutor(
+                    max_workers=Config.COMFYUI_FETCH_WORKERS,
+                    thread_name_prefix='comfyui-fetch'
+                )
+            return cls._fetch_pool
@@ -0,0 +1,93 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+class ComfyUIError(Exception):
+    """Base class for failures talking to ComfyUI.
+
+    status is the HTTP status the API answers with; retryable says whether
+    the same call may succeed if repeated.
+    """
+
+    status = 502
+    retryable = False
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class BackendUnavailable(ComfyUIError):
+    """The backend could not be reached"""
+
+    status = 503
+    retryable = True
+
+class BackendTimeout(BackendUnavailable):
+    """The backend accepted the connection but did not answer in time"""
+
+    status = 504
+
+class CircuitOpen(BackendUnavailable):
+    """Call refused locally because the backend is known to be down"""
+
+    retryable = False
+
+class BackendHTTPError(ComfyUIError):
+    """The backend answered with an HTTP error status"""
+
+    def __init__(self, message: str, http_status: int, body: bytes = b''):
+        super().__init__(message)
+        self.http_status = http_status
+        self.body = body
+        self.retryable = http_status in (429, 502, 503, 504)
+
+class PromptRejected(ComfyUIError):
+    """ComfyUI refused the workflow, e.g. failed node validation"""
+
+    status = 400
+
+class ExecutionFailed(ComfyUIError):
+    """The prompt was accepted but failed or was interrupted while running"""
+
+class GenerationTimeout(ComfyUIError):
+    """The prompt did not finish within the request's deadline"""
+
+    status = 504
+
+def call_with_retries(work: Callable[[], Any], attempts: int = None, base_delay: float = None,
+                      max_delay: float = None, description: str = 'ComfyUI call') -> Any:
+    """Run an idempotent call, retrying transient failures with full-jitter backoff"""
+    attempts = attempts or Config.COMFYUI_RETRY_ATTEMPTS
+    base_delay = base_delay if base_delay is not None else Config.COMFYUI_RETRY_BASE_DELAY
+    max_delay = max_delay if max_delay is not None else Config.COMFYUI_RETRY_MAX_DELAY
+    for attempt in range(attempts):
+        try:
+            return work()
+        except ComfyUIError as e:
+            if not e.retryable or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"{description} failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+async def call_with_retries_async(work: Callable[[], Awaitable[Any]], attempts: int = None,
+                                  base_delay: float = None, max_delay: float = None,
+                                  description: str = 'ComfyUI call') -> Any:
+    """call_with_retries for coroutines; backs off without blocking the event loop"""
+    attempts = attempts or Config.COMFYUI_RETRY_ATTEMPTS
+    base_delay = base_delay if base_delay is not None else Config.COMFYUI_RETRY_BASE_DELAY
+    max_delay = max_delay if max_delay is not None else Config.COMFYUI_RETRY_MAX_DELAY
+    for attempt in range(attempts):
+        try:
+            return await work()
+        except ComfyUIError as e:
+            if not e.retryable or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(f"{description} failed ({e}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,90 @@
+import asyncio
+import contextvars
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+class EventLoopThread:
+    """One asyncio event loop running in a daemon thread.
+
+    Lets synchronous code (Flask handlers, worker threads) hand coroutines
+    to the shared loop. The caller's context variables travel with the
+    coroutine, so request timings, progress channels and cancellation
+    tokens behave as if the work ran in the calling thread.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='comfyui-event-loop', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls) -> 'EventLoopThread':
+        """Return the process-wide event loop thread"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def adopt(cls, loop: asyncio.AbstractEventLoop) -> 'EventLoopThread':
+        """Share a loop already run by an async server instead of starting one"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = cls.__new__(cls)
+                instance.loop = loop
+                instance._thread = None
+                cls._instance = instance
+            return cls._instance
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop from another thread"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("submit() called from the event loop; await the coroutine instead")
+        future: Future = Future()
+        context = contextvars.copy_context()
+
+        def start():
+            # Tasks copy the context current at creation, so create it inside the caller's
+            task = context.run(self.loop.create_task, coro)
+            task.add_done_callback(lambda done: self._settle(future, done))
+
+            def cancel_task(f: Future):
+                if f.cancelled():
+                    self.loop.call_soon_threadsafe(task.cancel)
+            future.add_done_callback(cancel_task)
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block until it finishes"""
+        return self.submit(coro).result(timeout)
+
+    def in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    @staticmethod
+    def _settle(future: Future, task: asyncio.Task):
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
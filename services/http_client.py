@@ -0,0 +1,142 @@
+import http.client
+import queue
+import socket
+import threading
+import logging
+from typing import Dict, Any, Optional, Tuple
+from config.config import Config
+from services.circuit_breaker import CircuitBreaker
+from services.errors import BackendHTTPError, BackendTimeout, BackendUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean a reused keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+# Safe to send again when a response was lost; POST /prompt would queue twice
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+class HTTPConnectionPool:
+    """Bounded pool of persistent HTTP/1.1 connections to one host"""
+
+    _pools: Dict[str, 'HTTPConnectionPool'] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, host: str, pool_size: int = None, timeout: float = None):
+        self.host = host
+        self.pool_size = pool_size or Config.COMFYUI_HTTP_POOL_SIZE
+        self.timeout = timeout or Config.COMFYUI_HTTP_TIMEOUT
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self.breaker = CircuitBreaker.for_host(host)
+
+    @classmethod
+    def for_host(cls, host: str) -> 'HTTPConnectionPool':
+        """Return the shared pool for a host, creating it on first use"""
+        with cls._pools_lock:
+            pool = cls._pools.get(host)
+            if pool is None:
+                pool = cls(host)
+                cls._pools[host] = pool
+            return pool
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, probe: bool = False) -> Tuple[int, bytes]:
+        """Send a request over a pooled connection and return (status, body).
+        
+        Fails fast with CircuitOpen while the host's circuit is open; health
+        probes pass probe=True to get through and close it again.
+        """
+        headers = headers or {}
+        if not self._slots.acquire(timeout=self.timeout):
+            raise BackendTimeout(f"No free HTTP connection to {self.host} after {self.timeout}s")
+
+        try:
+            if not probe:
+                self.breaker.before_call()
+            try:
+                status, data = self._exchange(method, path, body, headers)
+            except socket.timeout as e:
+                self.breaker.record_failure()
+                raise BackendTimeout(f"{method} {self.host}{path} timed out after {self.timeout}s") from e
+            except (OSError, http.client.HTTPException) as e:
+                self.breaker.record_failure()
+                raise BackendUnavailable(f"{method} {self.host}{path} failed: {e}") from e
+
+            self.breaker.record_success()
+            if status >= 400:
+                raise BackendHTTPError(f"HTTP {status} from {self.host}{path}: {data[:200]!r}", status, data)
+            return status, data
+
+        finally:
+            self._slots.release()
+
+    def _exchange(self, method: str, path: str, body: Optional[bytes],
+                  headers: Dict[str, str]) -> Tuple[int, bytes]:
+        conn, reused = self._checkout()
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            sent = True
+            status, data = self._receive(conn)
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            # Once the whole request went out the server may have acted on it
+            if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+            # The server dropped an idle keep-alive connection; retry on a new one
+            conn = self._new_connection()
+            try:
+                status, data = self._send(conn, method, path, body, headers)
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        self._idle.put(conn)
+        return status, data
+
+    def get(self, path: str) -> bytes:
+        """GET a path and return the response body"""
+        return self.request('GET', path)[1]
+
+    def post_json(self, path: str, data: bytes) -> bytes:
+        """POST a JSON payload and return the response body"""
+        return self.request('POST', path, data, {'Content-Type': 'application/json'})[1]
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _checkout(self) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def _send(self, conn: http.client.HTTPConnection, method: str, path: str,
+              body: Optional[bytes], headers: Dict[str, Any]) -> Tuple[int, bytes]:
+        conn.request(method, path, body=body, headers=headers)
+        return self._receive(conn)
+
+    @staticmethod
+    def _receive(conn: http.client.HTTPConnection) -> Tuple[int, bytes]:
+        response = conn.getresponse()
+        data = response.read()
+        if response.will_close:
+            conn.close()
+        return response.status, data
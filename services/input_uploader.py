@@ -0,0 +1,105 @@
+import json
+import uuid
+import threading
+import logging
+from typing import Dict, Any, List, Set
+from config.config import Config
+from services.http_client import HTTPConnectionPool
+from services.metrics import BYTES_TRANSFERRED, stage
+from services.single_flight import SingleFlight
+from utils.upload_store import UploadStore
+
+logger = logging.getLogger(__name__)
+
+class InputImageUploader:
+    """Copies uploaded input images to the backend a prompt is dispatched to.
+
+    Each backend's ComfyUI input folder is tracked by content hash, so an
+    image is sent to a backend at most once no matter how many prompts use
+    it; concurrent prompts needing the same image share one upload.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, store: UploadStore = None):
+        self.store = store or UploadStore.for_folder(Config.UPLOAD_FOLDER)
+        self._known: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.in_flight = SingleFlight('input-upload')
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.skipped = 0
+
+    @classmethod
+    def shared(cls) -> 'InputImageUploader':
+        """Return the process-wide input image uploader"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def referenced_images(self, workflow: Dict[str, Any]) -> List[str]:
+        """Uploaded images the workflow's nodes refer to by name"""
+        names = []
+        for node in workflow.values():
+            for value in node.get('inputs', {}).values():
+                if isinstance(value, str) and value not in names and self.store.resolve(value):
+                    names.append(value)
+        return names
+
+    def ensure(self, server_address: str, workflow: Dict[str, Any]):
+        """Make every uploaded image the workflow uses available on the server"""
+        for filename in self.referenced_images(workflow):
+            with self._lock:
+                known = filename in self._known.get(server_address, ())
+                if known:
+                    self.skipped += 1
+            if not known:
+                self.in_flight.do(f"{server_address}/{filename}", lambda: self._upload(server_address, filename))
+
+    def forget(self, server_address: str):
+        """Assume the server has none of our images, e.g. after it restarted"""
+        with self._lock:
+            self._known.pop(server_address, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "uploaded_bytes": self.uploaded_bytes,
+                "skipped": self.skipped,
+                "known": {address: len(names) for address, names in self._known.items()}
+            }
+
+    def _upload(self, server_address: str, filename: str):
+        with self._lock:
+            if filename in self._known.get(server_address, ()):
+                return
+        path = self.store.resolve(filename)
+        if path is None:
+            raise FileNotFoundError(f"Input image not found: {filename}")
+
+        image_data = path.read_bytes()
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            f'--{boundary}\r\nContent-Disposition: form-data; name="overwrite"\r\n\r\ntrue\r\n'.encode(),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode(),
+            image_data,
+            f'\r\n--{boundary}--\r\n'.encode()
+        ])
+        http = HTTPConnectionPool.for_host(server_address)
+        with stage('input_upload'):
+            result = json.loads(http.request(
+                'POST', '/upload/image', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+            )[1])
+        BYTES_TRANSFERRED.inc(len(image_data), 'comfyui_upload')
+        if result.get('name') != filename or result.get('subfolder'):
+            raise Exception(f"ComfyUI at {server_address} stored {filename} as {result}")
+
+        with self._lock:
+            self._known.setdefault(server_address, set()).add(filename)
+            self.uploads += 1
+            self.uploaded_bytes += len(image_data)
+        logger.info(f"Uploaded input image {filename} to {server_address}")
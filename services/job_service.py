@@ -0,0 +1,158 @@
+import uuid
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+from config.config import Config
+from services.cancellation import CancellationToken, cancellable
+from services.progress import ProgressChannel, listening
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A background generation job"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, kind: str):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.state = Job.QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        # Live execution events for /jobs/<id>/events subscribers
+        self.progress = ProgressChannel(Config.PROGRESS_BUFFER_SIZE)
+        self.token = CancellationToken()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (Job.SUCCEEDED, Job.FAILED, Job.CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize job state for API responses"""
+        now = time.time()
+        started = self.started_at or now
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "cancel_requested": self.token.cancelled,
+            "timings": {
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "queued_seconds": round(started - self.created_at, 3),
+                "run_seconds": round((self.finished_at or now) - started, 3) if self.started_at else None
+            },
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobStore:
+    """In-process job registry with TTL eviction of finished jobs"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+class JobService:
+    """Runs generation work on background threads and tracks it as jobs"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers: int = None, ttl: int = None):
+        self.store = JobStore(ttl or Config.JOB_TTL)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.JOB_WORKERS,
+            thread_name_prefix='job-worker'
+        )
+
+    @classmethod
+    def shared(cls) -> 'JobService':
+        """Return the process-wide job service"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, kind: str, work: Callable[[], Dict[str, Any]]) -> Job:
+        """Queue work for background execution and return its job"""
+        job = Job(kind)
+        self.store.add(job)
+        self.executor.submit(self._run, job, work)
+        logger.info(f"Job {job.id} ({kind}) queued")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a job and the ComfyUI prompts it queued; False if already finished"""
+        if job.finished:
+            return False
+        logger.info(f"Cancelling job {job.id}")
+        job.token.cancel()
+        return True
+
+    def _run(self, job: Job, work: Callable[[], Dict[str, Any]]):
+        job.started_at = time.time()
+        if job.token.cancelled:
+            self._finish(job, Job.CANCELLED)
+            return
+
+        job.state = Job.RUNNING
+        job.progress.publish({"type": "state", "state": job.state})
+        state = Job.FAILED
+        try:
+            with listening(job.progress), cancellable(job.token):
+                job.result = work()
+            state = Job.SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            if job.token.cancelled:
+                logger.info(f"Job {job.id} cancelled")
+                state = Job.CANCELLED
+            else:
+                logger.error(f"Job {job.id} failed: {e}")
+        finally:
+            self._finish(job, state)
+
+    @staticmethod
+    def _finish(job: Job, state: str):
+        # The store evicts finished jobs by finished_at, so it is set first
+        job.finished_at = time.time()
+        job.state = state
+        job.progress.close()
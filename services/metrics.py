@@ -0,0 +1,232 @@
+import bisect
+import time
+import threading
+import contextvars
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds for latency histograms; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# (labels, value) pairs reported by a collector at scrape time
+Samples = List[Tuple[Dict[str, Any], float]]
+
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """A named metric with one value per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, *label_values):
+        self.inc(-amount, *label_values)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        for label_values, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """In-process metric aggregates rendered in Prometheus text format.
+
+    Hot paths only touch a per-metric lock and a dictionary; services that
+    already keep their own counters are read by collectors at scrape time.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._metrics: 'OrderedDict[str, Metric]' = OrderedDict()
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> 'MetricsRegistry':
+        """Return the process-wide metrics registry"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Samples]]]):
+        """Add a callable yielding (name, kind, help, samples) on every scrape"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for collector in collectors:
+            try:
+                for name, kind, help_text, samples in collector():
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                    for labels, value in samples:
+                        if value is None:
+                            continue
+                        names = tuple(labels)
+                        lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {float(value)}")
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, cls, name: str, help_text: str, labels: Tuple[str, ...], **options) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **options)
+            return metric
+
+registry = MetricsRegistry.shared()
+
+STAGE_SECONDS = registry.histogram(
+    'comfy_api_stage_seconds', 'Time spent in each stage of serving a generation', ('stage',)
+)
+STAGE_ERRORS = registry.counter(
+    'comfy_api_stage_errors_total', 'Stages that ended with an exception', ('stage',)
+)
+BYTES_TRANSFERRED = registry.counter(
+    'comfy_api_bytes_total', 'Image bytes moved, by direction', ('direction',)
+)
+HTTP_REQUESTS = registry.counter(
+    'comfy_api_http_requests_total', 'Requests served', ('method', 'endpoint', 'status')
+)
+HTTP_SECONDS = registry.histogram(
+    'comfy_api_http_request_seconds', 'Time to produce a response (streamed bodies excluded)', ('endpoint',)
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    'comfy_api_http_requests_in_flight', 'Requests currently being handled'
+)
+
+def record_stage(name: str, seconds: float):
+    """Record a stage measured by the caller"""
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str):
+    """Time the block as one stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(1, name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def begin_request() -> contextvars.Token:
+    """Start collecting stage timings for the request handled by this context"""
+    HTTP_IN_FLIGHT.inc()
+    return _request_timings.set(OrderedDict())
+
+def end_request(reset: contextvars.Token, method: str, endpoint: str, status: int,
+                seconds: float) -> Optional[str]:
+    """Record the request and return its Server-Timing header value.
+
+    The request stays in flight until close_request(), which for a streamed
+    response is only once its body has been sent.
+    """
+    timings = _request_timings.get()
+    _request_timings.reset(reset)
+    HTTP_REQUESTS.inc(1, method, endpoint, status)
+    HTTP_SECONDS.observe(seconds, endpoint)
+
+    entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in (timings or {}).items()]
+    entries.append(f"total;dur={seconds * 1000:.1f}")
+    return ', '.join(entries)
+
+def close_request():
+    """Stop counting a request begun with begin_request() as in flight"""
+    HTTP_IN_FLIGHT.dec()
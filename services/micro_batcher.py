@@ -0,0 +1,249 @@
+import random
+import threading
+import logging
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from config.config import Config
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+from services.errors import GenerationTimeout
+from services.progress import current_channels, listening
+from utils.workflow_templates import copy_workflow
+from utils.workflow_utils import WorkflowUtils, SEED_INPUTS
+
+logger = logging.getLogger(__name__)
+
+MAX_SEED = 2 ** 32 - 1
+
+class _PendingRequest:
+    def __init__(self, workflow: Dict[str, Any], batch_size: int):
+        self.workflow = workflow
+        self.batch_size = batch_size
+        self.future = Future()
+        self.channels = current_channels()
+        self.cancel_token = current_token()
+
+class _PackGroup:
+    def __init__(self, key: str, latent_node_id: str, timeout: float):
+        self.key = key
+        self.latent_node_id = latent_node_id
+        self.timeout = timeout
+        self.requests: List[_PendingRequest] = []
+        # The run executes under this token; it is cancelled once every
+        # member has cancelled
+        self.token = CancellationToken()
+        self.cancelled = 0
+
+    @property
+    def total_batch(self) -> int:
+        return sum(request.batch_size for request in self.requests)
+
+class PackedResult:
+    """One requester's share of a packed run"""
+
+    def __init__(self, images: Dict[str, List[bytes]], packed: int, batch_index: int, seed: Optional[int]):
+        self.images = images
+        self.packed = packed
+        self.batch_index = batch_index
+        self.seed = seed
+
+class MicroBatcher:
+    """Folds compatible requests into one run with a larger latent batch.
+
+    Requests whose workflows differ only in their seeds are held for a short
+    window, merged by raising batch_size on their EmptyLatentImage node and
+    executed once. ComfyUI draws the noise for the whole batch from a single
+    seed, so every requester receives its slice of that batch in arrival order.
+    """
+
+    _instances: Dict[str, 'MicroBatcher'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, execute: Callable[[Dict[str, Any], float], Dict[str, List[bytes]]],
+                 window: float = None, max_batch_size: int = None):
+        self.execute = execute
+        self.window = window if window is not None else Config.MICRO_BATCH_WINDOW
+        self.max_batch_size = max_batch_size or Config.MICRO_BATCH_MAX_SIZE
+        self._groups: Dict[str, _PackGroup] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.runs = 0
+
+    @classmethod
+    def for_server(cls, server_address: str,
+                   execute: Callable[[Dict[str, Any], float], Dict[str, List[bytes]]]) -> 'MicroBatcher':
+        """Return the shared batcher for a server, creating it on first use"""
+        with cls._instances_lock:
+            batcher = cls._instances.get(server_address)
+            if batcher is None:
+                batcher = cls(execute)
+                cls._instances[server_address] = batcher
+            return batcher
+
+    def accepts(self, workflow: Dict[str, Any]) -> bool:
+        """Whether a workflow can be packed with others"""
+        if not Config.MICRO_BATCH_PINNED_SEEDS and WorkflowUtils.has_fixed_seed(workflow):
+            return False
+        return self._packing_key(workflow) is not None
+
+    def submit(self, workflow: Dict[str, Any], timeout: float) -> PackedResult:
+        """Queue a workflow for packing and block until its images are ready"""
+        packing = self._packing_key(workflow)
+        if packing is None:
+            raise ValueError("Workflow cannot be packed")
+        key, latent_node_id, batch_size = packing
+
+        request = _PendingRequest(workflow, batch_size)
+        flush_now = None
+        with self._lock:
+            self.requests += 1
+            group = self._groups.get(key)
+            if group is None:
+                group = _PackGroup(key, latent_node_id, timeout)
+                self._groups[key] = group
+                timer = threading.Timer(self.window, self._flush, args=(key, group))
+                timer.daemon = True
+                timer.start()
+            elif group.total_batch + batch_size > self.max_batch_size:
+                # Close the full group and start a new one for this request
+                flush_now = self._groups.pop(key)
+                group = _PackGroup(key, latent_node_id, timeout)
+                self._groups[key] = group
+                timer = threading.Timer(self.window, self._flush, args=(key, group))
+                timer.daemon = True
+                timer.start()
+            group.requests.append(request)
+            group.timeout = max(group.timeout, timeout)
+
+        if flush_now is not None:
+            threading.Thread(target=self._run_group, args=(flush_now,), daemon=True).start()
+        if request.cancel_token is not None:
+            request.cancel_token.register(request, lambda: self._cancel_member(group, request))
+
+        try:
+            return request.future.result(timeout=timeout + self.window)
+        except FutureTimeoutError:
+            raise GenerationTimeout(f"Generation timeout after {timeout} seconds")
+        finally:
+            if request.cancel_token is not None:
+                request.cancel_token.unregister(request)
+
+    def stats(self) -> Dict[str, Any]:
+        """Packing counters; packing_ratio is requests per ComfyUI run"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "runs": self.runs,
+                "packing_ratio": round(self.requests / self.runs, 3) if self.runs else None,
+                "window": self.window,
+                "max_batch_size": self.max_batch_size
+            }
+
+    def _packing_key(self, workflow: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+        latent_nodes = [
+            node_id for node_id, node in workflow.items()
+            if node.get('class_type') == 'EmptyLatentImage'
+        ]
+        if len(latent_nodes) != 1:
+            return None
+        latent_node_id = latent_nodes[0]
+        batch_size = workflow[latent_node_id]['inputs'].get('batch_size', 1)
+        if not isinstance(batch_size, int) or batch_size > self.max_batch_size:
+            return None
+
+        # Everything except seeds and the batch size must match
+        normalized = copy_workflow(workflow)
+        normalized[latent_node_id]['inputs']['batch_size'] = 0
+        for node in normalized.values():
+            for name in SEED_INPUTS:
+                if name in node['inputs']:
+                    node['inputs'][name] = 0
+        return WorkflowUtils.workflow_hash(normalized), latent_node_id, batch_size
+
+    def _cancel_member(self, group: _PackGroup, request: _PendingRequest):
+        """Detach a cancelled requester; cancel the run once nobody is left"""
+        try:
+            request.future.set_exception(GenerationCancelled("Generation cancelled"))
+        except InvalidStateError:
+            # Its share of the run was already delivered
+            return
+        with self._lock:
+            group.cancelled += 1
+            everyone = group.cancelled == len(group.requests)
+            if everyone and self._groups.get(group.key) is group:
+                # Not flushed yet: it never runs, later requests start a new group
+                del self._groups[group.key]
+        if everyone:
+            logger.info(f"All {len(group.requests)} requests of a packed run cancelled")
+            group.token.cancel()
+
+    def _flush(self, key: str, group: _PackGroup):
+        with self._lock:
+            if self._groups.get(key) is not group:
+                return
+            del self._groups[key]
+        self._run_group(group)
+
+    def _run_group(self, group: _PackGroup):
+        first = group.requests[0]
+        merged = copy_workflow(first.workflow)
+        merged[group.latent_node_id]['inputs']['batch_size'] = group.total_batch
+        seed = self._merged_seed(merged)
+
+        with self._lock:
+            self.runs += 1
+        if len(group.requests) > 1:
+            logger.info(f"Packed {len(group.requests)} requests into one run of batch size {group.total_batch}")
+
+        # Everyone packed into the run sees its progress
+        channels = [channel for request in group.requests for channel in request.channels]
+        try:
+            with listening(*channels), cancellable(group.token):
+                images = self.execute(merged, group.timeout)
+        except Exception as e:
+            for request in group.requests:
+                self._resolve(request, e)
+            return
+
+        offset = 0
+        for request in group.requests:
+            try:
+                share = {}
+                for node_id, node_images in images.items():
+                    if len(node_images) != group.total_batch:
+                        raise Exception(
+                            f"Node {node_id} returned {len(node_images)} images for a batch of {group.total_batch}"
+                        )
+                    share[node_id] = node_images[offset:offset + request.batch_size]
+                outcome = PackedResult(share, len(group.requests), offset, seed)
+            except Exception as e:
+                outcome = e
+            self._resolve(request, outcome)
+            offset += request.batch_size
+
+    @staticmethod
+    def _resolve(request: _PendingRequest, outcome: Any):
+        """Deliver a share or an error unless the requester has already cancelled"""
+        try:
+            if isinstance(outcome, Exception):
+                request.future.set_exception(outcome)
+            else:
+                request.future.set_result(outcome)
+        except InvalidStateError:
+            pass
+
+    def _merged_seed(self, merged: Dict[str, Any]) -> Optional[int]:
+        """Pin one seed for the packed run, drawing a random one if unset"""
+        seed = None
+        for node in merged.values():
+            for name in SEED_INPUTS:
+                if name not in node['inputs']:
+                    continue
+                value = node['inputs'][name]
+                if isinstance(value, list):
+                    # Seed comes from another node's output
+                    continue
+                if not isinstance(value, int) or value < 0:
+                    value = random.randint(0, MAX_SEED)
+                    node['inputs'][name] = value
+                seed = value if seed is None else seed
+        return seed
@@ -0,0 +1,161 @@
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Tuple
+from config.config import Config
+from services.backend_pool import BackendPool, Backend
+from services.errors import BackendUnavailable
+from services.websocket_manager import PromptWaiter
+
+logger = logging.getLogger(__name__)
+
+# Loader nodes whose checkpoint name identifies the model a prompt needs
+CHECKPOINT_LOADER_CLASSES = ('CheckpointLoaderSimple',)
+
+class _ScheduledPrompt:
+    def __init__(self, waiter: PromptWaiter, workflow: Dict[str, Any], model: Optional[str]):
+        self.waiter = waiter
+        self.workflow = workflow
+        self.model = model
+        self.enqueued_at = time.time()
+
+class ModelAffinityScheduler:
+    """Local dispatch queue that groups prompts by checkpoint.
+
+    Only a few prompts per backend are handed to ComfyUI at a time; the rest
+    wait here so they can be reordered. A free backend is given the oldest
+    pending prompt for the model it last loaded, unless the oldest prompt
+    overall has waited longer than the fairness window, in which case it goes
+    first regardless. When several backends are free, a prompt prefers the
+    one that already has its model loaded.
+    """
+
+    def __init__(self, pool: BackendPool,
+                 dispatch: Callable[[Backend, PromptWaiter, Dict[str, Any]], None],
+                 max_inflight: int = None, fairness_window: float = None):
+        self.pool = pool
+        self.dispatch = dispatch
+        self.max_inflight = max_inflight or Config.SCHEDULER_MAX_INFLIGHT_PER_BACKEND
+        self.fairness_window = fairness_window if fairness_window is not None else Config.SCHEDULER_FAIRNESS_WINDOW
+        self._queue: 'deque[_ScheduledPrompt]' = deque()
+        self._active: Dict[str, int] = {backend.address: 0 for backend in pool.backends}
+        self._last_model: Dict[str, Optional[str]] = {}
+        self._cond = threading.Condition()
+        self.dispatched = 0
+        self.model_switches = 0
+        self.switches_avoided = 0
+        self._thread = threading.Thread(target=self._run, name='comfyui-model-scheduler', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def model_of(workflow: Dict[str, Any]) -> Optional[str]:
+        """Checkpoint a workflow loads, if any"""
+        for node in workflow.values():
+            if node.get('class_type') in CHECKPOINT_LOADER_CLASSES:
+                return node.get('inputs', {}).get('ckpt_name')
+        return None
+
+    def enqueue(self, waiter: PromptWaiter, workflow: Dict[str, Any]):
+        """Queue a prompt for dispatch; completion is reported through the waiter"""
+        with self._cond:
+            self._queue.append(_ScheduledPrompt(waiter, workflow, self.model_of(workflow)))
+            self._cond.notify()
+
+    def discard(self, waiter: PromptWaiter) -> bool:
+        """Drop a prompt that has not been dispatched yet"""
+        with self._cond:
+            for item in self._queue:
+                if item.waiter is waiter:
+                    self._queue.remove(item)
+                    return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._queue),
+                "dispatched": self.dispatched,
+                "model_switches": self.model_switches,
+                "switches_avoided": self.switches_avoided,
+                "loaded_models": dict(self._last_model)
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                picked = self._pick()
+                if picked is None:
+                    # Also wake periodically so recovered backends get work
+                    self._cond.wait(timeout=0.5)
+                    continue
+                backend, item = picked
+                self._active[backend.address] = self._active.get(backend.address, 0) + 1
+
+            self._dispatch(backend, item)
+
+    def _pick(self) -> Optional[Tuple[Backend, _ScheduledPrompt]]:
+        if not self._queue:
+            return None
+        free = sorted(
+            (backend for backend in self.pool.backends
+             if backend.healthy and self._active.get(backend.address, 0) < self.max_inflight),
+            key=lambda b: (self._active.get(b.address, 0), b.load)
+        )
+        if not free:
+            return None
+
+        oldest = self._queue[0]
+        if time.time() - oldest.enqueued_at <= self.fairness_window:
+            # Give each free backend more of the model it already has loaded
+            for backend in free:
+                loaded = self._last_model.get(backend.address)
+                if loaded is None:
+                    continue
+                for item in self._queue:
+                    if item.model == loaded:
+                        if item is not oldest and oldest.model != loaded:
+                            self.switches_avoided += 1
+                        return self._take(backend, item)
+
+        backend = next(
+            (b for b in free if self._last_model.get(b.address) == oldest.model),
+            free[0]
+        )
+        return self._take(backend, oldest)
+
+    def _take(self, backend: Backend, item: _ScheduledPrompt) -> Tuple[Backend, _ScheduledPrompt]:
+        self._queue.remove(item)
+        loaded = self._last_model.get(backend.address)
+        if item.model is not None:
+            if loaded is not None and loaded != item.model:
+                self.model_switches += 1
+            self._last_model[backend.address] = item.model
+        self.dispatched += 1
+        return backend, item
+
+    def _dispatch(self, backend: Backend, item: _ScheduledPrompt):
+        if item.waiter.future.done():
+            # Failed or given up on while it was waiting here
+            self._slot_freed(backend)
+            return
+        try:
+            self.dispatch(backend, item.waiter, item.workflow)
+        except BackendUnavailable as e:
+            # Backend unreachable and now ejected: keep the prompt's place for another backend
+            logger.warning(f"Requeueing prompt {item.waiter.prompt_id} after {backend.address} failed: {e}")
+            with self._cond:
+                self._queue.appendleft(item)
+            self._slot_freed(backend)
+            return
+        except Exception as e:
+            logger.error(f"Failed to dispatch prompt {item.waiter.prompt_id} to {backend.address}: {e}")
+            item.waiter.set_error(e)
+            self._slot_freed(backend)
+            return
+        item.waiter.future.add_done_callback(lambda _: self._slot_freed(backend))
+
+    def _slot_freed(self, backend: Backend):
+        with self._cond:
+            self._active[backend.address] = max(0, self._active.get(backend.address, 0) - 1)
+            self._cond.notify()
@@ -0,0 +1,107 @@
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Channels that prompts submitted from the current context report progress to
+_current_channels: contextvars.ContextVar = contextvars.ContextVar('progress_channels', default=())
+
+def current_channels() -> Tuple['ProgressChannel', ...]:
+    """Progress channels active in the calling context"""
+    return _current_channels.get()
+
+@contextmanager
+def listening(*channels: 'ProgressChannel'):
+    """Report progress of prompts submitted inside the block to these channels"""
+    token = _current_channels.set(tuple(channels))
+    try:
+        yield
+    finally:
+        _current_channels.reset(token)
+
+class ProgressSubscription:
+    """Bounded event buffer for one consumer.
+
+    When the consumer falls behind, the oldest events are dropped and only
+    the most recent preview frame is kept, so publishing never blocks.
+    """
+
+    def __init__(self, max_events: int):
+        self._events: 'deque[Dict[str, Any]]' = deque(maxlen=max_events)
+        self._preview: Optional[Tuple[int, bytes]] = None
+        self._cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, event: Dict[str, Any]):
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._cond.notify()
+
+    def push_preview(self, image_format: int, image_data: bytes):
+        with self._cond:
+            if self._preview is not None:
+                self.dropped += 1
+            self._preview = (image_format, image_data)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def next(self, timeout: float) -> Tuple[List[Dict[str, Any]], Optional[Tuple[int, bytes]]]:
+        """Wait for and drain buffered events plus the latest preview frame"""
+        with self._cond:
+            if not self._events and self._preview is None and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            preview, self._preview = self._preview, None
+            return events, preview
+
+class ProgressChannel:
+    """Fans progress events of one job out to its subscribers"""
+
+    def __init__(self, max_events: int = 256):
+        self.max_events = max_events
+        self._subscribers: List[ProgressSubscription] = []
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def subscribe(self) -> ProgressSubscription:
+        subscription = ProgressSubscription(self.max_events)
+        with self._lock:
+            if self.closed:
+                subscription.close()
+            else:
+                self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def publish_preview(self, image_format: int, image_data: bytes):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push_preview(image_format, image_data)
+
+    def close(self):
+        """Tell subscribers no more events will follow"""
+        with self._lock:
+            self.closed = True
+            subscribers, self._subscribers = self._subscribers, []
+        for subscription in subscribers:
+            subscription.close()
@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import threading
+import logging
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+class ResultCache:
+    """Disk-backed LRU cache of generation outputs keyed by workflow hash.
+
+    Each entry is a directory holding the output images and a manifest that
+    maps node ids to file names; an in-memory index tracks entry sizes and
+    recency so lookups never touch the directory tree.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, folder: str = None, max_bytes: int = None):
+        self.folder = Path(folder or Config.RESULT_CACHE_FOLDER)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.RESULT_CACHE_MAX_BYTES
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._index: 'OrderedDict[str, int]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    @classmethod
+    def shared(cls) -> 'ResultCache':
+        """Return the process-wide result cache"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self, key: str) -> Optional[Dict[str, List[bytes]]]:
+        """Return cached outputs for a workflow hash, or None on a miss"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+
+        try:
+            entry_dir = self._entry_dir(key)
+            manifest = json.loads((entry_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+            outputs = {
+                node_id: [(entry_dir / name).read_bytes() for name in names]
+                for node_id, names in manifest['outputs'].items()
+            }
+            # Keep recency across restarts, where the index is rebuilt by mtime
+            os.utime(entry_dir / MANIFEST_NAME)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return outputs
+
+    def put(self, key: str, outputs: Dict[str, List[bytes]]):
+        """Store outputs for a workflow hash, evicting old entries if needed"""
+        size = sum(len(data) for images in outputs.values() for data in images)
+        if size > self.max_bytes:
+            return
+
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir.parent / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            tmp_dir.mkdir(parents=True)
+            manifest = {}
+            for node_id, images in outputs.items():
+                manifest[node_id] = []
+                for i, data in enumerate(images):
+                    name = f"{node_id}_{i}.png"
+                    (tmp_dir / name).write_bytes(data)
+                    manifest[node_id].append(name)
+            (tmp_dir / MANIFEST_NAME).write_text(
+                json.dumps({"key": key, "outputs": manifest}), encoding='utf-8'
+            )
+            with self._lock:
+                if key in self._index:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return
+                os.replace(tmp_dir, entry_dir)
+                self._index[key] = size
+                self._total_bytes += size
+                evicted = self._pop_overflow()
+        except Exception as e:
+            logger.error(f"Failed to cache result {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        for old_key in evicted:
+            shutil.rmtree(self._entry_dir(old_key), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current footprint"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.folder / key[:2] / key
+
+    def _remove(self, key: str):
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _pop_overflow(self) -> List[str]:
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._index:
+            old_key, old_size = self._index.popitem(last=False)
+            self._total_bytes -= old_size
+            evicted.append(old_key)
+        return evicted
+
+    def _load_index(self):
+        """Rebuild the in-memory index from entries left on disk"""
+        entries = []
+        for manifest_path in self.folder.glob(f"*/*/{MANIFEST_NAME}"):
+            entry_dir = manifest_path.parent
+            size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.name != MANIFEST_NAME)
+            entries.append((manifest_path.stat().st_mtime, entry_dir.name, size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+        for key in self._pop_overflow():
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
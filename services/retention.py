@@ -0,0 +1,143 @@
+import time
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+from config.config import Config
+from utils.file_utils import FileUtils
+
+logger = logging.getLogger(__name__)
+
+class RetentionPolicy:
+    """Limits on the outputs folder; a limit of 0 is disabled"""
+
+    def __init__(self, max_bytes: int = None, max_age: float = None, max_count: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else Config.RETENTION_MAX_BYTES
+        self.max_age = max_age if max_age is not None else Config.RETENTION_MAX_AGE
+        self.max_count = max_count if max_count is not None else Config.RETENTION_MAX_COUNT
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_bytes or self.max_age or self.max_count)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "max_count": self.max_count
+        }
+
+class RetentionSweeper:
+    """Background garbage collector for generated images.
+
+    Works from the image index rather than the folder: images are evicted
+    least recently used first (downloads count as use, age is measured from
+    the last use) until every limit holds. Each pass deletes at most
+    RETENTION_BATCH_SIZE files so a large backlog is worked off gradually.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, policy: RetentionPolicy = None, interval: float = None, batch_size: int = None):
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval or Config.RETENTION_SWEEP_INTERVAL
+        self.batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+        self.file_utils = FileUtils()
+        self._stopping = threading.Event()
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.last_sweep = None
+        self._thread = None
+        if self.policy.enabled:
+            self._thread = threading.Thread(target=self._run, name='retention-sweeper', daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def shared(cls) -> 'RetentionSweeper':
+        """Return the process-wide sweeper, starting it if any limit is set"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def stop(self):
+        self._stopping.set()
+
+    def plan(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Images that must go to satisfy the policy, least recently used first"""
+        policy = self.policy
+        index = self.file_utils.index
+        count, total = index.totals()
+        cutoff = time.time() - policy.max_age if policy.max_age else None
+
+        victims = []
+        for filename, size, last_access in index.iter_least_recently_used():
+            expired = cutoff is not None and last_access < cutoff
+            over = (policy.max_count and count > policy.max_count) or (policy.max_bytes and total > policy.max_bytes)
+            if not (expired or over):
+                # Everything after this was used more recently
+                break
+            victims.append({
+                "filename": filename,
+                "size": size,
+                "last_access": last_access,
+                "reason": "age" if expired else "limit"
+            })
+            count -= 1
+            total -= size
+            if limit and len(victims) >= limit:
+                break
+        return victims
+
+    def report(self, sample: int = 20) -> Dict[str, Any]:
+        """Dry run: what a full sweep would delete right now"""
+        self.file_utils.index.flush_access()
+        count, total = self.file_utils.index.totals()
+        victims = self.plan() if self.policy.enabled else []
+        return {
+            "enabled": self.policy.enabled,
+            "policy": self.policy.to_dict(),
+            "usage": {"count": count, "bytes": total},
+            "would_evict": {
+                "count": len(victims),
+                "bytes": sum(victim['size'] for victim in victims)
+            },
+            "sample": victims[:sample],
+            "stats": self.stats()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+            "last_sweep": self.last_sweep
+        }
+
+    def sweep(self) -> int:
+        """Delete one batch of images; returns how many were removed"""
+        self.file_utils.index.flush_access()
+        removed = 0
+        for victim in self.plan(self.batch_size):
+            if self.file_utils.get_pending_image(victim['filename']) is not None:
+                continue
+            if self.file_utils.delete_image(victim['filename']):
+                removed += 1
+                self.evicted_bytes += victim['size']
+            else:
+                # Gone from disk already; drop the stale row
+                self.file_utils.index.remove(victim['filename'])
+        self.evicted += removed
+        self.last_sweep = time.time()
+        if removed:
+            logger.info(f"Retention sweep removed {removed} images")
+        return removed
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                full = self.sweep() >= self.batch_size
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+                full = False
+            # Keep going without the full pause while there is a backlog
+            self._stopping.wait(1 if full else self.interval)
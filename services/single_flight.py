@@ -0,0 +1,126 @@
+import threading
+import contextvars
+import logging
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Optional, Tuple
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+from services.errors import GenerationTimeout
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    def __init__(self):
+        self.future = Future()
+        # Callers still waiting for the result
+        self.callers = 0
+        # The work runs under this token; it is cancelled once every caller
+        # has given up
+        self.token = CancellationToken()
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight wait for and share its result (or exception). The work runs on
+    its own thread, so a caller whose job is cancelled stops waiting without
+    affecting the others; the work itself is cancelled only when its last
+    caller is.
+    """
+
+    def __init__(self, name: str = 'single-flight'):
+        self.name = name
+        self._calls: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, work: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Run work once per in-flight key; returns (result, shared)"""
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._calls[key] = flight
+                self.executions += 1
+            else:
+                self.coalesced += 1
+            flight.callers += 1
+
+        if leader:
+            # The work keeps the starting caller's context (progress
+            # channels, request timings) but not its cancellation token
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(self._run, key, flight, work),
+                name=f"{self.name}-flight", daemon=True
+            ).start()
+        else:
+            logger.info(f"{self.name}: joining in-flight call {key}")
+
+        waiting = Future()
+        flight.future.add_done_callback(lambda done: self._relay(done, waiting))
+        token = current_token()
+        if token is not None:
+            token.register(waiting, lambda: self._cancel_caller(key, flight, waiting))
+        try:
+            # The leader's work enforces its own deadline
+            return waiting.result(timeout=None if leader else timeout), not leader
+        except FutureTimeoutError:
+            self._leave(key, flight)
+            raise GenerationTimeout(f"Timed out after {timeout} seconds waiting for in-flight call")
+        finally:
+            if token is not None:
+                token.unregister(waiting)
+
+    def stats(self) -> Dict[str, int]:
+        """Execution and coalescing counters"""
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
+
+    def _run(self, key: str, flight: _Flight, work: Callable[[], Any]):
+        try:
+            with cancellable(flight.token):
+                result = work()
+            flight.future.set_result(result)
+        except BaseException as e:
+            flight.future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is flight:
+                    del self._calls[key]
+
+    @staticmethod
+    def _relay(done: Future, waiting: Future):
+        try:
+            if done.exception() is not None:
+                waiting.set_exception(done.exception())
+            else:
+                waiting.set_result(done.result())
+        except InvalidStateError:
+            # That caller was cancelled
+            pass
+
+    def _cancel_caller(self, key: str, flight: _Flight, waiting: Future):
+        try:
+            waiting.set_exception(GenerationCancelled("Generation cancelled"))
+        except InvalidStateError:
+            # Already has its result
+            return
+        self._leave(key, flight)
+
+    def _leave(self, key: str, flight: _Flight):
+        """Drop a caller that stopped waiting; cancel the work once none are left"""
+        with self._lock:
+            flight.callers -= 1
+            if flight.callers or flight.future.done():
+                return
+            # Later callers start a fresh run instead of joining a cancelled one
+            if self._calls.get(key) is flight:
+                del self._calls[key]
+        logger.info(f"{self.name}: every caller of {key} gave up; cancelling it")
+        flight.token.cancel()
@@ -0,0 +1,162 @@
+import io
+import os
+import uuid
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from PIL import Image, features
+from config.config import Config
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Request format -> (Pillow format, file extension, mimetype)
+VARIANT_FORMATS = {
+    'png': ('PNG', 'png', 'image/png'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'jpg': ('JPEG', 'jpg', 'image/jpeg'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'avif': ('AVIF', 'avif', 'image/avif'),
+}
+
+def supported_formats() -> List[str]:
+    """Variant formats the installed Pillow can encode"""
+    formats = ['png', 'jpeg', 'jpg']
+    if features.check('webp'):
+        formats.append('webp')
+    if features.check('avif'):
+        formats.append('avif')
+    return formats
+
+class VariantCache:
+    """Lazily rendered resized/re-encoded copies of output images.
+
+    Variants are keyed by the source image's version and the requested
+    format, width and quality, rendered once even when requested
+    concurrently, and kept on disk under a byte budget with LRU eviction.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, folder: str = None, max_bytes: int = None):
+        self.folder = Path(folder or Config.VARIANT_CACHE_FOLDER)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.VARIANT_CACHE_MAX_BYTES
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._index: 'OrderedDict[str, int]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.rendering = SingleFlight('variant')
+        self.hits = 0
+        self.renders = 0
+        self._load_index()
+
+    @classmethod
+    def shared(cls) -> 'VariantCache':
+        """Return the process-wide variant cache"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def variant_key(version: str, image_format: str, width: Optional[int], quality: int) -> str:
+        extension = VARIANT_FORMATS[image_format][1]
+        digest = hashlib.sha256(f"{version}:{extension}:{width or 0}:{quality}".encode()).hexdigest()
+        return f"{digest[:40]}.{extension}"
+
+    def get(self, source: Union[Path, bytes], version: str, image_format: str,
+            width: Optional[int], quality: int) -> Path:
+        """Return the path of a rendered variant, rendering it on first request"""
+        key = self.variant_key(version, image_format, width, quality)
+        path = self._path(key)
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+                self.hits += 1
+                return path
+
+        path, _ = self.rendering.do(key, lambda: self._render(key, source, image_format, width, quality))
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "renders": self.renders,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _render(self, key: str, source: Union[Path, bytes], image_format: str,
+                width: Optional[int], quality: int) -> Path:
+        path = self._path(key)
+        with self._lock:
+            if key in self._index:
+                return path
+
+        pil_format = VARIANT_FORMATS[image_format][0]
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            image.load()
+            if width and width < image.width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            save_options = {} if pil_format == 'PNG' else {'quality': quality}
+            image.save(buffer, format=pil_format, **save_options)
+
+        data = buffer.getvalue()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.renders += 1
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            # Never evict the variant we are about to serve
+            self._index.move_to_end(key)
+            evicted = self._pop_overflow(keep=key)
+
+        for old_key in evicted:
+            try:
+                self._path(old_key).unlink()
+            except FileNotFoundError:
+                pass
+        return path
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / key
+
+    def _pop_overflow(self, keep: str = None) -> List[str]:
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._index) > (1 if keep else 0):
+            old_key, old_size = self._index.popitem(last=False)
+            self._total_bytes -= old_size
+            evicted.append(old_key)
+        return evicted
+
+    def _load_index(self):
+        """Rebuild the in-memory index from variants left on disk"""
+        entries = []
+        for path in self.folder.glob('*/*'):
+            if path.name.startswith('.'):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+        for key in self._pop_overflow():
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
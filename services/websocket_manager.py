@@ -0,0 +1,378 @@
+import websocket
+import uuid
+import json
+import time
+import struct
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, List, Iterable
+from config.config import Config
+from services.errors import ExecutionFailed, GenerationTimeout
+from services.http_client import HTTPConnectionPool
+from services.cancellation import current_token
+from services.progress import current_channels
+
+logger = logging.getLogger(__name__)
+
+# ComfyUI binary frame event types (first 4 bytes, big-endian)
+BINARY_EVENT_PREVIEW_IMAGE = 1
+
+class PromptWaiter:
+    """Completion handle for a single queued prompt"""
+
+    def __init__(self, prompt_id: str, ws_output_nodes: Iterable[str] = ()):
+        self.prompt_id = prompt_id
+        self.future = Future()
+        self.submitted_at = time.time()
+        # When ComfyUI started executing the prompt and when it finished
+        self.started_at = None
+        self.finished_at = None
+        self.current_node = None
+        # Where the prompt was queued; set by ComfyUIService
+        self.server_address = None
+        self.backend = None
+        # Nodes whose images arrive as binary WebSocket frames
+        self.ws_output_nodes = set(ws_output_nodes)
+        self.ws_outputs: Dict[str, List[bytes]] = {}
+        # Progress channels of the job that submitted the prompt, if any
+        self.channels = current_channels()
+        self.cancel_token = current_token()
+
+    def emit(self, event: Dict[str, Any]):
+        """Relay a progress event to the submitting job's subscribers"""
+        for channel in self.channels:
+            channel.publish({**event, "prompt_id": self.prompt_id})
+
+    def emit_preview(self, image_format: int, image_data: bytes):
+        for channel in self.channels:
+            channel.publish_preview(image_format, image_data)
+
+    def add_ws_output(self, node_id: str, image_data: bytes):
+        """Collect an image pushed over the WebSocket by an output node"""
+        self.ws_outputs.setdefault(node_id, []).append(image_data)
+
+    def set_done(self):
+        """Mark the prompt as finished"""
+        if not self.future.done():
+            self.finished_at = time.time()
+            self.future.set_result(self.prompt_id)
+
+    def set_error(self, error: Exception):
+        """Mark the prompt as failed"""
+        if not self.future.done():
+            self.finished_at = time.time()
+            self.future.set_exception(error)
+
+    def wait(self, timeout: float) -> str:
+        """Block until the prompt finishes, fails or the timeout expires"""
+        try:
+            return self.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise GenerationTimeout(f"Generation timeout after {timeout:.1f} seconds")
+
+class PromptRouter:
+    """Routes one ComfyUI server's execution messages to per-prompt waiters.
+
+    Subclasses own the connection and feed it decoded frames through
+    _dispatch and _dispatch_binary.
+    """
+
+    # Prompts that finish before anyone registered for them are remembered
+    # briefly so a waiter registered right after queue_prompt cannot miss them
+    MAX_UNCLAIMED_RESULTS = 1024
+
+    def __init__(self, server_address: str):
+        self.server_address = server_address
+        self.client_id = str(uuid.uuid4())
+        self._waiters: Dict[str, PromptWaiter] = {}
+        self._unclaimed: 'OrderedDict[str, Optional[Exception]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # (prompt_id, node_id) currently executing; binary frames carry no ids
+        self._executing = None
+
+    def register(self, prompt_id: str, ws_output_nodes: Iterable[str] = ()) -> PromptWaiter:
+        """Register interest in a prompt's completion"""
+        return self.attach(PromptWaiter(prompt_id, ws_output_nodes))
+
+    def attach(self, waiter: PromptWaiter) -> PromptWaiter:
+        """Register a waiter created before its prompt was dispatched"""
+        with self._lock:
+            if waiter.prompt_id in self._unclaimed:
+                error = self._unclaimed.pop(waiter.prompt_id)
+                if error is not None:
+                    waiter.set_error(error)
+                else:
+                    waiter.set_done()
+                return waiter
+            self._waiters[waiter.prompt_id] = waiter
+        return waiter
+
+    def unregister(self, prompt_id: str):
+        """Drop a waiter, e.g. after completion or timeout"""
+        with self._lock:
+            self._waiters.pop(prompt_id, None)
+
+    def fail_pending(self, error: Exception):
+        """Fail every waiter, e.g. when the server is known to be down"""
+        with self._lock:
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+        if waiters:
+            logger.warning(f"Failing {len(waiters)} prompts waiting on {self.server_address}: {error}")
+        for waiter in waiters:
+            waiter.set_error(error)
+
+    def rename(self, old_prompt_id: str, new_prompt_id: str):
+        """Re-key a waiter when the server assigned a different prompt id"""
+        with self._lock:
+            waiter = self._waiters.pop(old_prompt_id, None)
+            if waiter is None:
+                return
+            waiter.prompt_id = new_prompt_id
+            self._waiters[new_prompt_id] = waiter
+            if new_prompt_id not in self._unclaimed:
+                return
+            error = self._unclaimed.pop(new_prompt_id)
+            del self._waiters[new_prompt_id]
+
+        if error is not None:
+            waiter.set_error(error)
+        else:
+            waiter.set_done()
+
+    def _dispatch(self, message: Dict[str, Any]):
+        msg_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if not prompt_id and msg_type == 'progress' and self._executing:
+            # Older servers send sampler progress without a prompt id
+            prompt_id = self._executing[0]
+        if not prompt_id:
+            return
+
+        if msg_type == 'execution_start':
+            with self._lock:
+                waiter = self._waiters.get(prompt_id)
+            if waiter and waiter.started_at is None:
+                waiter.started_at = time.time()
+        elif msg_type == 'executing':
+            if data.get('node') is None:
+                self._executing = None
+                self._finish(prompt_id)
+            else:
+                self._executing = (prompt_id, data['node'])
+                with self._lock:
+                    waiter = self._waiters.get(prompt_id)
+                if waiter:
+                    if waiter.started_at is None:
+                        waiter.started_at = time.time()
+                    waiter.current_node = data['node']
+                    waiter.emit({"type": "executing", "node": data['node']})
+        elif msg_type == 'progress':
+            with self._lock:
+                waiter = self._waiters.get(prompt_id)
+            if waiter:
+                waiter.emit({
+                    "type": "progress",
+                    "node": data.get('node') or waiter.current_node,
+                    "value": data.get('value'),
+                    "max": data.get('max')
+                })
+        elif msg_type == 'execution_error':
+            self._finish(prompt_id, ExecutionFailed(
+                f"ComfyUI execution error in node {data.get('node_id')}: "
+                f"{data.get('exception_message', 'unknown error')}"
+            ))
+        elif msg_type == 'execution_interrupted':
+            self._finish(prompt_id, ExecutionFailed("ComfyUI execution interrupted"))
+
+    def _dispatch_binary(self, frame: bytes):
+        """Route an output or preview image frame to the prompt currently executing"""
+        if len(frame) < 8 or self._executing is None:
+            return
+
+        event_type, = struct.unpack('>I', frame[:4])
+        if event_type != BINARY_EVENT_PREVIEW_IMAGE:
+            return
+
+        prompt_id, node_id = self._executing
+        with self._lock:
+            waiter = self._waiters.get(prompt_id)
+        if waiter is None:
+            return
+        # Skip the 4-byte event type and 4-byte image format header
+        if node_id in waiter.ws_output_nodes:
+            waiter.add_ws_output(node_id, frame[8:])
+        elif waiter.channels:
+            # Sampler latent previews
+            image_format, = struct.unpack('>I', frame[4:8])
+            waiter.emit_preview(image_format, frame[8:])
+
+    def _resync(self, prompt_id: str, entry: Dict[str, Any]):
+        """Settle a prompt from its /history entry after missing its messages"""
+        status = entry.get('status') or {}
+        if status.get('status_str', 'success') != 'success' or not status.get('completed', True):
+            self._finish(prompt_id, self._history_error(status))
+            return
+
+        with self._lock:
+            waiter = self._waiters.get(prompt_id)
+        missing = [] if waiter is None else sorted(waiter.ws_output_nodes - set(waiter.ws_outputs))
+        if missing:
+            # Binary output frames are not kept in /history; they are gone
+            self._finish(prompt_id, ExecutionFailed(
+                f"Images from WebSocket output nodes {', '.join(missing)} were lost "
+                f"while disconnected from {self.server_address}"
+            ))
+            return
+        self._finish(prompt_id)
+
+    @staticmethod
+    def _history_error(status: Dict[str, Any]) -> ExecutionFailed:
+        for event, data in status.get('messages') or []:
+            if event == 'execution_error':
+                return ExecutionFailed(
+                    f"ComfyUI execution error in node {data.get('node_id')}: "
+                    f"{data.get('exception_message', 'unknown error')}"
+                )
+            if event == 'execution_interrupted':
+                return ExecutionFailed("ComfyUI execution interrupted")
+        return ExecutionFailed(f"ComfyUI execution failed with status {status.get('status_str')}")
+
+    def _finish(self, prompt_id: str, error: Optional[Exception] = None):
+        with self._lock:
+            waiter = self._waiters.pop(prompt_id, None)
+            if waiter is None:
+                self._unclaimed[prompt_id] = error
+                while len(self._unclaimed) > self.MAX_UNCLAIMED_RESULTS:
+                    self._unclaimed.popitem(last=False)
+                return
+
+        if error is not None:
+            waiter.set_error(error)
+        else:
+            waiter.set_done()
+
+class ComfyUIWebSocketManager(PromptRouter):
+    """Process-wide multiplexed WebSocket connection to one ComfyUI server.
+
+    A single background reader thread owns the socket and routes execution
+    messages to per-prompt waiters, reconnecting with exponential backoff.
+    """
+
+    _instances: Dict[str, 'ComfyUIWebSocketManager'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, server_address: str):
+        super().__init__(server_address)
+        self.http = HTTPConnectionPool.for_host(server_address)
+        self.ws = None
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def for_server(cls, server_address: str) -> 'ComfyUIWebSocketManager':
+        """Return the shared manager for a server, creating it on first use"""
+        with cls._instances_lock:
+            manager = cls._instances.get(server_address)
+            if manager is None:
+                manager = cls(server_address)
+                cls._instances[server_address] = manager
+            manager.start()
+            return manager
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        """Start the background reader thread if it is not running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"comfyui-ws-{self.server_address}",
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread and close the socket"""
+        self._stopping.set()
+        self._close_socket()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def wait_until_connected(self, timeout: float) -> bool:
+        """Block until the shared socket is connected"""
+        return self._connected.wait(timeout)
+
+    def _run(self):
+        delay = Config.COMFYUI_WS_RECONNECT_INITIAL_DELAY
+        while not self._stopping.is_set():
+            try:
+                self._connect()
+                delay = Config.COMFYUI_WS_RECONNECT_INITIAL_DELAY
+                self._resync_pending()
+                self._receive_loop()
+            except Exception as e:
+                if not self._stopping.is_set():
+                    logger.warning(f"ComfyUI WebSocket {self.server_address} error: {e}")
+            finally:
+                self._connected.clear()
+                self._close_socket()
+
+            if self._stopping.wait(delay):
+                break
+            logger.info(f"Reconnecting to ComfyUI WebSocket {self.server_address} in {delay:.1f}s")
+            delay = min(delay * 2, Config.COMFYUI_WS_RECONNECT_MAX_DELAY)
+
+    def _connect(self):
+        ws = websocket.WebSocket()
+        ws_url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+        ws.connect(ws_url, timeout=Config.COMFYUI_WS_CONNECT_TIMEOUT)
+        # A finite timeout lets the reader notice dead peers and stop requests
+        ws.settimeout(Config.COMFYUI_WS_IDLE_TIMEOUT)
+        self.ws = ws
+        self._connected.set()
+        logger.info(f"Connected to ComfyUI WebSocket: {ws_url}")
+
+    def _close_socket(self):
+        ws, self.ws = self.ws, None
+        if ws:
+            try:
+                ws.close()
+            except Exception as e:
+                logger.debug(f"Error closing WebSocket: {e}")
+
+    def _receive_loop(self):
+        while not self._stopping.is_set():
+            try:
+                out = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                # Idle connection: make sure the peer is still there
+                self.ws.ping()
+                continue
+
+            if isinstance(out, str):
+                self._dispatch(json.loads(out))
+            else:
+                self._dispatch_binary(out)
+
+    def _resync_pending(self):
+        """Complete waiters whose prompts finished while we were disconnected"""
+        with self._lock:
+            pending = list(self._waiters)
+
+        for prompt_id in pending:
+            try:
+                history = json.loads(self.http.get(f"/history/{prompt_id}"))
+                if prompt_id in history:
+                    self._resync(prompt_id, history[prompt_id])
+            except Exception as e:
+                logger.warning(f"Failed to resync prompt {prompt_id}: {e}")
@@ -0,0 +1,293 @@
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from config.config import Config
+from services.backend_pool import BackendPool
+from services.http_client import HTTPConnectionPool
+from utils.upload_store import UploadStore
+from utils.workflow_utils import WorkflowUtils
+
+logger = logging.getLogger(__name__)
+
+class NodeCatalog:
+    """ComfyUI node schemas from /object_info, cached and refreshed in the background"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, pool: BackendPool = None, ttl: float = None):
+        self.pool = pool or BackendPool.shared()
+        self.ttl = ttl or Config.OBJECT_INFO_TTL
+        self.nodes: Optional[Dict[str, Any]] = None
+        self.version = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @classmethod
+    def shared(cls) -> 'NodeCatalog':
+        """Return the process-wide node catalogue"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        """Current schemas, or None if no backend has answered yet"""
+        if self.nodes is None:
+            self.refresh()
+        elif time.time() - self.fetched_at > self.ttl:
+            # Serve the stale copy while a fresh one is fetched
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self.refresh, name='object-info-refresh', daemon=True).start()
+        return self.nodes
+
+    def refresh(self, min_age: float = 0) -> bool:
+        """Fetch /object_info again unless the copy is younger than min_age"""
+        if self.nodes is not None and time.time() - self.fetched_at < min_age:
+            return False
+        try:
+            for backend in self.pool.backends:
+                if not backend.healthy:
+                    continue
+                try:
+                    raw = HTTPConnectionPool.for_host(backend.address).get('/object_info')
+                    version = hashlib.sha256(raw).hexdigest()[:16]
+                    nodes = json.loads(raw) if version != self.version else None
+                except Exception as e:
+                    # Another backend may still answer
+                    logger.warning(f"Failed to fetch /object_info from {backend.address}: {e}")
+                    continue
+                if nodes is not None:
+                    self.nodes = nodes
+                    self.version = version
+                    logger.info(f"Loaded {len(self.nodes)} node schemas from {backend.address}")
+                self.fetched_at = time.time()
+                return True
+            logger.warning("No healthy ComfyUI backend answered /object_info")
+            return False
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+class WorkflowValidator:
+    """Checks API-format workflows against ComfyUI's node schemas.
+
+    Results are memoized by workflow hash and catalogue version, so a
+    workflow seen before is validated with a single dictionary lookup.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, catalog: NodeCatalog = None, cache_size: int = None):
+        self.catalog = catalog or NodeCatalog.shared()
+        self.cache_size = cache_size or Config.VALIDATION_CACHE_SIZE
+        self.uploads = UploadStore.for_folder(Config.UPLOAD_FOLDER)
+        self._results: 'OrderedDict[Tuple[str, str], List[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> 'WorkflowValidator':
+        """Return the process-wide workflow validator"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def validate(self, workflow: Dict[str, Any]) -> List[str]:
+        """Return a list of problems; empty when the workflow is valid.
+
+        Without a reachable catalogue only the graph shape is checked.
+        """
+        nodes = self.catalog.get()
+        if nodes is None:
+            return self._check_graph(workflow, None)[0]
+
+        key = (WorkflowUtils.workflow_hash(workflow), self.catalog.version)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        errors, cacheable = self._check_graph(workflow, nodes)
+        if errors and self.catalog.refresh(min_age=Config.OBJECT_INFO_MIN_REFRESH):
+            # Newly installed nodes or models may be missing from our copy
+            nodes = self.catalog.nodes
+            key = (key[0], self.catalog.version)
+            errors, cacheable = self._check_graph(workflow, nodes)
+
+        if not cacheable:
+            # The missing image may be uploaded before the next attempt
+            return errors
+        with self._lock:
+            self._results[key] = errors
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return errors
+
+    def _check_graph(self, workflow: Dict[str, Any], nodes: Optional[Dict[str, Any]]) -> Tuple[List[str], bool]:
+        """Return the problems found and whether they can be memoized"""
+        errors = []
+        edges: Dict[str, List[str]] = {}
+        has_output = nodes is None
+        cacheable = True
+
+        for node_id, node in workflow.items():
+            class_type = node.get('class_type')
+            inputs = node.get('inputs', {})
+            edges[node_id] = []
+            if not isinstance(class_type, str):
+                errors.append(f"Node {node_id}: missing class_type")
+                continue
+            if not isinstance(inputs, dict):
+                errors.append(f"Node {node_id}: inputs must be an object")
+                continue
+
+            schema = None
+            if nodes is not None:
+                schema = nodes.get(class_type)
+                if schema is None:
+                    errors.append(f"Node {node_id}: unknown node type {class_type}")
+                    continue
+                has_output = has_output or bool(schema.get('output_node'))
+                spec = schema.get('input', {})
+                for name in spec.get('required', {}):
+                    if name not in inputs:
+                        errors.append(f"Node {node_id} ({class_type}): missing required input '{name}'")
+
+            for name, value in inputs.items():
+                input_spec = self._input_spec(schema, name) if schema else None
+                if self._is_link(value):
+                    source_id = str(value[0])
+                    edges[node_id].append(source_id)
+                    errors += self._check_link(node_id, name, value, input_spec, workflow, nodes)
+                elif input_spec is not None:
+                    error = self._check_value(input_spec, value)
+                    if error and self._accepts_upload(input_spec):
+                        if self.uploads.resolve(value) is not None:
+                            continue
+                        # Depends on the upload folder, not just the workflow
+                        cacheable = False
+                    if error:
+                        errors.append(f"Node {node_id} ({class_type}) input '{name}': {error}")
+
+        if not has_output:
+            errors.append("Workflow has no output node")
+        cycle = self._find_cycle(edges)
+        if cycle:
+            errors.append(f"Workflow has a cycle through nodes {' -> '.join(cycle)}")
+        return errors, cacheable
+
+    @staticmethod
+    def _is_link(value: Any) -> bool:
+        return (
+            isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], (str, int)) and isinstance(value[1], int)
+        )
+
+    @staticmethod
+    def _input_spec(schema: Dict[str, Any], name: str) -> Optional[list]:
+        spec = schema.get('input', {})
+        for section in ('required', 'optional'):
+            if name in spec.get(section, {}):
+                return spec[section][name]
+        return None
+
+    @staticmethod
+    def _accepts_upload(input_spec: list) -> bool:
+        """Uploaded input images reach a backend only when a prompt is dispatched there"""
+        options = input_spec[1] if len(input_spec) > 1 and isinstance(input_spec[1], dict) else {}
+        return bool(options.get('image_upload'))
+
+    def _check_link(self, node_id: str, name: str, link: list, input_spec: Optional[list],
+                    workflow: Dict[str, Any], nodes: Optional[Dict[str, Any]]) -> List[str]:
+        source_id, index = str(link[0]), link[1]
+        source = workflow.get(source_id)
+        if not isinstance(source, dict):
+            return [f"Node {node_id} input '{name}': links to missing node {source_id}"]
+        if nodes is None:
+            return []
+
+        source_schema = nodes.get(source.get('class_type'))
+        if source_schema is None:
+            # Reported on the source node itself
+            return []
+        outputs = source_schema.get('output', [])
+        if not 0 <= index < len(outputs):
+            return [f"Node {node_id} input '{name}': node {source_id} has no output {index}"]
+
+        expected = input_spec[0] if input_spec else None
+        produced = outputs[index]
+        if isinstance(expected, str) and isinstance(produced, str) and '*' not in (expected, produced):
+            if not set(expected.split(',')) & set(produced.split(',')):
+                return [f"Node {node_id} input '{name}': expects {expected} but node {source_id} output {index} is {produced}"]
+        return []
+
+    @staticmethod
+    def _check_value(input_spec: list, value: Any) -> Optional[str]:
+        kind = input_spec[0]
+        options = input_spec[1] if len(input_spec) > 1 and isinstance(input_spec[1], dict) else {}
+        if kind == 'COMBO':
+            kind = options.get('options', [])
+
+        if isinstance(kind, list):
+            if kind and value not in kind:
+                return f"{value!r} is not one of the allowed values"
+            return None
+        if kind == 'INT':
+            if not isinstance(value, int) or isinstance(value, bool):
+                return f"expected an integer, got {value!r}"
+        elif kind == 'FLOAT':
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return f"expected a number, got {value!r}"
+        elif kind == 'STRING':
+            if not isinstance(value, str):
+                return f"expected a string, got {value!r}"
+            return None
+        elif kind == 'BOOLEAN':
+            if not isinstance(value, bool):
+                return f"expected a boolean, got {value!r}"
+            return None
+        else:
+            # Custom widget types we cannot check
+            return None
+
+        if 'min' in options and value < options['min']:
+            return f"{value} is below the minimum of {options['min']}"
+        if 'max' in options and value > options['max']:
+            return f"{value} is above the maximum of {options['max']}"
+        return None
+
+    @staticmethod
+    def _find_cycle(edges: Dict[str, List[str]]) -> Optional[List[str]]:
+        """Iterative depth-first search over links; returns one cycle if any"""
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = {node_id: WHITE for node_id in edges}
+        for start in edges:
+            if color[start] != WHITE:
+                continue
+            stack = [(start, iter(edges[start]))]
+            path = [start]
+            color[start] = GREY
+            while stack:
+                node_id, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    color[node_id] = BLACK
+                    stack.pop()
+                    path.pop()
+                elif color.get(child) == GREY:
+                    return path[path.index(child):] + [child]
+                elif color.get(child) == WHITE:
+                    color[child] = GREY
+                    stack.append((child, iter(edges[child])))
+                    path.append(child)
+        return None
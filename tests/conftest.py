@@ -0,0 +1,13 @@
+import os
+import sys
+import time
+
+# Tests import the app's packages the way app.py does, from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def wait_until(predicate, timeout=5):
+    """Poll until predicate() holds; fails the test instead of hanging"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
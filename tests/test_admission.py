@@ -0,0 +1,119 @@
+import pytest
+from config.config import Config
+from services.admission import AdmissionController
+from services.backend_pool import Backend
+
+class FakePool:
+    def __init__(self, backends=1):
+        self.backends = [Backend(f"fake:{port}") for port in range(backends)]
+
+def controller(slots=1, backends=1):
+    admission = AdmissionController(FakePool(backends))
+    admission.slots_per_backend = slots
+    return admission
+
+def granted(*tickets):
+    return [ticket._granted.is_set() for ticket in tickets]
+
+def test_clients_take_turns_within_a_priority_class():
+    admission = controller(slots=1)
+    running = admission.admit('alice')
+    alice = [admission.admit('alice') for _ in range(3)]
+    bob = [admission.admit('bob') for _ in range(2)]
+
+    order = []
+    current = running
+    for _ in range(5):
+        admission.release(current)
+        current = next(t for t in alice + bob if t._granted.is_set() and t not in order)
+        order.append(current)
+
+    assert [t.client for t in order] == ['alice', 'bob', 'alice', 'bob', 'alice']
+
+def test_higher_priority_is_served_first():
+    admission = controller(slots=1)
+    running = admission.admit('alice')
+    low = admission.admit('alice', 'low')
+    high = admission.admit('bob', 'high')
+
+    admission.release(running)
+
+    assert granted(high, low) == [True, False]
+
+def test_batch_tickets_are_charged_per_prompt():
+    admission = controller(slots=2, backends=2)
+    batch = admission.admit('alice', cost=3)
+    single = admission.admit('bob')
+    waiting = admission.admit('carol')
+
+    assert granted(batch, single, waiting) == [True, True, False]
+    assert admission.stats()['active'] == 4
+
+    admission.release(batch)
+    assert granted(waiting) == [True]
+    assert admission.stats()['active'] == 2
+
+def test_oversized_batch_runs_alone_without_being_overtaken():
+    admission = controller(slots=2)
+    running = admission.admit('alice')
+    batch = admission.admit('bob', cost=10)
+    later = admission.admit('carol')
+
+    assert granted(batch, later) == [False, False]
+
+    admission.release(running)
+    assert granted(batch, later) == [True, False]
+
+    admission.release(batch)
+    assert granted(later) == [True]
+
+def test_cancelled_ticket_leaves_the_queue():
+    admission = controller(slots=1)
+    running = admission.admit('alice')
+    waiting = admission.admit('bob')
+
+    admission._abort(waiting)
+    admission.release(running)
+
+    assert waiting.aborted
+    assert admission.stats()['pending']['normal'] == 0
+    assert admission.stats()['active'] == 0
+
+def test_check_does_not_take_a_place_in_the_queue():
+    admission = controller(slots=1)
+    running = admission.admit('alice')
+
+    admission.check('bob')
+
+    assert admission.stats()['pending']['normal'] == 0
+    admission.release(running)
+    assert admission.stats()['active'] == 0
+
+def test_cancelling_a_running_ticket_frees_its_slot():
+    admission = controller(slots=1)
+    running = admission.admit('alice')
+    waiting = admission.admit('bob')
+
+    admission._abort(running)
+
+    assert running.released
+    assert granted(waiting) == [True]
+    admission.release(running)
+    admission.release(waiting)
+    assert admission.stats()['active'] == 0
+
+@pytest.mark.parametrize('scheduler, micro_batch, expected', [
+    (False, False, 2),
+    (True, False, 2 + 8),
+    (False, True, 2 * 8),
+    (True, True, (2 + 8) * 8),
+])
+def test_slots_leave_room_for_scheduling_and_packing(monkeypatch, scheduler, micro_batch, expected):
+    monkeypatch.setattr(Config, 'ADMISSION_SLOTS_PER_BACKEND', 2)
+    monkeypatch.setattr(Config, 'SCHEDULER_MAX_INFLIGHT_PER_BACKEND', 2)
+    monkeypatch.setattr(Config, 'SCHEDULER_REORDER_DEPTH', 8)
+    monkeypatch.setattr(Config, 'MICRO_BATCH_MAX_SIZE', 8)
+    monkeypatch.setattr(Config, 'MODEL_SCHEDULER_ENABLED', scheduler)
+    monkeypatch.setattr(Config, 'MICRO_BATCH_ENABLED', micro_batch)
+
+    assert AdmissionController.default_slots_per_backend() == expected
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from services.async_comfyui import AsyncComfyUIService
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+
+WORKFLOW = {'3': {'class_type': 'KSampler', 'inputs': {'seed': 7}}}
+
+class FakeGeneration:
+    """Stands in for generate_images; registers its prompt for cancellation like submit_prompt"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = asyncio.Event()
+        self.cancelled = []
+        self.calls = 0
+
+    async def __call__(self, workflow, timeout):
+        self.calls += 1
+        token = current_token()
+        token.register(self, lambda: self.cancelled.append(token))
+        self.started.set()
+        while not (self.release.is_set() or token.cancelled):
+            await asyncio.sleep(0.001)
+        token.check()
+        return {'9': [b'png']}
+
+def service(generation):
+    service = AsyncComfyUIService.__new__(AsyncComfyUIService)
+    service.result_cache = None
+    service._in_flight = {}
+    service.generate_images = generation
+    return service
+
+async def in_job(token, coro_factory):
+    with cancellable(token):
+        return await coro_factory()
+
+def test_follower_survives_the_leaders_request_going_away():
+    async def scenario():
+        generation = FakeGeneration()
+        comfy = service(generation)
+        leader = asyncio.create_task(comfy.generate(WORKFLOW, 5))
+        await generation.started.wait()
+        follower = asyncio.create_task(comfy.generate(WORKFLOW, 5))
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        generation.release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        result = await follower
+        assert result.coalesced and result.images == {'9': [b'png']}
+        assert generation.cancelled == []
+
+    asyncio.run(scenario())
+
+def test_cancelling_the_leaders_job_leaves_the_run_to_the_follower():
+    async def scenario():
+        generation = FakeGeneration()
+        comfy = service(generation)
+        alice, bob = CancellationToken(), CancellationToken()
+        leader = asyncio.create_task(in_job(alice, lambda: comfy.generate(WORKFLOW, 5)))
+        await generation.started.wait()
+        follower = asyncio.create_task(in_job(bob, lambda: comfy.generate(WORKFLOW, 5)))
+        await asyncio.sleep(0.01)
+
+        alice.cancel()
+        with pytest.raises(GenerationCancelled):
+            await leader
+        generation.release.set()
+
+        assert (await follower).images == {'9': [b'png']}
+        assert generation.cancelled == []
+
+    asyncio.run(scenario())
+
+def test_run_is_cancelled_once_every_caller_has_gone():
+    async def scenario():
+        generation = FakeGeneration()
+        comfy = service(generation)
+        tokens = [CancellationToken(), CancellationToken()]
+        callers = []
+        for token in tokens:
+            callers.append(asyncio.create_task(in_job(token, lambda: comfy.generate(WORKFLOW, 5))))
+            await generation.started.wait()
+        await asyncio.sleep(0.01)
+
+        for token in tokens:
+            token.cancel()
+        for caller in callers:
+            with pytest.raises(GenerationCancelled):
+                await caller
+        await asyncio.sleep(0.01)
+
+        assert len(generation.cancelled) == 1
+        assert comfy._in_flight == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,23 @@
+import threading
+from services import backend_pool
+from services.backend_pool import BackendPool
+from conftest import wait_until
+
+def test_hanging_backend_does_not_hold_up_the_others(monkeypatch):
+    hang = threading.Event()
+    polled = []
+
+    def poll(self, backend):
+        if backend.address == 'slow:1':
+            hang.wait()
+        polled.append(backend.address)
+
+    monkeypatch.setattr(backend_pool.ComfyUIWebSocketManager, 'for_server', lambda address: None)
+    monkeypatch.setattr(BackendPool, '_poll', poll)
+    pool = BackendPool(['slow:1', 'fast:1'], poll_interval=0.01)
+    try:
+        wait_until(lambda: polled.count('fast:1') >= 3)
+        assert 'slow:1' not in polled
+    finally:
+        pool.stop()
+        hang.set()
@@ -0,0 +1,70 @@
+import time
+import pytest
+from flask import Flask
+from config.config import Config
+from controllers.image_controller import ImageController
+from utils.request_utils import positive_number
+from utils.workflow_utils import WorkflowUtils
+
+app = Flask(__name__)
+
+def generate_batch(body):
+    # Oversized and malformed requests are rejected before any service is touched
+    controller = ImageController.__new__(ImageController)
+    controller.workflow_utils = WorkflowUtils.__new__(WorkflowUtils)
+    controller.upload_store = None
+    with app.test_request_context(json=body):
+        return controller.generate_batch()
+
+def test_sweep_size_matches_the_expansion():
+    utils = WorkflowUtils.__new__(WorkflowUtils)
+    prompts, seeds, grid = ['a', 'b'], [1, 2, 3], {'steps': [10, 20], 'cfg_scale': [], 'width': [512]}
+
+    variants = utils.expand_parameter_sweep({'positive_prompt': 'x'}, prompts, seeds, grid)
+
+    assert utils.sweep_size(prompts, len(seeds), grid) == len(variants) == 12
+    assert utils.sweep_size(None, 0, None) == len(utils.expand_parameter_sweep({}, None, None, None)) == 1
+
+def test_huge_count_is_rejected_without_building_the_sweep():
+    started = time.perf_counter()
+
+    body, status = generate_batch({'positive_prompt': 'cat', 'count': 10 ** 12, 'grid': {'steps': [10, 20]}})
+
+    assert status == 400
+    assert f"the limit is {Config.BATCH_MAX_ITEMS}" in body['error']
+    assert time.perf_counter() - started < 0.1
+
+@pytest.mark.parametrize('field, value', [
+    ('count', 'ten'),
+    ('count', 2.5),
+    ('count', -1),
+    ('count', True),
+    ('timeout', 'soon'),
+    ('timeout', 0),
+    ('timeout', float('nan')),
+    ('seeds', 5),
+    ('seeds', [1, 'two']),
+    ('prompts', 'a cat'),
+    ('grid', {'steps': 20}),
+    ('grid', ['steps']),
+    ('grid', {'model': ['a']}),
+])
+def test_malformed_batch_fields_are_a_client_error(field, value):
+    body, status = generate_batch({'positive_prompt': 'cat', field: value})
+
+    assert status == 400
+    assert field in body['error']
+
+def test_positive_number_returns_the_default_when_absent():
+    assert positive_number({}, 'timeout', 300) == 300
+    assert positive_number({'timeout': 2.5}, 'timeout', 300) == 2.5
+    with pytest.raises(ValueError):
+        positive_number({'count': 2.5}, 'count', integer=True)
+
+def test_non_numeric_generate_timeout_is_a_client_error():
+    controller = ImageController.__new__(ImageController)
+    with app.test_request_context(json={'positive_prompt': 'cat', 'timeout': '30s'}):
+        body, status = controller.generate_image()
+
+    assert status == 400
+    assert 'timeout' in body['error']
@@ -0,0 +1,65 @@
+import pytest
+from services import errors
+from services.bulk_runner import BulkRunner
+from services.comfyui_service import GenerationResult
+from services.errors import BackendUnavailable, PromptRejected
+from utils.workflow_utils import WorkflowUtils
+
+ITEM = {'workflow': {'3': {'class_type': 'KSampler', 'inputs': {'seed': 1}}}}
+
+class FlakyService:
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def generate(self, workflow, timeout, use_cache):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return GenerationResult({})
+
+def runner(service, retries):
+    runner = BulkRunner.__new__(BulkRunner)
+    runner.service = service
+    runner.workflow_utils = WorkflowUtils.__new__(WorkflowUtils)
+    runner.retries = retries
+    runner.timeout = 5
+    runner.use_cache = True
+    runner.entries = []
+    runner._record = runner.entries.append
+    return runner
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(errors.time, 'sleep', delays.append)
+    return delays
+
+def test_transient_failures_are_retried_with_backoff(sleeps):
+    service = FlakyService(BackendUnavailable('down'), BackendUnavailable('down'))
+    bulk = runner(service, retries=2)
+
+    bulk._run_item(1, ITEM)
+
+    assert service.calls == 3
+    assert len(sleeps) == 2
+    assert bulk.entries[0]['status'] == 'succeeded'
+
+def test_rejected_prompts_are_not_retried(sleeps):
+    service = FlakyService(PromptRejected('bad node'))
+    bulk = runner(service, retries=3)
+
+    bulk._run_item(1, ITEM)
+
+    assert service.calls == 1
+    assert sleeps == []
+    assert bulk.entries[0] == {**bulk.entries[0], 'status': 'failed', 'error': 'bad node'}
+
+def test_item_fails_once_its_retries_are_used_up(sleeps):
+    service = FlakyService(*[BackendUnavailable('down')] * 5)
+    bulk = runner(service, retries=1)
+
+    bulk._run_item(1, ITEM)
+
+    assert service.calls == 2
+    assert bulk.entries[0]['status'] == 'failed'
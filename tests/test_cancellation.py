@@ -0,0 +1,134 @@
+import threading
+import time
+import pytest
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+from services.comfyui_service import ComfyUIService, GenerationResult
+from services.single_flight import SingleFlight
+from conftest import wait_until
+
+class FakeRun:
+    """Work that lasts until released or cancelled through its cancellation token"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        current_token().register(self, self.cancelled.set)
+        self.started.set()
+        while not (self.release.is_set() or self.cancelled.is_set()):
+            time.sleep(0.001)
+        current_token().check()
+        return 'images'
+
+def in_job(token, call):
+    """Run call on a thread under a job's cancellation token"""
+    outcome = {}
+
+    def run():
+        with cancellable(token):
+            try:
+                outcome['result'] = call()
+            except Exception as e:
+                outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+def join(flight, run, callers):
+    tokens = [CancellationToken() for _ in range(callers)]
+    jobs = []
+    for token in tokens:
+        jobs.append(in_job(token, lambda: flight.do('k', run, timeout=5)))
+        if len(jobs) == 1:
+            assert run.started.wait(5)
+    wait_until(lambda: flight.stats()['coalesced'] == callers - 1)
+    return tokens, jobs
+
+def test_cancelling_the_leader_leaves_the_run_to_its_followers():
+    flight, run = SingleFlight(), FakeRun()
+    (alice, bob), ((alice_thread, alice_outcome), (bob_thread, bob_outcome)) = join(flight, run, 2)
+
+    alice.cancel()
+    alice_thread.join(5)
+    run.release.set()
+    bob_thread.join(5)
+
+    assert isinstance(alice_outcome['error'], GenerationCancelled)
+    assert not run.cancelled.is_set()
+    assert bob_outcome['result'] == ('images', True)
+
+def test_cancelling_a_follower_only_detaches_it():
+    flight, run = SingleFlight(), FakeRun()
+    (alice, bob), ((alice_thread, alice_outcome), (bob_thread, bob_outcome)) = join(flight, run, 2)
+
+    bob.cancel()
+    bob_thread.join(5)
+    run.release.set()
+    alice_thread.join(5)
+
+    assert isinstance(bob_outcome['error'], GenerationCancelled)
+    assert alice_outcome['result'] == ('images', False)
+
+def test_run_is_cancelled_when_its_last_caller_cancels():
+    flight, run = SingleFlight(), FakeRun()
+    tokens, jobs = join(flight, run, 3)
+
+    for token in tokens[:2]:
+        token.cancel()
+    time.sleep(0.05)
+    assert not run.cancelled.is_set()
+
+    tokens[2].cancel()
+    assert run.cancelled.wait(5)
+    for thread, outcome in jobs:
+        thread.join(5)
+        assert isinstance(outcome['error'], GenerationCancelled)
+    assert flight.stats()['in_flight'] == 0
+
+def test_new_caller_after_everyone_cancelled_starts_a_fresh_run():
+    flight, run = SingleFlight(), FakeRun()
+    (alice,), ((alice_thread, _),) = join(flight, run, 1)
+    alice.cancel()
+    alice_thread.join(5)
+
+    rerun = FakeRun()
+    rerun.release.set()
+
+    assert flight.do('k', rerun) == ('images', False)
+    assert rerun.calls == 1
+
+def test_cancelled_coalesced_generation_does_not_cancel_the_others_prompt(monkeypatch):
+    monkeypatch.setattr(ComfyUIService, 'in_flight', SingleFlight('workflow'))
+    service = ComfyUIService.__new__(ComfyUIService)
+    service.result_cache = None
+    service.micro_batcher = None
+    cancelled_prompts = []
+
+    def execute(workflow, timeout):
+        # What submit_prompt does: the prompt is cancelled with the current token
+        current_token().register(service, lambda: cancelled_prompts.append(workflow))
+        time.sleep(0.2)
+        current_token().check()
+        return GenerationResult({'9': [b'png']})
+    service._execute = execute
+    workflow = {'3': {'class_type': 'KSampler', 'inputs': {'seed': 7}}}
+
+    alice, bob = CancellationToken(), CancellationToken()
+    alice_thread, alice_outcome = in_job(alice, lambda: service.generate(workflow, 5))
+    wait_until(lambda: ComfyUIService.in_flight.stats()['in_flight'])
+    bob_thread, bob_outcome = in_job(bob, lambda: service.generate(workflow, 5))
+    wait_until(lambda: ComfyUIService.in_flight.stats()['coalesced'])
+
+    alice.cancel()
+    alice_thread.join(5)
+    bob_thread.join(5)
+
+    assert isinstance(alice_outcome['error'], GenerationCancelled)
+    assert bob_outcome['result'].images == {'9': [b'png']}
+    assert bob_outcome['result'].coalesced
+    assert cancelled_prompts == []
@@ -0,0 +1,38 @@
+import http.client
+import pytest
+from services.http_client import HTTPConnectionPool
+
+class DroppedConnection:
+    """Idle keep-alive connection the server has already closed"""
+
+    def request(self, method, path, body=None, headers=None):
+        pass
+
+    def getresponse(self):
+        raise http.client.RemoteDisconnected('closed')
+
+    def close(self):
+        pass
+
+def pool_with_dropped_connection(monkeypatch):
+    pool = HTTPConnectionPool('fake:1')
+    pool._idle.put(DroppedConnection())
+    fresh = []
+    monkeypatch.setattr(pool, '_new_connection', lambda: fresh.append(1) or DroppedConnection())
+    return pool, fresh
+
+def test_idempotent_request_is_replayed_on_a_new_connection(monkeypatch):
+    pool, fresh = pool_with_dropped_connection(monkeypatch)
+
+    with pytest.raises(http.client.RemoteDisconnected):
+        pool._exchange('GET', '/queue', None, {})
+
+    assert fresh == [1]
+
+def test_post_is_not_replayed_once_sent(monkeypatch):
+    pool, fresh = pool_with_dropped_connection(monkeypatch)
+
+    with pytest.raises(http.client.RemoteDisconnected):
+        pool._exchange('POST', '/prompt', b'{}', {})
+
+    assert fresh == []
@@ -0,0 +1,11 @@
+from utils.image_index import ImageIndex
+
+def test_rebuild_keeps_images_still_being_written(tmp_path):
+    index = ImageIndex(tmp_path)
+    index.add('pending.png', 10)
+    index.add('gone.png', 10)
+
+    result = index.rebuild(keep=lambda name: name == 'pending.png')
+
+    assert result['removed'] == 1
+    assert [image['filename'] for image in index.query(10)[0]] == ['pending.png']
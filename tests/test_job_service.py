@@ -0,0 +1,13 @@
+from services.job_service import Job, JobStore
+
+def test_eviction_skips_jobs_still_being_finished():
+    store = JobStore(ttl=0)
+    job = Job('image')
+    store.add(job)
+    # Terminal state seen before finished_at is recorded
+    job.state = Job.SUCCEEDED
+
+    assert store.get(job.id) is job
+
+    job.finished_at = 0
+    assert store.get(job.id) is None
@@ -0,0 +1,133 @@
+import threading
+import time
+import pytest
+from config.config import Config
+from services.cancellation import CancellationToken, GenerationCancelled, cancellable, current_token
+from services.comfyui_service import ComfyUIService
+from services.micro_batcher import MicroBatcher
+from conftest import wait_until
+
+def workflow(seed):
+    return {
+        '3': {'class_type': 'KSampler', 'inputs': {'seed': seed}},
+        '5': {'class_type': 'EmptyLatentImage', 'inputs': {'batch_size': 1}},
+        '9': {'class_type': 'SaveImage', 'inputs': {}}
+    }
+
+class FakeRun:
+    """Stands in for ComfyUIService.generate_images; returns once released or cancelled"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+        self.runs = []
+
+    def __call__(self, merged, timeout):
+        self.runs.append(merged)
+        token = current_token()
+        token.register(self, self.cancelled.set)
+        self.started.set()
+        while not (self.release.is_set() or self.cancelled.is_set()):
+            time.sleep(0.001)
+        token.check()
+        batch = merged['5']['inputs']['batch_size']
+        return {'9': [f"image-{i}".encode() for i in range(batch)]}
+
+def submit_in_job(batcher, seed, token):
+    """Submit from a thread running under a job's cancellation token"""
+    outcome = {}
+
+    def run():
+        with cancellable(token):
+            try:
+                outcome['result'] = batcher.submit(workflow(seed), timeout=5)
+            except Exception as e:
+                outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+def test_cancelling_one_member_leaves_the_packed_run_to_the_others():
+    run = FakeRun()
+    batcher = MicroBatcher(run, window=0.05)
+    alice, bob = CancellationToken(), CancellationToken()
+    alice_thread, alice_outcome = submit_in_job(batcher, 1, alice)
+    bob_thread, bob_outcome = submit_in_job(batcher, 2, bob)
+    assert run.started.wait(5)
+
+    alice.cancel()
+    alice_thread.join(5)
+    run.release.set()
+    bob_thread.join(5)
+
+    assert isinstance(alice_outcome['error'], GenerationCancelled)
+    assert not run.cancelled.is_set()
+    assert bob_outcome['result'].images == {'9': [b'image-1']}
+    assert bob_outcome['result'].packed == 2
+
+def test_packed_run_is_cancelled_once_every_member_cancels():
+    run = FakeRun()
+    batcher = MicroBatcher(run, window=0.05)
+    tokens = [CancellationToken(), CancellationToken()]
+    jobs = [submit_in_job(batcher, seed, token) for seed, token in enumerate(tokens)]
+    assert run.started.wait(5)
+
+    for token in tokens:
+        token.cancel()
+    for thread, outcome in jobs:
+        thread.join(5)
+        assert isinstance(outcome['error'], GenerationCancelled)
+
+    assert run.cancelled.wait(5)
+
+def test_group_cancelled_before_its_window_closes_never_runs():
+    run = FakeRun()
+    batcher = MicroBatcher(run, window=0.1)
+    token = CancellationToken()
+    thread, outcome = submit_in_job(batcher, 1, token)
+    wait_until(lambda: batcher._groups)
+
+    token.cancel()
+    thread.join(5)
+    time.sleep(0.2)
+
+    assert isinstance(outcome['error'], GenerationCancelled)
+    assert run.runs == []
+
+class FakeCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, images):
+        self.entries[key] = images
+
+def test_packed_shares_are_not_cached_under_their_own_seed(monkeypatch):
+    monkeypatch.setattr(Config, 'MICRO_BATCH_PINNED_SEEDS', True)
+    run = FakeRun()
+    run.release.set()
+    service = ComfyUIService.__new__(ComfyUIService)
+    service.result_cache = FakeCache()
+    service.micro_batcher = MicroBatcher(run, window=0.05)
+
+    results = [None, None]
+
+    def generate(index, seed):
+        results[index] = service.generate(workflow(seed), timeout=5)
+
+    threads = [threading.Thread(target=generate, args=(i, seed)) for i, seed in enumerate((11, 22))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert [result.packing['requests'] for result in results] == [2, 2]
+    assert service.result_cache.entries == {}
+
+    alone = service.generate(workflow(33), timeout=5)
+    assert alone.packing['requests'] == 1
+    assert list(service.result_cache.entries.values()) == [alone.images]
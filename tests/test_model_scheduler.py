@@ -0,0 +1,65 @@
+import threading
+from services.backend_pool import Backend, BackendPool
+from services.comfyui_service import ComfyUIService
+from services.errors import BackendUnavailable
+from services.model_scheduler import ModelAffinityScheduler
+from services.websocket_manager import PromptWaiter
+from conftest import wait_until
+
+def pool(*addresses):
+    # A pool without the health poller; backends stay as the test sets them
+    pool = BackendPool.__new__(BackendPool)
+    pool.backends = [Backend(address) for address in addresses]
+    pool.poll_interval = 1
+    pool._lock = threading.Lock()
+    return pool
+
+class FakeUploader:
+    def forget(self, server_address):
+        pass
+
+def workflow(ckpt):
+    return {'4': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': ckpt}}}
+
+def test_prompt_for_a_dead_backend_is_requeued_for_a_healthy_one():
+    service = ComfyUIService.__new__(ComfyUIService)
+    service.backend_pool = pool('dead:1', 'live:1')
+    service.input_uploader = FakeUploader()
+    attempts = []
+
+    def submit_to(server_address, workflow, waiter=None):
+        attempts.append(server_address)
+        if server_address == 'dead:1':
+            raise BackendUnavailable(f"connection refused by {server_address}")
+        waiter.server_address = server_address
+        return waiter
+    service._submit_to = submit_to
+    scheduler = ModelAffinityScheduler(service.backend_pool, service._dispatch_scheduled, max_inflight=1)
+    waiter = PromptWaiter('p1')
+
+    scheduler.enqueue(waiter, workflow('a.safetensors'))
+
+    wait_until(lambda: waiter.server_address == 'live:1')
+    assert attempts == ['dead:1', 'live:1']
+    assert not waiter.future.done()
+    assert not service.backend_pool.get('dead:1').healthy
+    assert waiter.backend is service.backend_pool.get('live:1')
+
+def test_free_backend_takes_more_of_the_model_it_has_loaded():
+    dispatched = []
+    backends = pool('gpu:1')
+    release = threading.Event()
+
+    def dispatch(backend, waiter, workflow):
+        dispatched.append(waiter.prompt_id)
+        # Finish each prompt right away once the queue has been filled
+        release.wait(5)
+        waiter.set_done()
+
+    scheduler = ModelAffinityScheduler(backends, dispatch, max_inflight=1, fairness_window=60)
+    for prompt_id, ckpt in (('a1', 'a'), ('b1', 'b'), ('a2', 'a'), ('b2', 'b'), ('a3', 'a')):
+        scheduler.enqueue(PromptWaiter(prompt_id), workflow(ckpt))
+    release.set()
+
+    wait_until(lambda: len(dispatched) == 5)
+    assert dispatched == ['a1', 'a2', 'a3', 'b1', 'b2']
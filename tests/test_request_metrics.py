@@ -0,0 +1,49 @@
+import pytest
+from flask import Response
+from config.config import Config
+from services.metrics import HTTP_IN_FLIGHT
+
+def in_flight():
+    return sum(HTTP_IN_FLIGHT._values.values())
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    for name in ('UPLOAD_FOLDER', 'OUTPUT_FOLDER', 'RESULT_CACHE_FOLDER', 'VARIANT_CACHE_FOLDER'):
+        monkeypatch.setattr(Config, name, str(tmp_path / name.lower()))
+    from app import create_app
+    app = create_app()
+    app.testing = False
+    seen = []
+
+    @app.route('/stream')
+    def stream():
+        def body():
+            seen.append(in_flight())
+            yield b'{}\n'
+        return Response(body(), mimetype='application/x-ndjson')
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    client = app.test_client()
+    client.seen = seen
+    return client
+
+def test_streamed_request_is_in_flight_until_its_body_is_sent(client):
+    before = in_flight()
+
+    response = client.get('/stream')
+    assert response.data == b'{}\n'
+    response.close()
+
+    assert client.seen == [before + 1]
+    assert in_flight() == before
+
+def test_failed_request_leaves_the_gauge(client):
+    before = in_flight()
+
+    response = client.get('/boom')
+    assert response.status_code == 500
+    response.close()
+    assert in_flight() == before
@@ -0,0 +1,78 @@
+import threading
+import pytest
+from services.errors import GenerationTimeout
+from services.single_flight import SingleFlight
+from conftest import wait_until
+
+def run_concurrently(flight, key, work, callers):
+    """Start callers that all join one flight; returns their results once done"""
+    results = [None] * callers
+    errors = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flight.do(key, work, timeout=5)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'images'
+
+    threads, results, errors = run_concurrently(flight, 'k', work, 4)
+    wait_until(lambda: flight.stats()['coalesced'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert sorted(results, key=lambda r: r[1]) == [('images', False)] + [('images', True)] * 3
+    assert errors == [None] * 4
+    assert flight.stats() == {'executions': 1, 'coalesced': 3, 'in_flight': 0}
+
+def test_followers_receive_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(5)
+        raise ValueError('bad workflow')
+
+    threads, results, errors = run_concurrently(flight, 'k', work, 3)
+    wait_until(lambda: flight.stats()['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(e, ValueError) for e in errors)
+
+def test_key_is_released_once_the_call_finishes():
+    flight = SingleFlight()
+
+    assert flight.do('k', lambda: 1) == (1, False)
+    assert flight.do('k', lambda: 2) == (2, False)
+    assert flight.stats()['executions'] == 2
+
+def test_follower_gives_up_after_its_timeout():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=('k', lambda: release.wait(5)))
+    leader.start()
+    wait_until(lambda: flight.stats()['in_flight'])
+
+    with pytest.raises(GenerationTimeout, match='Timed out'):
+        flight.do('k', lambda: None, timeout=0.05)
+
+    release.set()
+    leader.join(5)
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import struct
+import pytest
+from services.errors import ExecutionFailed
+from services.websocket_manager import ComfyUIWebSocketManager, PromptRouter
+
+class FakeHTTP:
+    """Answers /history/<id> from a dict of history entries"""
+
+    def __init__(self, history):
+        self.history = history
+
+    def get(self, path):
+        prompt_id = path.rsplit('/', 1)[1]
+        entry = self.history.get(prompt_id)
+        return json.dumps({prompt_id: entry} if entry is not None else {}).encode('utf-8')
+
+def history_entry(status_str='success', completed=True, messages=()):
+    return {'outputs': {}, 'status': {'status_str': status_str, 'completed': completed, 'messages': list(messages)}}
+
+def output_frame(data: bytes) -> bytes:
+    return struct.pack('>II', 1, 2) + data
+
+def test_routes_completion_to_the_waiting_prompt():
+    router = PromptRouter('fake:1')
+    first = router.register('a')
+    second = router.register('b')
+
+    router._dispatch({'type': 'executing', 'data': {'prompt_id': 'b', 'node': None}})
+
+    assert second.future.result(0) == 'b'
+    assert not first.future.done()
+
+def test_result_arriving_before_registration_is_not_lost():
+    router = PromptRouter('fake:1')
+    router._dispatch({'type': 'execution_error', 'data': {'prompt_id': 'a', 'node_id': '3', 'exception_message': 'boom'}})
+
+    waiter = router.register('a')
+
+    with pytest.raises(ExecutionFailed, match='boom'):
+        waiter.future.result(0)
+
+def test_rename_settles_a_prompt_that_already_finished_under_the_new_id():
+    router = PromptRouter('fake:1')
+    waiter = router.register('local-id')
+    router._dispatch({'type': 'executing', 'data': {'prompt_id': 'server-id', 'node': None}})
+
+    router.rename('local-id', 'server-id')
+
+    assert waiter.future.result(0) == 'server-id'
+
+def test_binary_frames_go_to_the_executing_output_node():
+    router = PromptRouter('fake:1')
+    waiter = router.register('a', ws_output_nodes=['9'])
+    router._dispatch({'type': 'executing', 'data': {'prompt_id': 'a', 'node': '9'}})
+
+    router._dispatch_binary(output_frame(b'png'))
+
+    assert waiter.ws_outputs == {'9': [b'png']}
+
+def resync(manager, history):
+    manager.http = FakeHTTP(history)
+    manager._resync_pending()
+
+def test_resync_completes_prompts_that_finished_while_disconnected():
+    manager = ComfyUIWebSocketManager('fake:1')
+    done = manager.register('done')
+    running = manager.register('running')
+
+    resync(manager, {'done': history_entry()})
+
+    assert done.future.result(0) == 'done'
+    assert not running.future.done()
+
+def test_resync_fails_prompts_whose_history_shows_an_error():
+    manager = ComfyUIWebSocketManager('fake:1')
+    failed = manager.register('failed')
+    interrupted = manager.register('interrupted')
+
+    resync(manager, {
+        'failed': history_entry('error', False, [['execution_error', {'node_id': '3', 'exception_message': 'OOM'}]]),
+        'interrupted': history_entry('error', False, [['execution_interrupted', {}]])
+    })
+
+    with pytest.raises(ExecutionFailed, match='OOM'):
+        failed.future.result(0)
+    with pytest.raises(ExecutionFailed, match='interrupted'):
+        interrupted.future.result(0)
+
+def test_resync_fails_prompts_whose_websocket_outputs_were_lost():
+    manager = ComfyUIWebSocketManager('fake:1')
+    lost = manager.register('lost', ws_output_nodes=['9'])
+    received = manager.register('received', ws_output_nodes=['9'])
+    received.add_ws_output('9', b'png')
+
+    resync(manager, {'lost': history_entry(), 'received': history_entry()})
+
+    with pytest.raises(ExecutionFailed, match='lost'):
+        lost.future.result(0)
+    assert received.future.result(0) == 'received'
+
+def test_async_client_resync_checks_history_status():
+    from services.async_comfyui import AsyncComfyUIClient
+
+    client = AsyncComfyUIClient('fake:1')
+    http = FakeHTTP({
+        'done': history_entry(),
+        'failed': history_entry('error', False, [['execution_error', {'node_id': '3', 'exception_message': 'OOM'}]])
+    })
+
+    async def request(method, path, body=None, headers=None):
+        return http.get(path)
+    client.request = request
+    done = client.register('done')
+    failed = client.register('failed')
+
+    asyncio.run(client._resync_pending())
+
+    assert done.future.result(0) == 'done'
+    with pytest.raises(ExecutionFailed, match='OOM'):
+        failed.future.result(0)
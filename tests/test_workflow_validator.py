@@ -0,0 +1,65 @@
+import json
+from services import workflow_validator
+from services.backend_pool import Backend
+from services.errors import BackendUnavailable
+from services.workflow_validator import NodeCatalog, WorkflowValidator
+from utils.upload_store import UploadStore
+
+IMAGE = 'a' * 64 + '.png'
+
+NODES = {
+    'LoadImage': {
+        'input': {'required': {'image': [['example.png'], {'image_upload': True}]}},
+        'output': ['IMAGE', 'MASK'],
+    },
+    'SaveImage': {
+        'input': {'required': {'images': ['IMAGE']}},
+        'output': [],
+        'output_node': True,
+    },
+}
+
+WORKFLOW = {
+    '1': {'class_type': 'LoadImage', 'inputs': {'image': IMAGE}},
+    '2': {'class_type': 'SaveImage', 'inputs': {'images': ['1', 0]}},
+}
+
+class FakeCatalog:
+    nodes = NODES
+    version = 'v1'
+
+    def get(self):
+        return self.nodes
+
+    def refresh(self, min_age=0):
+        return False
+
+def test_missing_upload_is_not_memoized(tmp_path):
+    validator = WorkflowValidator(FakeCatalog(), cache_size=8)
+    validator.uploads = UploadStore(tmp_path)
+
+    assert validator.validate(WORKFLOW) == [
+        f"Node 1 (LoadImage) input 'image': {IMAGE!r} is not one of the allowed values"
+    ]
+
+    (tmp_path / IMAGE).write_bytes(b'\x89PNG\r\n\x1a\n')
+    assert validator.validate(WORKFLOW) == []
+
+class FakeHTTP:
+    def __init__(self, address):
+        self.address = address
+
+    def get(self, path):
+        if self.address == 'down:1':
+            raise BackendUnavailable('connection refused')
+        return json.dumps(NODES).encode()
+
+class FakePool:
+    backends = [Backend('down:1'), Backend('up:1')]
+
+def test_refresh_falls_through_to_the_next_backend(monkeypatch):
+    monkeypatch.setattr(workflow_validator.HTTPConnectionPool, 'for_host', FakeHTTP)
+    catalog = NodeCatalog(FakePool(), ttl=60)
+
+    assert catalog.refresh()
+    assert catalog.nodes == NODES
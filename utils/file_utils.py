@@ -1,7 +1,10 @@
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from config.config import Config
+from services.metrics import stage
+from utils.image_index import ImageIndex
+from utils.image_store import ImageStore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,51 +13,74 @@ class FileUtils:
     def __init__(self):
         self.output_folder = Path(Config.OUTPUT_FOLDER)
         self.output_folder.mkdir(exist_ok=True)
+        self.index = ImageIndex.for_folder(self.output_folder)
+        self.store = ImageStore.for_folder(self.output_folder)
     
-    def save_image(self, image_data: bytes, filename: str) -> Path:
-        """Save image data to file"""
+    def save_image(self, image_data: bytes, metadata: Dict[str, Any] = None) -> Path:
+        """Store image data under its content hash and record it in the image index.
+        
+        The file is written in the background; the returned path is final.
+        """
         try:
-            filepath = self.output_folder / filename
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
-            
-            logger.info(f"Image saved: {filepath}")
+            with stage('save'):
+                filename, filepath, write = self.store.put(image_data)
+                self.index.add(filename, len(image_data), metadata=metadata)
+            write.add_done_callback(lambda done: self._on_written(filename, done))
             return filepath
             
         except Exception as e:
-            logger.error(f"Failed to save image {filename}: {e}")
+            logger.error(f"Failed to save image: {e}")
             raise
     
-    def get_image_path(self, filename: str) -> Path:
-        """Get full path for image file"""
-        return self.output_folder / filename
+    def _on_written(self, filename: str, write):
+        if write.exception() is not None:
+            self.index.remove(filename)
+        else:
+            logger.info(f"Image saved: {write.result()}")
+    
+    def get_image_path(self, filename: str) -> Optional[Path]:
+        """Get full path for a stored image, or None if it does not exist"""
+        return self.store.resolve(filename)
+    
+    def touch(self, filename: str):
+        """Record a read of an image for least-recently-used retention"""
+        self.index.touch(filename)
+    
+    def get_image_version(self, filename: str, filepath: Path = None) -> str:
+        """ETag-style validator for a stored image"""
+        return self.store.version(filename, filepath)
     
-    def list_images(self) -> List[Dict[str, Any]]:
-        """List all saved images"""
+    def get_pending_image(self, filename: str) -> Optional[bytes]:
+        """Bytes of an image that is still being written"""
+        return self.store.pending(filename)
+    
+    def list_images(self, limit: int = None, cursor: str = None, since: float = None, until: float = None,
+                    seed: int = None, prompt: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """List saved images newest first, one page at a time"""
         try:
-            images = []
-            for filepath in self.output_folder.glob('*.png'):
-                stat = filepath.stat()
-                images.append({
-                    "filename": filepath.name,
-                    "size": stat.st_size,
-                    "created": stat.st_ctime,
-                    "url": f"/api/v1/images/download/{filepath.name}"
-                })
-            
-            return sorted(images, key=lambda x: x['created'], reverse=True)
+            return self.index.query(
+                limit or Config.IMAGE_LIST_PAGE_SIZE,
+                cursor=cursor, since=since, until=until, seed=seed, prompt=prompt
+            )
             
         except Exception as e:
             logger.error(f"Failed to list images: {e}")
             raise
     
+    def reindex(self) -> Dict[str, int]:
+        """Rebuild the image index from the files on disk"""
+        # Images still queued for writing are indexed before they reach the disk;
+        # pending is checked first because it is cleared only once the file exists
+        return self.index.rebuild(
+            keep=lambda name: self.store.pending(name) is not None or self.store.resolve(name) is not None
+        )
+    
     def delete_image(self, filename: str) -> bool:
         """Delete image file"""
         try:
-            filepath = self.output_folder / filename
-            if filepath.exists():
-                filepath.unlink()
-                logger.info(f"Image deleted: {filepath}")
+            if self.store.delete(filename):
+                self.index.remove(filename)
+                logger.info(f"Image deleted: {filename}")
                 return True
             return False
             
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Callable
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = '.image_index.sqlite3'
+IMAGE_SUFFIXES = ('.png',)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    prompt TEXT,
+    seed INTEGER,
+    template TEXT,
+    duration REAL,
+    metadata TEXT,
+    last_access REAL
+);
+CREATE INDEX IF NOT EXISTS images_created ON images (created DESC, filename DESC);
+CREATE INDEX IF NOT EXISTS images_seed ON images (seed);
+"""
+
+# Indexes on columns added after the first release of the schema
+LATE_COLUMNS = {
+    'last_access': "CREATE INDEX IF NOT EXISTS images_last_access ON images (last_access, filename)",
+}
+
+class ImageIndex:
+    """SQLite catalogue of the images in an output folder.
+
+    Kept up to date by FileUtils as images are saved and deleted, so listing
+    never has to scan the folder. Listing is keyset-paginated newest first.
+    """
+
+    _instances: Dict[str, 'ImageIndex'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / INDEX_FILENAME
+        self._local = threading.local()
+        # sqlite allows one writer at a time; serialize ours instead of retrying
+        self._write_lock = threading.Lock()
+        # Access times are buffered here and written in batches by flush_access
+        self._accessed: Dict[str, float] = {}
+        self._accessed_lock = threading.Lock()
+        created = not self.path.exists()
+        with self._write_lock:
+            self._migrate()
+        if created:
+            self.rebuild()
+
+    @classmethod
+    def for_folder(cls, folder: Path) -> 'ImageIndex':
+        """Return the shared index for an output folder, creating it on first use"""
+        key = str(Path(folder).resolve())
+        with cls._instances_lock:
+            index = cls._instances.get(key)
+            if index is None:
+                index = cls(folder)
+                cls._instances[key] = index
+            return index
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _migrate(self):
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = {row['name'] for row in connection.execute("PRAGMA table_info(images)")}
+        for column, index_sql in LATE_COLUMNS.items():
+            if column not in columns:
+                connection.execute(f"ALTER TABLE images ADD COLUMN {column} REAL")
+            connection.execute(index_sql)
+        connection.execute("UPDATE images SET last_access = created WHERE last_access IS NULL")
+
+    def add(self, filename: str, size: int, created: float = None, metadata: Dict[str, Any] = None):
+        """Record a saved image, replacing any previous entry of the same name"""
+        metadata = metadata or {}
+        created = created or time.time()
+        with self._write_lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO images "
+                "(filename, size, created, prompt, seed, template, duration, metadata, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    size,
+                    created,
+                    metadata.get('positive_prompt'),
+                    metadata.get('seed') if isinstance(metadata.get('seed'), int) else None,
+                    metadata.get('template'),
+                    metadata.get('duration'),
+                    json.dumps(metadata) if metadata else None,
+                    created
+                )
+            )
+
+    def remove(self, filename: str):
+        with self._accessed_lock:
+            self._accessed.pop(filename, None)
+        with self._write_lock:
+            self._connection().execute("DELETE FROM images WHERE filename = ?", (filename,))
+
+    def touch(self, filename: str):
+        """Note that an image was read; cheap enough for the download path"""
+        with self._accessed_lock:
+            self._accessed[filename] = time.time()
+
+    def flush_access(self) -> int:
+        """Write buffered access times in one transaction"""
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return 0
+        with self._write_lock:
+            connection = self._connection()
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    "UPDATE images SET last_access = MAX(last_access, ?) WHERE filename = ?",
+                    [(at, filename) for filename, at in accessed.items()]
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(accessed)
+
+    def totals(self) -> Tuple[int, int]:
+        """Number of indexed images and their total size in bytes"""
+        count, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+        return count, size
+
+    def iter_least_recently_used(self, page_size: int = 500) -> Iterator[Tuple[str, int, float]]:
+        """Yield (filename, size, last_access) from the least recently used image on"""
+        last = None
+        while True:
+            if last is None:
+                rows = self._connection().execute(
+                    "SELECT filename, size, last_access FROM images "
+                    "ORDER BY last_access, filename LIMIT ?", (page_size,)
+                ).fetchall()
+            else:
+                rows = self._connection().execute(
+                    "SELECT filename, size, last_access FROM images "
+                    "WHERE last_access > ? OR (last_access = ? AND filename > ?) "
+                    "ORDER BY last_access, filename LIMIT ?", (last[0], last[0], last[1], page_size)
+                ).fetchall()
+            for row in rows:
+                yield row['filename'], row['size'], row['last_access']
+            if len(rows) < page_size:
+                return
+            last = (rows[-1]['last_access'], rows[-1]['filename'])
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM images WHERE filename = ?", (filename,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def query(self, limit: int, cursor: str = None, since: float = None, until: float = None,
+              seed: int = None, prompt: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of images, newest first, and the cursor of the next page"""
+        clauses, args = [], []
+        if cursor:
+            created, filename = self._decode_cursor(cursor)
+            clauses.append("(created < ? OR (created = ? AND filename < ?))")
+            args += [created, created, filename]
+        if since is not None:
+            clauses.append("created >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            args.append(until)
+        if seed is not None:
+            clauses.append("seed = ?")
+            args.append(seed)
+        if prompt:
+            escaped = prompt.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("prompt LIKE ? ESCAPE '\\'")
+            args.append(f"%{escaped}%")
+
+        sql = "SELECT * FROM images"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created DESC, filename DESC LIMIT ?"
+        # One extra row tells us whether another page exists
+        rows = self._connection().execute(sql, args + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1]['created'], rows[-1]['filename'])
+        return [self._to_dict(row) for row in rows], next_cursor
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def rebuild(self, keep: Callable[[str], bool] = None) -> Dict[str, int]:
+        """Reconcile the index with the folder, keeping metadata of known files.
+
+        keep is asked about indexed files the scan did not find, such as
+        images still being written; those it vouches for stay indexed.
+        """
+        on_disk = {}
+        for root, dirs, files in os.walk(self.folder):
+            # Hidden directories hold caches, not outputs
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                if name.endswith(IMAGE_SUFFIXES) and not name.startswith('.'):
+                    stat = os.stat(os.path.join(root, name))
+                    on_disk[name] = (stat.st_size, stat.st_mtime)
+
+        with self._write_lock:
+            connection = self._connection()
+            indexed = {row[0] for row in connection.execute("SELECT filename FROM images")}
+            stale = indexed - set(on_disk)
+            if keep is not None:
+                stale = {name for name in stale if not keep(name)}
+            missing = set(on_disk) - indexed
+            connection.execute("BEGIN")
+            try:
+                connection.executemany("DELETE FROM images WHERE filename = ?", [(name,) for name in stale])
+                connection.executemany(
+                    "INSERT INTO images (filename, size, created, last_access) VALUES (?, ?, ?, ?)",
+                    [(name, *on_disk[name], on_disk[name][1]) for name in missing]
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+        logger.info(f"Rebuilt image index for {self.folder}: {len(missing)} added, {len(stale)} removed")
+        return {"added": len(missing), "removed": len(stale), "total": len(on_disk)}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "filename": row['filename'],
+            "size": row['size'],
+            "created": row['created'],
+            "metadata": json.loads(row['metadata']) if row['metadata'] else None,
+            "url": f"/api/v1/images/download/{row['filename']}"
+        }
+
+    @staticmethod
+    def _encode_cursor(created: float, filename: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([created, filename]).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[float, str]:
+        try:
+            created, filename = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return float(created), str(filename)
+        except Exception:
+            raise ValueError("Invalid cursor")
@@ -0,0 +1,150 @@
+import os
+import re
+import uuid
+import hashlib
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from config.config import Config
+from services.metrics import BYTES_TRANSFERRED, stage
+
+logger = logging.getLogger(__name__)
+
+# <sha256>.<ext> names are stored under two levels of hash-prefix shards
+HASHED_NAME = re.compile(r'^([0-9a-f]{64})\.[a-z0-9]+$')
+
+class ImageStore:
+    """Content-addressed image storage in a sharded folder tree.
+
+    Images are named by the SHA-256 of their bytes, so identical outputs are
+    stored once and concurrent requests can never overwrite each other.
+    Files are written by a background pool through a temporary file and an
+    atomic rename; until then they are served from memory.
+    """
+
+    _instances: Dict[str, 'ImageStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, folder: Path, max_workers: int = None):
+        self.folder = Path(folder)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.OUTPUT_WRITE_WORKERS,
+            thread_name_prefix='image-writer'
+        )
+        self._pending: Dict[str, bytes] = {}
+        self._writes: Dict[str, Future] = {}
+        # Flat files saved before sharding; looked up once and remembered
+        self._legacy_paths: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_folder(cls, folder: Path) -> 'ImageStore':
+        """Return the shared store for an output folder, creating it on first use"""
+        key = str(Path(folder).resolve())
+        with cls._instances_lock:
+            store = cls._instances.get(key)
+            if store is None:
+                store = cls(folder)
+                cls._instances[key] = store
+            return store
+
+    def put(self, image_data: bytes, extension: str = 'png') -> Tuple[str, Path, Future]:
+        """Queue image bytes for storage and return their name, path and write future"""
+        filename = f"{hashlib.sha256(image_data).hexdigest()}.{extension}"
+        path = self.path_for(filename)
+        with self._lock:
+            write = self._writes.get(filename)
+            if write is None:
+                write = Future()
+                if path.exists():
+                    # Identical bytes are already stored
+                    write.set_result(path)
+                else:
+                    self._pending[filename] = image_data
+                    self._writes[filename] = write
+                    self.executor.submit(self._write, filename, path, image_data, write)
+        return filename, path, write
+
+    def path_for(self, filename: str) -> Path:
+        match = HASHED_NAME.match(filename)
+        if not match:
+            return self.folder / filename
+        digest = match.group(1)
+        return self.folder / digest[:2] / digest[2:4] / filename
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        """Locate a stored image by name, including pre-sharding flat files"""
+        if '/' in filename or '\\' in filename or filename.startswith('.'):
+            return None
+        if HASHED_NAME.match(filename):
+            path = self.path_for(filename)
+            return path if path.exists() else None
+
+        with self._lock:
+            path = self._legacy_paths.get(filename)
+        if path is None:
+            path = self.folder / filename
+            if not path.is_file():
+                return None
+            with self._lock:
+                self._legacy_paths[filename] = path
+        return path
+
+    def version(self, filename: str, path: Optional[Path] = None) -> str:
+        """Validator that changes whenever the image's bytes can have changed"""
+        match = HASHED_NAME.match(filename)
+        if match:
+            return match.group(1)
+        stat = (path or self.folder / filename).stat()
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def pending(self, filename: str) -> Optional[bytes]:
+        """Bytes of an image whose write has not finished yet"""
+        with self._lock:
+            return self._pending.get(filename)
+
+    def delete(self, filename: str) -> bool:
+        path = self.resolve(filename)
+        with self._lock:
+            self._legacy_paths.pop(filename, None)
+        if path is None:
+            return False
+        path.unlink()
+        return True
+
+    def flush(self, timeout: float = None):
+        """Wait for every queued write to finish"""
+        with self._lock:
+            writes = list(self._writes.values())
+        for write in writes:
+            try:
+                write.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def _write(self, filename: str, path: Path, image_data: bytes, write: Future):
+        tmp_path = path.with_name(f".{filename}.{uuid.uuid4().hex}.tmp")
+        try:
+            with stage('disk_write'):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, 'wb') as f:
+                    f.write(image_data)
+                    if Config.OUTPUT_FSYNC:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            BYTES_TRANSFERRED.inc(len(image_data), 'disk_write')
+            write.set_result(path)
+        except Exception as e:
+            logger.error(f"Failed to write image {path}: {e}")
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+            write.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(filename, None)
+                self._writes.pop(filename, None)
@@ -0,0 +1,31 @@
+import math
+from typing import Dict, Any, Tuple
+from flask import request
+from services.errors import ComfyUIError
+
+def client_identity() -> str:
+    """Key a caller by API key when one is sent, otherwise by remote address"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{request.remote_addr}"
+
+def backend_error_response(error: ComfyUIError) -> Tuple[Dict[str, Any], int, Dict[str, str]]:
+    """(body, status, headers) for a failed ComfyUI call"""
+    body = {"error": str(error), "retryable": error.retryable}
+    headers = {}
+    if error.retry_after:
+        body["retry_after"] = error.retry_after
+        headers["Retry-After"] = str(error.retry_after)
+    return body, error.status, headers
+
+def positive_number(data: Dict[str, Any], name: str, default: Any = None, integer: bool = False) -> Any:
+    """data[name] if it is a positive number, default if it is absent; ValueError otherwise"""
+    value = data.get(name)
+    if value is None:
+        return default
+    kinds = int if integer else (int, float)
+    # bool is an int subclass, and Python's JSON parser accepts NaN and Infinity
+    if isinstance(value, bool) or not isinstance(value, kinds) or not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{name} must be a positive {'integer' if integer else 'number'}")
+    return value
@@ -0,0 +1,132 @@
+import os
+import re
+import uuid
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Uploaded inputs are named <sha256>.<ext> after their bytes
+UPLOAD_NAME = re.compile(r'^[0-9a-f]{64}\.(png|jpg|webp|gif)$')
+
+# Leading bytes of the image formats ComfyUI's LoadImage accepts
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+def sniff_extension(header: bytes) -> Optional[str]:
+    """File extension for an image's leading bytes, or None if not an image"""
+    for magic, extension in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+class UploadTooLarge(Exception):
+    """Upload exceeded the size limit"""
+
+class HashingWriter:
+    """Temporary upload file that hashes bytes as they are written"""
+
+    def __init__(self, folder: Path, max_bytes: int):
+        self.path = folder / f".upload.{uuid.uuid4().hex}.tmp"
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.header = b''
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, 'wb')
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        if len(self.header) < 16:
+            self.header += data[:16 - len(self.header)]
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        # Werkzeug rewinds finished parts; the bytes are already hashed
+        return self._file.seek(*args)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+class UploadStore:
+    """Content-addressed store for input images sent for img2img and inpainting.
+
+    Uploads are streamed to a temporary file and hashed on the way in, then
+    renamed to <sha256>.<ext>; sending the same image again keeps the copy
+    already stored.
+    """
+
+    _instances: Dict[str, 'UploadStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, folder: Path, max_bytes: int = None):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or Config.MAX_CONTENT_LENGTH
+
+    @classmethod
+    def for_folder(cls, folder: Path) -> 'UploadStore':
+        """Return the shared store for an upload folder, creating it on first use"""
+        key = str(Path(folder).resolve())
+        with cls._instances_lock:
+            store = cls._instances.get(key)
+            if store is None:
+                store = cls(folder)
+                cls._instances[key] = store
+            return store
+
+    def open_writer(self) -> HashingWriter:
+        return HashingWriter(self.folder, self.max_bytes)
+
+    def commit(self, writer: HashingWriter) -> Tuple[str, int, bool]:
+        """Store a finished upload; returns (filename, size, already_stored)"""
+        writer.close()
+        extension = sniff_extension(writer.header)
+        if extension is None:
+            writer.discard()
+            raise ValueError("Upload is not a PNG, JPEG, WebP or GIF image")
+
+        filename = f"{writer.digest}.{extension}"
+        path = self.folder / filename
+        if path.exists():
+            writer.discard()
+            return filename, writer.size, True
+        os.replace(writer.path, path)
+        logger.info(f"Stored input image {filename} ({writer.size} bytes)")
+        return filename, writer.size, False
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        """Path of an uploaded image, or None if it is not stored"""
+        if not isinstance(filename, str) or not UPLOAD_NAME.match(filename):
+            return None
+        path = self.folder / filename
+        return path if path.exists() else None
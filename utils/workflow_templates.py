@@ -0,0 +1,174 @@
+import json
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Optional
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# (node_id, input_name) pairs a request parameter is written to
+Binding = List[Tuple[str, str]]
+
+# Sampler inputs exposed as request parameters
+SAMPLER_CLASSES = ('KSampler', 'KSamplerAdvanced')
+SAMPLER_PARAMS = {
+    'seed': 'seed',
+    'noise_seed': 'seed',
+    'steps': 'steps',
+    'cfg': 'cfg_scale',
+    'sampler_name': 'sampler_name',
+    'scheduler': 'scheduler',
+    'denoise': 'denoise',
+}
+# Loader nodes whose image is chosen by an uploaded input image's name
+IMAGE_INPUT_PARAMS = {
+    'LoadImage': 'input_image',
+    'LoadImageMask': 'mask_image',
+}
+LATENT_PARAMS = {
+    'width': 'width',
+    'height': 'height',
+    'batch_size': 'batch_size',
+}
+
+def compile_bindings(workflow: Dict[str, Any]) -> Dict[str, Binding]:
+    """Map request parameter names to the node inputs they control.
+
+    Nodes are found by class_type rather than by id, and prompt encoders are
+    resolved by following the sampler's positive/negative links.
+    """
+    bindings: Dict[str, Binding] = {}
+
+    def bind(param: str, node_id: str, input_name: str):
+        bindings.setdefault(param, []).append((node_id, input_name))
+
+    for node_id, node in workflow.items():
+        class_type = node.get('class_type')
+        inputs = node.get('inputs', {})
+
+        if class_type in SAMPLER_CLASSES:
+            for input_name, param in SAMPLER_PARAMS.items():
+                if input_name in inputs:
+                    bind(param, node_id, input_name)
+            for link_input, param in (('positive', 'positive_prompt'), ('negative', 'negative_prompt')):
+                link = inputs.get(link_input)
+                if isinstance(link, list) and link:
+                    encoder = workflow.get(str(link[0]), {})
+                    if encoder.get('class_type') == 'CLIPTextEncode':
+                        bind(param, str(link[0]), 'text')
+
+        elif class_type == 'EmptyLatentImage':
+            for input_name, param in LATENT_PARAMS.items():
+                if input_name in inputs:
+                    bind(param, node_id, input_name)
+
+        elif class_type == 'CheckpointLoaderSimple':
+            bind('model_name', node_id, 'ckpt_name')
+
+        elif class_type in IMAGE_INPUT_PARAMS:
+            bind(IMAGE_INPUT_PARAMS[class_type], node_id, 'image')
+
+    return bindings
+
+def copy_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy nodes and their inputs; link lists and _meta stay shared"""
+    return {
+        node_id: {**node, 'inputs': dict(node.get('inputs', {}))}
+        for node_id, node in workflow.items()
+    }
+
+def apply_bindings(workflow: Dict[str, Any], bindings: Dict[str, Binding], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Write parameter values into their bound node inputs in place"""
+    for param, value in params.items():
+        if value is None or param not in bindings:
+            continue
+        if param == 'model_name' and value == 'default':
+            continue
+        for node_id, input_name in bindings[param]:
+            workflow[node_id]['inputs'][input_name] = value
+    return workflow
+
+class WorkflowTemplate:
+    """A parsed workflow file with precompiled parameter bindings"""
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self.mtime = path.stat().st_mtime
+        with open(path, 'r', encoding='utf-8') as f:
+            self.workflow = json.load(f)
+        self.bindings = compile_bindings(self.workflow)
+
+    def instantiate(self, **params) -> Dict[str, Any]:
+        """Return a private copy of the workflow with parameters applied"""
+        return apply_bindings(copy_workflow(self.workflow), self.bindings, params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parameters": sorted(self.bindings)
+        }
+
+class WorkflowTemplateRegistry:
+    """Loads every workflow in the templates folder once and reloads on change"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, folder: str = None):
+        self.folder = Path(folder or Config.WORKFLOW_TEMPLATES_FOLDER)
+        self._templates: Dict[str, WorkflowTemplate] = {}
+        self._lock = threading.Lock()
+        for path in sorted(self.folder.glob('*.json')):
+            self._load(path.stem, path)
+
+    @classmethod
+    def shared(cls) -> 'WorkflowTemplateRegistry':
+        """Return the process-wide template registry"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self, name: str) -> WorkflowTemplate:
+        """Return a template by name, reloading it if its file changed"""
+        path = self.folder / f"{name}.json"
+        if path.parent != self.folder:
+            raise KeyError(name)
+
+        template = self._templates.get(name)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            with self._lock:
+                self._templates.pop(name, None)
+            raise KeyError(name)
+
+        if template is None or template.mtime != mtime:
+            # Keep serving the previous version if the new file does not parse
+            template = self._load(name, path) or template
+            if template is None:
+                raise KeyError(name)
+        return template
+
+    def list(self) -> List[WorkflowTemplate]:
+        """All templates currently in the folder"""
+        templates = []
+        for path in sorted(self.folder.glob('*.json')):
+            try:
+                templates.append(self.get(path.stem))
+            except KeyError:
+                continue
+        return templates
+
+    def _load(self, name: str, path: Path) -> Optional[WorkflowTemplate]:
+        try:
+            template = WorkflowTemplate(name, path)
+        except Exception as e:
+            logger.error(f"Failed to load workflow template {path}: {e}")
+            return None
+        with self._lock:
+            self._templates[name] = template
+        logger.info(f"Loaded workflow template '{name}' from {path}")
+        return template
@@ -1,49 +1,72 @@
 import json
+import hashlib
+import itertools
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from config.config import Config
+from utils.workflow_templates import WorkflowTemplateRegistry, compile_bindings, apply_bindings
 
 logger = logging.getLogger(__name__)
 
+# Input names ComfyUI sampler nodes use for their noise seed
+SEED_INPUTS = ('seed', 'noise_seed')
+
 class WorkflowUtils:
     def __init__(self):
         self.default_workflow_path = Path(Config.DEFAULT_WORKFLOW_PATH)
+        self.templates = WorkflowTemplateRegistry.shared()
+    
+    @property
+    def default_template_name(self) -> str:
+        return self.default_workflow_path.stem
     
     def load_default_workflow(self) -> Dict[str, Any]:
         """Load default workflow from JSON file"""
+        return self.load_workflow(self.default_template_name)
+    
+    def load_workflow(self, template_name: str) -> Dict[str, Any]:
+        """Get a private copy of a registered workflow template"""
         try:
-            if not self.default_workflow_path.exists():
-                raise FileNotFoundError(f"Default workflow not found: {self.default_workflow_path}")
-            
-            with open(self.default_workflow_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-                
-        except Exception as e:
-            logger.error(f"Failed to load default workflow: {e}")
-            raise
+            return self.templates.get(template_name).instantiate()
+        except KeyError:
+            raise FileNotFoundError(f"Workflow template not found: {template_name}")
+    
+    def build_workflow(self, template_name: Optional[str] = None, **params) -> Dict[str, Any]:
+        """Instantiate a template with request parameters bound to its nodes"""
+        name = template_name or self.default_template_name
+        try:
+            return self.templates.get(name).instantiate(**params)
+        except KeyError:
+            raise FileNotFoundError(f"Workflow template not found: {name}")
+    
+    def expand_parameter_sweep(self, base_params: Dict[str, Any], prompts: Optional[List[str]] = None,
+                               seeds: Optional[List[int]] = None,
+                               grid: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
+        """Expand prompt, seed and grid axes into one parameter set per variant"""
+        axes = [('positive_prompt', prompts), ('seed', seeds)]
+        axes += [(name, values) for name, values in (grid or {}).items()]
+        axes = [(name, values) for name, values in axes if values]
+        
+        variants = []
+        for combination in itertools.product(*(values for _, values in axes)):
+            params = dict(base_params)
+            params.update(zip((name for name, _ in axes), combination))
+            variants.append(params)
+        return variants
+    
+    @staticmethod
+    def sweep_size(prompts: Optional[List[str]], seed_count: int, grid: Optional[Dict[str, List[Any]]]) -> int:
+        """Number of variants expand_parameter_sweep would produce, without building them"""
+        size = (len(prompts) if prompts else 1) * max(seed_count, 1)
+        for values in (grid or {}).values():
+            size *= len(values) or 1
+        return size
     
     def update_workflow_params(self, workflow: Dict[str, Any], **params) -> Dict[str, Any]:
         """Update workflow parameters"""
         try:
-            # This is based on your original workflow structure
-            # Adjust node IDs and parameter paths according to your actual workflow
-            
-            if 'positive_prompt' in params and '74' in workflow:
-                workflow['74']['inputs']['text'] = params['positive_prompt']
-            
-            if 'negative_prompt' in params and '75' in workflow:
-                workflow['75']['inputs']['text'] = params['negative_prompt']
-            
-            if 'seed' in params and '72' in workflow:
-                workflow['72']['inputs']['seed'] = params['seed']
-            
-            # Add more parameter mappings as needed
-            # Example for other common parameters:
-            # if 'steps' in params and 'sampler_node_id' in workflow:
-            #     workflow['sampler_node_id']['inputs']['steps'] = params['steps']
-            
-            return workflow
+            return apply_bindings(workflow, compile_bindings(workflow), params)
             
         except Exception as e:
             logger.error(f"Failed to update workflow parameters: {e}")
@@ -72,4 +95,27 @@ class WorkflowUtils:
             
         except Exception as e:
             logger.error(f"Workflow validation error: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    @staticmethod
+    def workflow_hash(workflow: Dict[str, Any]) -> str:
+        """Canonical hash of a workflow, ignoring node ordering and _meta"""
+        canonical = {
+            node_id: {key: value for key, value in node.items() if key != '_meta'}
+            for node_id, node in workflow.items()
+        }
+        payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def has_fixed_seed(workflow: Dict[str, Any]) -> bool:
+        """Whether every seed in the workflow is pinned (not -1/random)"""
+        for node in workflow.values():
+            inputs = node.get('inputs', {}) if isinstance(node, dict) else {}
+            for name in SEED_INPUTS:
+                if name not in inputs:
+                    continue
+                seed = inputs[name]
+                if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+                    return False
+        return True
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import sys
+import urllib.parse
+import logging
+from concurrent.futures import Executor
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Set by aiohttp or meaningless once the body has been read
+SKIPPED_HEADERS = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'TRANSFER_ENCODING')
+
+class WSGIBridge:
+    """Serves a WSGI application from aiohttp on a thread pool.
+
+    The app is called and its response iterated on the executor, one chunk
+    at a time, so streamed responses (NDJSON, server-sent events) reach the
+    client as they are produced.
+    """
+
+    def __init__(self, wsgi_app: Callable, executor: Executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, request: web.Request, body: Optional[bytes] = None) -> web.StreamResponse:
+        if body is None:
+            body = await request.read()
+        loop = asyncio.get_running_loop()
+        started: Dict[str, Any] = {}
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+            return lambda data: started.setdefault('written', []).append(data)
+
+        def next_chunk(iterator):
+            return next(iterator, None)
+
+        result = await loop.run_in_executor(self.executor, self.wsgi_app, self.environ(request, body), start_response)
+        try:
+            iterator = iter(result)
+            chunk = await loop.run_in_executor(self.executor, next_chunk, iterator)
+            response = web.StreamResponse(status=started['status'])
+            for name, value in started['headers']:
+                response.headers.add(name, value)
+            await response.prepare(request)
+            for data in started.get('written', []):
+                await response.write(data)
+            while chunk is not None:
+                if chunk:
+                    await response.write(chunk)
+                chunk = await loop.run_in_executor(self.executor, next_chunk, iterator)
+            await response.write_eof()
+            return response
+        finally:
+            # Runs the app's cleanup, e.g. when the client went away mid-stream
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+    @staticmethod
+    def environ(request: web.Request, body: bytes) -> Dict[str, Any]:
+        """WSGI environ for an aiohttp request whose body has been read"""
+        path = request.raw_path.split('?', 1)[0]
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            # WSGI carries the raw path bytes as latin-1
+            'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': request.url.host or 'localhost',
+            'SERVER_PORT': str(request.url.port or 80),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key in SKIPPED_HEADERS:
+                continue
+            key = 'HTTP_' + key
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ